@@ -1,1856 +1,639 @@
-import pandas as pd
-import duckdb
-import numpy as np
-import re
-
-#generate duckdb connection
-con = duckdb.connect('fin_maternal.db')
-
-# Read .dta files and create tables (with convert_categoricals=False to handle duplicate labels)
-# Table 1: fktp1
-df_fktp = pd.read_stata('FKTP_2023.dta', convert_categoricals=False)
-con.register('fktp_temp', df_fktp)
-con.sql("""
-CREATE TABLE fktp1 AS
-SELECT PSTV01, FKP02, FKP03, FKP04, FKP05, FKP13, FKP14A
-FROM fktp_temp;
-""")
-
-# Table 2: fkrtl1
-df_fkrtl = pd.read_stata('FKRTL_2023.dta', convert_categoricals=False)
-con.register('fkrtl_temp', df_fkrtl)
-con.sql("""
-CREATE TABLE fkrtl1 AS
-SELECT PSTV01, FKP02, FKL02, FKL03, FKL04, FKL05, FKL09, FKL11, FKL14, FKL15A, FKL17A
-FROM fkrtl_temp;
-""")
-
-# Table 3: sek1
-df_sek = pd.read_stata('FKRTL_Sekunder_2023.dta', convert_categoricals=False)
-con.register('sek_temp', df_sek)
-con.sql("""
-CREATE TABLE sek1 AS
-SELECT FKL02, FKL24A
-FROM sek_temp;
-""")
-
-# Table 4: peserta1
-df_peserta = pd.read_stata('Kepesertaan_2023.dta', convert_categoricals=False)
-con.register('peserta_temp', df_peserta)
-con.sql("""
-CREATE TABLE peserta1 AS
-SELECT PSTV01, PSTV03, PSTV08, PSTV18
-FROM peserta_temp;
-""")
-
-# Clean up temporary registrations (optional)
-con.unregister('fktp_temp')
-con.unregister('fkrtl_temp')
-con.unregister('sek_temp')
-con.unregister('peserta_temp')
-
-#merge all visits
-# This step merge Hospital visits with secondary diagnosis table
-con.sql("""CREATE TABLE rs AS
-SELECT p.*, s.FKL24A
-FROM fkrtl1 AS p
-LEFT JOIN sek1  AS s
-USING (FKL02);
-""")
-
-# This step combines the rs table with the fktp1 table 
-con.sql("""
-CREATE TABLE klin AS
-SELECT
-  COALESCE(CAST(f.PSTV01 AS VARCHAR), CAST(p.PSTV01 AS VARCHAR)) AS PSTV01,
-  COALESCE(CAST(f.FKP02  AS VARCHAR), CAST(p.FKP02  AS VARCHAR)) AS FKP02,
-  f.* EXCLUDE (FKP02),
-  p.* EXCLUDE (FKP02)
-FROM rs AS f
-FULL OUTER JOIN fktp1 AS p
-ON CAST(f.PSTV01 AS VARCHAR) = CAST(p.PSTV01 AS VARCHAR) AND CAST(f.FKP02 AS VARCHAR) = CAST(p.FKP02 AS VARCHAR);
-""")
-
-# This step combines the total visits with the membership table  
-con.sql("""
-CREATE TABLE kia AS
-SELECT
-  k.*,
-  m.PSTV03,
-  m.PSTV08,
-  m.PSTV18
-FROM klin AS k
-LEFT JOIN peserta1 AS m
-USING (PSTV01);
-""")
-
-con.sql("PRAGMA table_info(kia)").df()
-
-# Remove column duplicates
-con.sql('ALTER TABLE kia DROP COLUMN "pstv01_1"')
-con.sql('ALTER TABLE kia DROP COLUMN "pstv01_2"')
-con.sql('ALTER TABLE kia DROP COLUMN "fkl02"') # This column is no longer needed as it is only used for merging purposes
-con.sql('ALTER TABLE kia DROP COLUMN "fkp02"')
-
-# Generate Characteristics
-## Age
-con.sql("alter table kia add column age int")
-# Generate Age
-con.sql("""
-UPDATE kia 
-SET age = CASE 
-    WHEN fkl03 IS NOT NULL THEN EXTRACT(YEAR FROM fkl03) - EXTRACT(YEAR FROM pstv03)
-    WHEN fkp03 IS NOT NULL THEN EXTRACT(YEAR FROM fkp03) - EXTRACT(YEAR FROM pstv03)
-          END;
-""")
-
-# Age Group Categorization
-con.sql("ALTER TABLE kia ADD COLUMN age_risk INT")
-con.sql("""
-UPDATE kia
-SET age_risk =
-  CASE
-    WHEN age IS NULL THEN NULL        
-    WHEN age < 20 OR age > 35 THEN 1  
-    ELSE 0                            
-  END;
-""")
-
-# Region of Residence
-con.sql("ALTER TABLE kia ADD COLUMN dom INT")
-con.sql("""
-UPDATE kia
-SET dom =
-  CASE
-    WHEN COALESCE(fkl05, fkp05) IN 
-         (31, 32, 33, 34, 35, 36, 51)
-      THEN 0
-    WHEN fkl05 IS NULL AND fkp05 IS NULL
-      THEN NULL
-    ELSE 1
-  END;
-""")
-
-# Subsidy Membership Status
-con.sql("alter table kia add column subsid int")
-con.sql("""
-UPDATE kia
-SET subsid =
-  CASE
-    WHEN (pstv08) IN (2,3) THEN 1
-    WHEN pstv08 IS NULL THEN NULL  
-    ELSE 0
-  END;
-""")
-
-# Drop unneeded columns
-con.sql('ALTER TABLE kia DROP COLUMN "pstv03"')
-con.sql('ALTER TABLE kia DROP COLUMN "fkl05"')
-con.sql('ALTER TABLE kia DROP COLUMN "fkp05"')
-con.sql('ALTER TABLE kia DROP COLUMN "pstv08"')
-
-# Moving to python since complex date functions works better on pandas
-df = con.sql("select * from kia").df()
-
-# 1) Ensure the date columns are valid
-for c in ['FKP03','FKL03']:
-    df[c] = pd.to_datetime(df[c], errors='coerce')
-
-# 2) combined_date = min(FKP03, FKL03)
-df['combined_date'] = df[['FKP03','FKL03']].min(axis=1)
-
-# 3) Keep the abortus/partus mask as a Series (not a DataFrame)
-abort_codes  = ['O00','O01','O02','O03','O04','O05','O06','O07']
-partus_codes = ['O80','O81','O82','O83','O84']
-
-abortus_mask = df[['FKP14A','FKL15A','FKL17A','FKL24A']].isin(abort_codes).any(axis=1)
-partus_mask  = df[['FKP14A','FKL15A','FKL17A','FKL24A']].isin(partus_codes).any(axis=1)
-
-# 4) doa / dol / dopt
-df['doa'] = df['combined_date'].where(abortus_mask)
-df['dol'] = df['combined_date'].where(partus_mask)
-df['dopt'] = df['doa'].fillna(df['dol'])
-
-# 5) Episode anchor (180 days)
-df = df.sort_values(['PSTV01','dopt'])
-prev = df.groupby('PSTV01', dropna=False)['dopt'].shift()
-gap  = (df['dopt'] - prev).dt.days
-is_anchor = df['dopt'].notna() & (prev.isna() | (gap >= 180))
-df['fin_g'] = df['dopt'].where(is_anchor)
-
-# 6) ref_start (use .loc on both sides so the index stays aligned)
-mask_anchor = df['fin_g'].notna()
-df['ref_start'] = pd.NaT  # init
-
-idx_abort = (mask_anchor & abortus_mask)
-idx_part  = (mask_anchor & partus_mask)
-
-df.loc[idx_abort, 'ref_start'] = df.loc[idx_abort, 'fin_g'] - pd.to_timedelta(140, unit='D')
-df.loc[idx_part,  'ref_start'] = df.loc[idx_part,  'fin_g'] - pd.to_timedelta(280, unit='D')
-
-# Drop unneeded colums
-df = df.drop(columns=['doa', 'dol', 'dopt'])
-
-print(df.head(20))
-
-df[['PSTV01', 'combined_date', 'ref_start', 'fin_g']].sample(n=20, random_state=42)
-
-print(df['n_preg'].value_counts(dropna=False).sort_index())
-
-print(df.columns)
-
-df.to_csv("pregnancy by visit.csv",index=False)
-
-# Pregnancy level
-
-# Load the visit-level data
-primi = pd.read_csv("pregnancy by visit.csv")
-
-# or if you want to continue from the previous dataframe without saving/loading
-# primi = df.copy()
-
-# 1st Pregnancy
-# Cohort filtering: only patients who had n_preg = 1
-valid_pstv01 = primi.loc[primi['n_preg'] == 1, 'PSTV01'].unique()
-primi = primi[primi['PSTV01'].isin(valid_pstv01)].reset_index(drop=True)
-
-# Generate pregnancy termination date 'ref' 
-ref_map = (
-    primi.loc[(primi['n_preg'] == 1) & (primi['fin_g'].notna()), ['PSTV01', 'fin_g']]
-      .sort_values(['PSTV01', 'fin_g'])          # prioritaskan tanggal awal
-      .drop_duplicates('PSTV01', keep='first')   # pastikan 1 nilai per PSTV01
-      .set_index('PSTV01')['fin_g']              # jadi Series siap untuk map()
-)
-primi['ref'] = primi['PSTV01'].map(ref_map)
-
-#Generate pregnancy start date 'ref_start'
-ref_start_map = (
-    primi.loc[(primi['n_preg'] == 1) & (primi['ref_start'].notna()), ['PSTV01', 'ref_start']]
-         .sort_values(['PSTV01', 'ref_start'])
-         .drop_duplicates('PSTV01', keep='first')
-         .set_index('PSTV01')['ref_start']
-)
-primi['ref_start'] = primi['PSTV01'].map(ref_start_map)
-
-
-# Ensure 'combined_date' and 'ref' are datetime
-primi['combined_date'] = pd.to_datetime(primi['combined_date'], errors='coerce')
-primi['ref'] = pd.to_datetime(primi['ref'], errors='coerce')
-primi['ref_start'] = pd.to_datetime(primi['ref_start'], errors='coerce')
-
-# COMPLETE OPTIMIZATION: Before & After Conditions
-import re
-
-# All condition dictionaries
-chronic_conditions = { 
-    'dm': ['E10','E11','E12','E13','E14','O24'],
-    'malnut': ['E40','E41','E42','E43','E44','E45','E46'],
-    'nutri': ['E50','E51','E52','E53','E54','E55','E56','E57','E58','E59','E60','E61','E62','E63','E64'],
-    'obese': ['E66'],
-    'substance': ['F10','F11','F12','F13','F14','F15','F16','F17','F18','F19'],
-    'schizo': ['F20','F21','F22','F23','F24','F25','F28','F29'],
-    'neurot': ['F40','F41','F42','F43','F44','F48','F45'],
-    'neu_deg': ['G10','G11','G12','G20','G21','G22','G23','G24','G25','G26','G30','G31','G32','G35','G36','G37'],
-    'headache': ['G43','G44'],
-    'neuropathy': ['G50','G51','G52','G53','G54','G55','G56','G57','G58','G59','G60','G61','G62','G63','G64'],
-    'rhd': ['I05','I06','I07','I08','I09'],
-    'ht': ['I10','I11','I12','I13','I14','I15','O10','O13','O16'],
-    'isch': ['I20','I21','I22','I23','I24','I25'],
-    'phd': ['I26','I27','I28'],
-    'carditis': ['I30','I32','I33','I38','I39','I40','I41'],
-    'cmp': ['I42','I43'],
-    'arrythmia': ['I44','I45','I47','I48','I49'],
-    'hf': ['I50'],
-    'stroke': ['I60','I61','I62','I63','I64','I69'],
-    'artery': ['I70','I71','I72','I73','I74','I77','I78','I79'],
-    'vein': ['I80','I81','I82','I83','I85','I86','I87','I88','I89'],
-    'chronic_res': ['J35','J37','J40','J41','J42','J43','J44','J45'],
-    'pul_edema': ['J81'],
-    'pleura': ['J90','J91','J92','J93','J94'],
-    'oral': ['K00','K01','K02','K03','K04','K05','K06','K07','K08','K09','K10','K11','K12','K13','K14'],
-    'gastritis': ['K22','K25','K26','K27','K28','K29','K30'],
-    'hernia': ['K40','K41','K42','K43','K44','K45','K46'],
-    'intestinal': ['K50','K51','K52','K56','K58','K59','K60','K61','K62','K63'],
-    'hemorrh': ['K64'],
-    'periton': ['K65'],
-    'liver_fail': ['K72'],
-    'liver': ['K70','K71','K73','K74','K75','K76'],
-    'gallbladder': ['K80','K81','K82','K83'],
-    'pancreas': ['K85','K86'],
-    'bullous': ['L10','L11','L12','L13','L14'],
-    'atopic': ['L20'],
-    'dermatitis': ['L21','L23','L25','L26','L27','L28','L30'],
-    'urticaria': ['L50'],
-    'urolith': ['N20','N21','N22'],
-    'endomet': ['N80'],
-    'femgen': ['N81','N82','N83','N84','N85','N86','N87','N88','N89','N90'],
-    'hypomen': ['N91'],
-    'menorrh': ['N92'],
-    'dysmen': ['N94']
-}
-# Infectious conditions
-infectious_conditions = {
-    'typhoid': ['A01'],
-    'cholera': ['A00'],
-    'v_age': ['A08'],
-    'b_age': ['A00', 'A02', 'A03', 'A04', 'A05'],
-    'p_age': ['A06', 'A07'],
-    'tb': ['A15', 'A16', 'A17', 'A18', 'A19'],
-    'myco': ['A30', 'A31'],
-    'lepto': ['A27'],
-    'std': ['A51','A52','A53','A54','A55','A56','A57','A58','A59','A63','A64'],
-    'torch': ['B58','B06','B25','B00','A60'],
-    'v_skin': ['B01','B02','B03','B04','B05','B07','B08','B09'],
-    'hepatitis': ['B15','B16','B17','B18','B19'],
-    'hiv': ['B20','B21','B22','B23','B24'],
-    'sepsis': ['A40','A41'],
-    'infla_cns': ['G00','G01','G02','G03','G04','G08','G05','G06','G07','G09'],
-    'urti': ['J00','J01','J02','J03','J04','J05','J06','J09','J10','J11'],
-    'lrti': ['J12','J13','J14','J15','J16','J17','J18','J20','J21','J22'],
-    'uti': ['N30','N34','N39']
-}
-
-# Pregnancy conditions
-pregnancy_conditions = {
-    'abortive': ['O00', 'O01', 'O02', 'O03', 'O04', 'O05', 'O06', 'O07', 'O08'],
-    'preecl': ['O11', 'O14'], 'ecl': ['O15'], 'earlyhemo': ['O20'], 'heg': ['O21'],
-    'venpreg': ['O22'], 'utipreg': ['O23'], 'malpreg': ['O25'], 'multigest': ['O30'],
-    'malpresent': ['O32'], 'disprop': ['O33'], 'abnorpelv': ['O34'], 'fetalprob': ['O35', 'O36'],
-    'polyhydra': ['O40'], 'abnamnio': ['O41'], 'prom': ['O42'], 'placental': ['O43'],
-    'previa': ['O44'], 'abrupt': ['O45'], 'anh': ['O46'], 'prolong': ['O48'],
-    'preterm': ['O60'], 'fail': ['O61'], 'abnforce': ['O62'], 'long': ['O63'],
-    'obspelvic': ['O65', 'O66'], 'malpres': ['O64'], 'iph': ['O67'], 'distress': ['O68'],
-    'umbilical': ['O69'], 'laceration': ['O70'], 'obstrau': ['O71'], 'pph': ['O72'],
-    'retained': ['O73'], 'normal': ['O80'], 'instrum': ['O81'], 'caesar': ['O82'],
-    'assisted': ['O83'], 'multiple': ['O84']
-}
-
-# Regex conditions
-conditions_regex = {
-    'arthropathy': r'M(0[0-9]|1[0-9]|2[0-5])',
-    'sysconn': r'M3[0-6]',
-    'dorsopathy': r'M4[0-9]|M5[0-4]',
-    'muscle_dis': r'M6[0-3]',
-    'synov_dis': r'M6[5-8]',
-    'soft_dis': r'M8[0-9]|M9[0-4]',
-    'renal_dis': r'N0[0-9]|N1[0-6]',
-    'renal_fail': r'N1[7-9]',
-    'breast_dis': r'N6[0-4]',
-    'pid': r'N7[0-7]',
-    'poison': r'T3[6-9]|T4[0-9]|T50',
-    'toxic': r'T5[1-9]|T6[0-5]'
-}
-
-# Combine chronic and infectious conditions
-all_conditions = {}
-all_conditions.update(chronic_conditions)
-all_conditions.update(infectious_conditions)
-
-# --- Pre-compile regex ---
-compiled_patterns = {condition: re.compile(regex) for condition, regex in conditions_regex.items()}
-
-# === DATE CONDITIONS ===
-before_chronic   = (primi['combined_date'] <= primi['ref'])
-before_inf_preg  = (primi['combined_date'] < primi['ref_start'])
-
-after_chronic_inf = (primi['combined_date'] > primi['ref'])
-after_preg        = (primi['combined_date'] - primi['ref']).dt.days > 30
-
-during_inf  = (
-    (primi['combined_date'] >= primi['ref_start']) &
-    (primi['combined_date'] <= primi['ref'])
-)
-during_preg = (
-    (primi['combined_date'] >= primi['ref_start']) &
-    (primi['combined_date'] <= (primi['ref'] + pd.Timedelta(days=30)))
-)
-
-# === LOOPING ===
-
-# Chronic
-for cond, codes in chronic_conditions.items():
-    m = (primi['FKP14A'].isin(codes) |
-         primi['FKL15A'].isin(codes) |
-         primi['FKL17A'].isin(codes) |
-         primi['FKL24A'].isin(codes))
-    primi[f'b_{cond}'] = (m & before_chronic).astype(int)
-    primi[f'a_{cond}'] = (m & after_chronic_inf).astype(int)
-
-# Infectious
-for cond, codes in infectious_conditions.items():
-    m = (primi['FKP14A'].isin(codes) |
-         primi['FKL15A'].isin(codes) |
-         primi['FKL17A'].isin(codes) |
-         primi['FKL24A'].isin(codes))
-    primi[f'b_{cond}'] = (m & before_inf_preg).astype(int)
-    primi[f'c_{cond}'] = (m & during_inf).astype(int)
-    primi[f'a_{cond}'] = (m & after_chronic_inf).astype(int)
-
-# Pregnancy
-for cond, codes in pregnancy_conditions.items():
-    m = (primi['FKP14A'].isin(codes) |
-         primi['FKL15A'].isin(codes) |
-         primi['FKL17A'].isin(codes) |
-         primi['FKL24A'].isin(codes))
-    primi[f'b_{cond}'] = (m & before_inf_preg).astype(int)
-    primi[f'c_{cond}'] = (m & during_preg).astype(int)
-    primi[f'a_{cond}'] = (m & after_preg).astype(int)
-
-# Regex (chronic rules)
-for cond, pat in compiled_patterns.items():
-    m = (primi['FKP14A'].str.contains(pat, na=False) |
-         primi['FKL15A'].str.contains(pat, na=False) |
-         primi['FKL17A'].str.contains(pat, na=False) |
-         primi['FKL24A'].str.contains(pat, na=False))
-    primi[f'b_{cond}'] = (m & before_chronic).astype(int)
-    primi[f'a_{cond}'] = (m & after_chronic_inf).astype(int)
-
-# Washout period
-# Extract year from 'ref'
-primi['ref_year'] = primi['ref'].dt.year
-
-# Remove ref_year = 2015 
-rows_to_drop = primi[primi['ref_year'] == 2015]
-num_rows_dropped = len(rows_to_drop)
-
-# Update DataFrame
-primi_wash = primi[primi['ref_year'] != 2015]
-
-# Remove columns that are no longer needed
-columns_to_drop = ['FKP03', 'FKP04', 'FKP13', 'FKP14A', 'FKL03', 'FKL04', 'FKL09', 'FKL11', 'FKL14', 'FKL15A', 'FKL16', 'FKL17A', 'FKL18', 'FKL24A', 'PSTV18', 'fin_g', 'combined_date', 'ref', 'ref_start']
-ichi = primi_wash.drop(columns=columns_to_drop, errors='ignore')
-
-# Set all values in the 'n_preg' column to 1
-ichi['n_preg'] = 1
-
-aggregation_rules = {
-    'subsid': 'max',  
-    'age': 'min',     
-    'dom': 'min',     
-    'age_risk' : 'min',
-    'subsid': 'max', 
-    'n_preg' : 'min',
-    'ref_year' : 'min'
-}
-
-# Add rules for columns starting with 'b_', 'a_' or 'c_' to cap their sum at 1
-for col in ichi.columns:
-    if col.startswith('b_') or col.startswith('a_') or col.startswith('c_'):
-        aggregation_rules[col] = lambda x: min(x.sum(), 1)
-
-# Perform the groupby and aggregation
-fin_ich = ichi.groupby('PSTV01').agg(aggregation_rules).reset_index()
-
-fin_ich.to_csv("1st_washed.csv",index=False)
-
-#2nd Pregnancy
-
-# Load the visit-level data
-secon = pd.read_csv("pregnancy by visit.csv")
-
-# or if you want to continue from the previous dataframe without saving/loading
-# secon = df.copy()
-
-# Cohort filtering: only patients who had n_preg = 2
-valid_pstv01 = secon.loc[secon['n_preg'] == 2, 'PSTV01'].unique()
-secon = secon[secon['PSTV01'].isin(valid_pstv01)].reset_index(drop=True)
-
-# Generate pregnancy termination date 'ref' 
-ref_map = (
-    secon.loc[(secon['n_preg'] == 2) & (secon['fin_g'].notna()), ['PSTV01', 'fin_g']]
-      .sort_values(['PSTV01', 'fin_g'])          # prioritaskan tanggal awal
-      .drop_duplicates('PSTV01', keep='first')   # pastikan 1 nilai per PSTV01
-      .set_index('PSTV01')['fin_g']              # jadi Series siap untuk map()
-)
-secon['ref'] = secon['PSTV01'].map(ref_map)
-
-#Generate pregnancy start date 'ref_start'
-ref_start_map = (
-    secon.loc[(secon['n_preg'] == 2) & (secon['ref_start'].notna()), ['PSTV01', 'ref_start']]
-         .sort_values(['PSTV01', 'ref_start'])
-         .drop_duplicates('PSTV01', keep='first')
-         .set_index('PSTV01')['ref_start']
-)
-secon['ref_start'] = secon['PSTV01'].map(ref_start_map)
-
-# Ensure 'combined_date' and 'ref' are datetime
-secon['combined_date'] = pd.to_datetime(secon['combined_date'], errors='coerce')
-secon['ref'] = pd.to_datetime(secon['ref'], errors='coerce')
-secon['ref_start'] = pd.to_datetime(secon['ref_start'], errors='coerce')
-
-# All condition dictionaries
-chronic_conditions = { 
-    'dm': ['E10','E11','E12','E13','E14','O24'],
-    'malnut': ['E40','E41','E42','E43','E44','E45','E46'],
-    'nutri': ['E50','E51','E52','E53','E54','E55','E56','E57','E58','E59','E60','E61','E62','E63','E64'],
-    'obese': ['E66'],
-    'substance': ['F10','F11','F12','F13','F14','F15','F16','F17','F18','F19'],
-    'schizo': ['F20','F21','F22','F23','F24','F25','F28','F29'],
-    'neurot': ['F40','F41','F42','F43','F44','F48','F45'],
-    'neu_deg': ['G10','G11','G12','G20','G21','G22','G23','G24','G25','G26','G30','G31','G32','G35','G36','G37'],
-    'headache': ['G43','G44'],
-    'neuropathy': ['G50','G51','G52','G53','G54','G55','G56','G57','G58','G59','G60','G61','G62','G63','G64'],
-    'rhd': ['I05','I06','I07','I08','I09'],
-    'ht': ['I10','I11','I12','I13','I14','I15','O10','O13','O16'],
-    'isch': ['I20','I21','I22','I23','I24','I25'],
-    'phd': ['I26','I27','I28'],
-    'carditis': ['I30','I32','I33','I38','I39','I40','I41'],
-    'cmp': ['I42','I43'],
-    'arrythmia': ['I44','I45','I47','I48','I49'],
-    'hf': ['I50'],
-    'stroke': ['I60','I61','I62','I63','I64','I69'],
-    'artery': ['I70','I71','I72','I73','I74','I77','I78','I79'],
-    'vein': ['I80','I81','I82','I83','I85','I86','I87','I88','I89'],
-    'chronic_res': ['J35','J37','J40','J41','J42','J43','J44','J45'],
-    'pul_edema': ['J81'],
-    'pleura': ['J90','J91','J92','J93','J94'],
-    'oral': ['K00','K01','K02','K03','K04','K05','K06','K07','K08','K09','K10','K11','K12','K13','K14'],
-    'gastritis': ['K22','K25','K26','K27','K28','K29','K30'],
-    'hernia': ['K40','K41','K42','K43','K44','K45','K46'],
-    'intestinal': ['K50','K51','K52','K56','K58','K59','K60','K61','K62','K63'],
-    'hemorrh': ['K64'],
-    'periton': ['K65'],
-    'liver_fail': ['K72'],
-    'liver': ['K70','K71','K73','K74','K75','K76'],
-    'gallbladder': ['K80','K81','K82','K83'],
-    'pancreas': ['K85','K86'],
-    'bullous': ['L10','L11','L12','L13','L14'],
-    'atopic': ['L20'],
-    'dermatitis': ['L21','L23','L25','L26','L27','L28','L30'],
-    'urticaria': ['L50'],
-    'urolith': ['N20','N21','N22'],
-    'endomet': ['N80'],
-    'femgen': ['N81','N82','N83','N84','N85','N86','N87','N88','N89','N90'],
-    'hypomen': ['N91'],
-    'menorrh': ['N92'],
-    'dysmen': ['N94']
-}
-# Infectious conditions
-infectious_conditions = {
-    'typhoid': ['A01'],
-    'cholera': ['A00'],
-    'v_age': ['A08'],
-    'b_age': ['A00', 'A02', 'A03', 'A04', 'A05'],
-    'p_age': ['A06', 'A07'],
-    'tb': ['A15', 'A16', 'A17', 'A18', 'A19'],
-    'myco': ['A30', 'A31'],
-    'lepto': ['A27'],
-    'std': ['A51','A52','A53','A54','A55','A56','A57','A58','A59','A63','A64'],
-    'torch': ['B58','B06','B25','B00','A60'],
-    'v_skin': ['B01','B02','B03','B04','B05','B07','B08','B09'],
-    'hepatitis': ['B15','B16','B17','B18','B19'],
-    'hiv': ['B20','B21','B22','B23','B24'],
-    'sepsis': ['A40','A41'],
-    'infla_cns': ['G00','G01','G02','G03','G04','G08','G05','G06','G07','G09'],
-    'urti': ['J00','J01','J02','J03','J04','J05','J06','J09','J10','J11'],
-    'lrti': ['J12','J13','J14','J15','J16','J17','J18','J20','J21','J22'],
-    'uti': ['N30','N34','N39']
-}
-
-# Pregnancy conditions
-pregnancy_conditions = {
-    'abortive': ['O00', 'O01', 'O02', 'O03', 'O04', 'O05', 'O06', 'O07', 'O08'],
-    'preecl': ['O11', 'O14'], 'ecl': ['O15'], 'earlyhemo': ['O20'], 'heg': ['O21'],
-    'venpreg': ['O22'], 'utipreg': ['O23'], 'malpreg': ['O25'], 'multigest': ['O30'],
-    'malpresent': ['O32'], 'disprop': ['O33'], 'abnorpelv': ['O34'], 'fetalprob': ['O35', 'O36'],
-    'polyhydra': ['O40'], 'abnamnio': ['O41'], 'prom': ['O42'], 'placental': ['O43'],
-    'previa': ['O44'], 'abrupt': ['O45'], 'anh': ['O46'], 'prolong': ['O48'],
-    'preterm': ['O60'], 'fail': ['O61'], 'abnforce': ['O62'], 'long': ['O63'],
-    'obspelvic': ['O65', 'O66'], 'malpres': ['O64'], 'iph': ['O67'], 'distress': ['O68'],
-    'umbilical': ['O69'], 'laceration': ['O70'], 'obstrau': ['O71'], 'pph': ['O72'],
-    'retained': ['O73'], 'normal': ['O80'], 'instrum': ['O81'], 'caesar': ['O82'],
-    'assisted': ['O83'], 'multiple': ['O84']
-}
-
-# Regex conditions
-conditions_regex = {
-    'arthropathy': r'M(0[0-9]|1[0-9]|2[0-5])',
-    'sysconn': r'M3[0-6]',
-    'dorsopathy': r'M4[0-9]|M5[0-4]',
-    'muscle_dis': r'M6[0-3]',
-    'synov_dis': r'M6[5-8]',
-    'soft_dis': r'M8[0-9]|M9[0-4]',
-    'renal_dis': r'N0[0-9]|N1[0-6]',
-    'renal_fail': r'N1[7-9]',
-    'breast_dis': r'N6[0-4]',
-    'pid': r'N7[0-7]',
-    'poison': r'T3[6-9]|T4[0-9]|T50',
-    'toxic': r'T5[1-9]|T6[0-5]'
-}
-
-# Combine chronic and infectious conditions
-all_conditions = {}
-all_conditions.update(chronic_conditions)
-all_conditions.update(infectious_conditions)
-
-# --- Pre-compile regex ---
-compiled_patterns = {condition: re.compile(regex) for condition, regex in conditions_regex.items()}
-
-# === DATE CONDITIONS ===
-before_chronic   = (secon['combined_date'] <= secon['ref'])
-before_inf_preg  = (secon['combined_date'] < secon['ref_start'])
-
-after_chronic_inf = (secon['combined_date'] > secon['ref'])
-after_preg        = (secon['combined_date'] - secon['ref']).dt.days > 30
-
-during_inf  = (
-    (secon['combined_date'] >= secon['ref_start']) &
-    (secon['combined_date'] <= secon['ref'])
-)
-during_preg = (
-    (secon['combined_date'] >= secon['ref_start']) &
-    (secon['combined_date'] <= (secon['ref'] + pd.Timedelta(days=30)))
-)
-
-# === LOOPING ===
-
-# Chronic
-for cond, codes in chronic_conditions.items():
-    m = (secon['FKP14A'].isin(codes) |
-         secon['FKL15A'].isin(codes) |
-         secon['FKL17A'].isin(codes) |
-         secon['FKL24A'].isin(codes))
-    secon[f'b_{cond}'] = (m & before_chronic).astype(int)
-    secon[f'a_{cond}'] = (m & after_chronic_inf).astype(int)
-
-# Infectious
-for cond, codes in infectious_conditions.items():
-    m = (secon['FKP14A'].isin(codes) |
-         secon['FKL15A'].isin(codes) |
-         secon['FKL17A'].isin(codes) |
-         secon['FKL24A'].isin(codes))
-    secon[f'b_{cond}'] = (m & before_inf_preg).astype(int)
-    secon[f'c_{cond}'] = (m & during_inf).astype(int)
-    secon[f'a_{cond}'] = (m & after_chronic_inf).astype(int)
-
-# Pregnancy
-for cond, codes in pregnancy_conditions.items():
-    m = (secon['FKP14A'].isin(codes) |
-         secon['FKL15A'].isin(codes) |
-         secon['FKL17A'].isin(codes) |
-         secon['FKL24A'].isin(codes))
-    secon[f'b_{cond}'] = (m & before_inf_preg).astype(int)
-    secon[f'c_{cond}'] = (m & during_preg).astype(int)
-    secon[f'a_{cond}'] = (m & after_preg).astype(int)
-
-# Regex (chronic rules)
-for cond, pat in compiled_patterns.items():
-    m = (secon['FKP14A'].str.contains(pat, na=False) |
-         secon['FKL15A'].str.contains(pat, na=False) |
-         secon['FKL17A'].str.contains(pat, na=False) |
-         secon['FKL24A'].str.contains(pat, na=False))
-    secon[f'b_{cond}'] = (m & before_chronic).astype(int)
-    secon[f'a_{cond}'] = (m & after_chronic_inf).astype(int)
-
-# Extract year from 'ref'
-secon['ref_year'] = secon['ref'].dt.year
-
-# Remove columns that are no longer needed
-columns_to_drop = ['FKP03', 'FKP04', 'FKP13', 'FKP14A', 'FKL03', 'FKL04', 'FKL09', 'FKL11', 'FKL14', 'FKL15A', 'FKL16', 'FKL17A', 'FKL18', 'FKL24A', 'PSTV18', 'fin_g', 'combined_date', 'ref', 'ref_start']
-nii = secon.drop(columns=columns_to_drop, errors='ignore')
-
-# Set all values in the 'n_preg' column to 2
-nii['n_preg'] = 2
-
-aggregation_rules = {
-    'subsid': 'max',  
-    'age': 'min',     
-    'dom': 'min',     
-    'age_risk' : 'min',
-    'subsid': 'max', 
-    'n_preg' : 'min',
-    'ref_year' : 'min'
-}
-
-# Add rules for columns starting with 'b_', 'a_' or 'c_' to cap their sum at 1
-for col in nii.columns:
-    if col.startswith('b_') or col.startswith('a_') or col.startswith('c_'):
-        aggregation_rules[col] = lambda x: min(x.sum(), 1)
-
-# Perform the groupby and aggregation
-fin_ni = nii.groupby('PSTV01').agg(aggregation_rules).reset_index()
-
-fin_ni.to_csv("2nd.csv",index=False)
-
-# 3rd Pregnancy
-
-# Load the visit-level data
-trio = pd.read_csv("pregnancy by visit.csv")
-
-# or if you want to continue from the previous dataframe without saving/loading
-# trio = df.copy()
-
-# Cohort filtering: only patients who had n_preg = 3
-valid_pstv01 = trio.loc[trio['n_preg'] == 3, 'PSTV01'].unique()
-trio = trio[trio['PSTV01'].isin(valid_pstv01)].reset_index(drop=True)
-
-# Generate pregnancy termination date 'ref' 
-ref_map = (
-    trio.loc[(trio['n_preg'] == 3) & (trio['fin_g'].notna()), ['PSTV01', 'fin_g']]
-      .sort_values(['PSTV01', 'fin_g'])          # prioritaskan tanggal awal
-      .drop_duplicates('PSTV01', keep='first')   # pastikan 1 nilai per PSTV01
-      .set_index('PSTV01')['fin_g']              # jadi Series siap untuk map()
-)
-trio['ref'] = trio['PSTV01'].map(ref_map)
-
-#Generate pregnancy start date 'ref_start'
-ref_start_map = (
-    trio.loc[(trio['n_preg'] == 3) & (trio['ref_start'].notna()), ['PSTV01', 'ref_start']]
-         .sort_values(['PSTV01', 'ref_start'])
-         .drop_duplicates('PSTV01', keep='first')
-         .set_index('PSTV01')['ref_start']
-)
-trio['ref_start'] = trio['PSTV01'].map(ref_start_map)
-
-
-# Ensure 'combined_date' and 'ref' are datetime
-trio['combined_date'] = pd.to_datetime(trio['combined_date'], errors='coerce')
-trio['ref'] = pd.to_datetime(trio['ref'], errors='coerce')
-trio['ref_start'] = pd.to_datetime(trio['ref_start'], errors='coerce')
-
-# All condition dictionaries
-chronic_conditions = { 
-    'dm': ['E10','E11','E12','E13','E14','O24'],
-    'malnut': ['E40','E41','E42','E43','E44','E45','E46'],
-    'nutri': ['E50','E51','E52','E53','E54','E55','E56','E57','E58','E59','E60','E61','E62','E63','E64'],
-    'obese': ['E66'],
-    'substance': ['F10','F11','F12','F13','F14','F15','F16','F17','F18','F19'],
-    'schizo': ['F20','F21','F22','F23','F24','F25','F28','F29'],
-    'neurot': ['F40','F41','F42','F43','F44','F48','F45'],
-    'neu_deg': ['G10','G11','G12','G20','G21','G22','G23','G24','G25','G26','G30','G31','G32','G35','G36','G37'],
-    'headache': ['G43','G44'],
-    'neuropathy': ['G50','G51','G52','G53','G54','G55','G56','G57','G58','G59','G60','G61','G62','G63','G64'],
-    'rhd': ['I05','I06','I07','I08','I09'],
-    'ht': ['I10','I11','I12','I13','I14','I15','O10','O13','O16'],
-    'isch': ['I20','I21','I22','I23','I24','I25'],
-    'phd': ['I26','I27','I28'],
-    'carditis': ['I30','I32','I33','I38','I39','I40','I41'],
-    'cmp': ['I42','I43'],
-    'arrythmia': ['I44','I45','I47','I48','I49'],
-    'hf': ['I50'],
-    'stroke': ['I60','I61','I62','I63','I64','I69'],
-    'artery': ['I70','I71','I72','I73','I74','I77','I78','I79'],
-    'vein': ['I80','I81','I82','I83','I85','I86','I87','I88','I89'],
-    'chronic_res': ['J35','J37','J40','J41','J42','J43','J44','J45'],
-    'pul_edema': ['J81'],
-    'pleura': ['J90','J91','J92','J93','J94'],
-    'oral': ['K00','K01','K02','K03','K04','K05','K06','K07','K08','K09','K10','K11','K12','K13','K14'],
-    'gastritis': ['K22','K25','K26','K27','K28','K29','K30'],
-    'hernia': ['K40','K41','K42','K43','K44','K45','K46'],
-    'intestinal': ['K50','K51','K52','K56','K58','K59','K60','K61','K62','K63'],
-    'hemorrh': ['K64'],
-    'periton': ['K65'],
-    'liver_fail': ['K72'],
-    'liver': ['K70','K71','K73','K74','K75','K76'],
-    'gallbladder': ['K80','K81','K82','K83'],
-    'pancreas': ['K85','K86'],
-    'bullous': ['L10','L11','L12','L13','L14'],
-    'atopic': ['L20'],
-    'dermatitis': ['L21','L23','L25','L26','L27','L28','L30'],
-    'urticaria': ['L50'],
-    'urolith': ['N20','N21','N22'],
-    'endomet': ['N80'],
-    'femgen': ['N81','N82','N83','N84','N85','N86','N87','N88','N89','N90'],
-    'hypomen': ['N91'],
-    'menorrh': ['N92'],
-    'dysmen': ['N94']
-}
-# Infectious conditions
-infectious_conditions = {
-    'typhoid': ['A01'],
-    'cholera': ['A00'],
-    'v_age': ['A08'],
-    'b_age': ['A00', 'A02', 'A03', 'A04', 'A05'],
-    'p_age': ['A06', 'A07'],
-    'tb': ['A15', 'A16', 'A17', 'A18', 'A19'],
-    'myco': ['A30', 'A31'],
-    'lepto': ['A27'],
-    'std': ['A51','A52','A53','A54','A55','A56','A57','A58','A59','A63','A64'],
-    'torch': ['B58','B06','B25','B00','A60'],
-    'v_skin': ['B01','B02','B03','B04','B05','B07','B08','B09'],
-    'hepatitis': ['B15','B16','B17','B18','B19'],
-    'hiv': ['B20','B21','B22','B23','B24'],
-    'sepsis': ['A40','A41'],
-    'infla_cns': ['G00','G01','G02','G03','G04','G08','G05','G06','G07','G09'],
-    'urti': ['J00','J01','J02','J03','J04','J05','J06','J09','J10','J11'],
-    'lrti': ['J12','J13','J14','J15','J16','J17','J18','J20','J21','J22'],
-    'uti': ['N30','N34','N39']
-}
-
-# Pregnancy conditions
-pregnancy_conditions = {
-    'abortive': ['O00', 'O01', 'O02', 'O03', 'O04', 'O05', 'O06', 'O07', 'O08'],
-    'preecl': ['O11', 'O14'], 'ecl': ['O15'], 'earlyhemo': ['O20'], 'heg': ['O21'],
-    'venpreg': ['O22'], 'utipreg': ['O23'], 'malpreg': ['O25'], 'multigest': ['O30'],
-    'malpresent': ['O32'], 'disprop': ['O33'], 'abnorpelv': ['O34'], 'fetalprob': ['O35', 'O36'],
-    'polyhydra': ['O40'], 'abnamnio': ['O41'], 'prom': ['O42'], 'placental': ['O43'],
-    'previa': ['O44'], 'abrupt': ['O45'], 'anh': ['O46'], 'prolong': ['O48'],
-    'preterm': ['O60'], 'fail': ['O61'], 'abnforce': ['O62'], 'long': ['O63'],
-    'obspelvic': ['O65', 'O66'], 'malpres': ['O64'], 'iph': ['O67'], 'distress': ['O68'],
-    'umbilical': ['O69'], 'laceration': ['O70'], 'obstrau': ['O71'], 'pph': ['O72'],
-    'retained': ['O73'], 'normal': ['O80'], 'instrum': ['O81'], 'caesar': ['O82'],
-    'assisted': ['O83'], 'multiple': ['O84']
-}
-
-# Regex conditions
-conditions_regex = {
-    'arthropathy': r'M(0[0-9]|1[0-9]|2[0-5])',
-    'sysconn': r'M3[0-6]',
-    'dorsopathy': r'M4[0-9]|M5[0-4]',
-    'muscle_dis': r'M6[0-3]',
-    'synov_dis': r'M6[5-8]',
-    'soft_dis': r'M8[0-9]|M9[0-4]',
-    'renal_dis': r'N0[0-9]|N1[0-6]',
-    'renal_fail': r'N1[7-9]',
-    'breast_dis': r'N6[0-4]',
-    'pid': r'N7[0-7]',
-    'poison': r'T3[6-9]|T4[0-9]|T50',
-    'toxic': r'T5[1-9]|T6[0-5]'
-}
-
-# Combine chronic and infectious conditions
-all_conditions = {}
-all_conditions.update(chronic_conditions)
-all_conditions.update(infectious_conditions)
-
-# --- Pre-compile regex ---
-compiled_patterns = {condition: re.compile(regex) for condition, regex in conditions_regex.items()}
-
-# === DATE CONDITIONS ===
-before_chronic   = (trio['combined_date'] <= trio['ref'])
-before_inf_preg  = (trio['combined_date'] < trio['ref_start'])
-
-after_chronic_inf = (trio['combined_date'] > trio['ref'])
-after_preg        = (trio['combined_date'] - trio['ref']).dt.days > 30
-
-during_inf  = (
-    (trio['combined_date'] >= trio['ref_start']) &
-    (trio['combined_date'] <= trio['ref'])
-)
-during_preg = (
-    (trio['combined_date'] >= trio['ref_start']) &
-    (trio['combined_date'] <= (trio['ref'] + pd.Timedelta(days=30)))
-)
-
-# === LOOPING ===
-
-# Chronic
-for cond, codes in chronic_conditions.items():
-    m = (trio['FKP14A'].isin(codes) |
-         trio['FKL15A'].isin(codes) |
-         trio['FKL17A'].isin(codes) |
-         trio['FKL24A'].isin(codes))
-    trio[f'b_{cond}'] = (m & before_chronic).astype(int)
-    trio[f'a_{cond}'] = (m & after_chronic_inf).astype(int)
-
-# Infectious
-for cond, codes in infectious_conditions.items():
-    m = (trio['FKP14A'].isin(codes) |
-         trio['FKL15A'].isin(codes) |
-         trio['FKL17A'].isin(codes) |
-         trio['FKL24A'].isin(codes))
-    trio[f'b_{cond}'] = (m & before_inf_preg).astype(int)
-    trio[f'c_{cond}'] = (m & during_inf).astype(int)
-    trio[f'a_{cond}'] = (m & after_chronic_inf).astype(int)
-
-# Pregnancy
-for cond, codes in pregnancy_conditions.items():
-    m = (trio['FKP14A'].isin(codes) |
-         trio['FKL15A'].isin(codes) |
-         trio['FKL17A'].isin(codes) |
-         trio['FKL24A'].isin(codes))
-    trio[f'b_{cond}'] = (m & before_inf_preg).astype(int)
-    trio[f'c_{cond}'] = (m & during_preg).astype(int)
-    trio[f'a_{cond}'] = (m & after_preg).astype(int)
-
-# Regex (chronic rules)
-for cond, pat in compiled_patterns.items():
-    m = (trio['FKP14A'].str.contains(pat, na=False) |
-         trio['FKL15A'].str.contains(pat, na=False) |
-         trio['FKL17A'].str.contains(pat, na=False) |
-         trio['FKL24A'].str.contains(pat, na=False))
-    trio[f'b_{cond}'] = (m & before_chronic).astype(int)
-    trio[f'a_{cond}'] = (m & after_chronic_inf).astype(int)
-
-# Extract year from 'ref'
-trio['ref_year'] = trio['ref'].dt.year
-
-# Remove columns that are no longer needed
-columns_to_drop = ['FKP03', 'FKP04', 'FKP13', 'FKP14A', 'FKL03', 'FKL04', 'FKL09', 'FKL11', 'FKL14', 'FKL15A', 'FKL16', 'FKL17A', 'FKL18', 'FKL24A', 'PSTV18', 'fin_g', 'combined_date', 'ref']
-san = trio.drop(columns=columns_to_drop, errors='ignore')
-
-# Set all values in the 'n_preg' column to 3
-san['n_preg'] = 3
-
-aggregation_rules = {
-    'subsid': 'max',  
-    'age': 'min',     
-    'dom': 'min',     
-    'age_risk' : 'min',
-    'subsid': 'max', 
-    'n_preg' : 'min',
-    'ref_year' : 'min'
-}
-
-# Add rules for columns starting with 'b_', 'a_' or 'c_' to cap their sum at 1
-for col in san.columns:
-    if col.startswith('b_') or col.startswith('a_') or col.startswith('c_'):
-        aggregation_rules[col] = lambda x: min(x.sum(), 1)
-
-# Perform the groupby and aggregation
-fin_san = san.groupby('PSTV01').agg(aggregation_rules).reset_index()
-
-fin_san.to_csv("3rd.csv",index=False)
-
-#4th
-
-# Load the visit-level data
-quad = pd.read_csv("pregnancy by visit.csv")
-
-# or if you want to continue from the previous dataframe without saving/loading
-# quad = df.copy()
-
-# 1st Pregnancy
-# Cohort filtering: only patients who had n_preg = 4
-valid_pstv01 = quad.loc[quad['n_preg'] == 4, 'PSTV01'].unique()
-quad = quad[quad['PSTV01'].isin(valid_pstv01)].reset_index(drop=True)
-
-# Generate pregnancy termination date 'ref' 
-ref_map = (
-    quad.loc[(quad['n_preg'] == 4) & (quad['fin_g'].notna()), ['PSTV01', 'fin_g']]
-      .sort_values(['PSTV01', 'fin_g'])          # prioritaskan tanggal awal
-      .drop_duplicates('PSTV01', keep='first')   # pastikan 1 nilai per PSTV01
-      .set_index('PSTV01')['fin_g']              # jadi Series siap untuk map()
-)
-quad['ref'] = quad['PSTV01'].map(ref_map)
-
-#Generate pregnancy start date 'ref_start'
-ref_start_map = (
-    quad.loc[(quad['n_preg'] == 4) & (quad['ref_start'].notna()), ['PSTV01', 'ref_start']]
-         .sort_values(['PSTV01', 'ref_start'])
-         .drop_duplicates('PSTV01', keep='first')
-         .set_index('PSTV01')['ref_start']
-)
-quad['ref_start'] = quad['PSTV01'].map(ref_start_map)
-
-# Ensure 'combined_date' and 'ref' are datetime
-quad['combined_date'] = pd.to_datetime(quad['combined_date'], errors='coerce')
-quad['ref'] = pd.to_datetime(quad['ref'], errors='coerce')
-quad['ref_start'] = pd.to_datetime(quad['ref_start'], errors='coerce')
-
-# All condition dictionaries
-chronic_conditions = { 
-    'dm': ['E10','E11','E12','E13','E14','O24'],
-    'malnut': ['E40','E41','E42','E43','E44','E45','E46'],
-    'nutri': ['E50','E51','E52','E53','E54','E55','E56','E57','E58','E59','E60','E61','E62','E63','E64'],
-    'obese': ['E66'],
-    'substance': ['F10','F11','F12','F13','F14','F15','F16','F17','F18','F19'],
-    'schizo': ['F20','F21','F22','F23','F24','F25','F28','F29'],
-    'neurot': ['F40','F41','F42','F43','F44','F48','F45'],
-    'neu_deg': ['G10','G11','G12','G20','G21','G22','G23','G24','G25','G26','G30','G31','G32','G35','G36','G37'],
-    'headache': ['G43','G44'],
-    'neuropathy': ['G50','G51','G52','G53','G54','G55','G56','G57','G58','G59','G60','G61','G62','G63','G64'],
-    'rhd': ['I05','I06','I07','I08','I09'],
-    'ht': ['I10','I11','I12','I13','I14','I15','O10','O13','O16'],
-    'isch': ['I20','I21','I22','I23','I24','I25'],
-    'phd': ['I26','I27','I28'],
-    'carditis': ['I30','I32','I33','I38','I39','I40','I41'],
-    'cmp': ['I42','I43'],
-    'arrythmia': ['I44','I45','I47','I48','I49'],
-    'hf': ['I50'],
-    'stroke': ['I60','I61','I62','I63','I64','I69'],
-    'artery': ['I70','I71','I72','I73','I74','I77','I78','I79'],
-    'vein': ['I80','I81','I82','I83','I85','I86','I87','I88','I89'],
-    'chronic_res': ['J35','J37','J40','J41','J42','J43','J44','J45'],
-    'pul_edema': ['J81'],
-    'pleura': ['J90','J91','J92','J93','J94'],
-    'oral': ['K00','K01','K02','K03','K04','K05','K06','K07','K08','K09','K10','K11','K12','K13','K14'],
-    'gastritis': ['K22','K25','K26','K27','K28','K29','K30'],
-    'hernia': ['K40','K41','K42','K43','K44','K45','K46'],
-    'intestinal': ['K50','K51','K52','K56','K58','K59','K60','K61','K62','K63'],
-    'hemorrh': ['K64'],
-    'periton': ['K65'],
-    'liver_fail': ['K72'],
-    'liver': ['K70','K71','K73','K74','K75','K76'],
-    'gallbladder': ['K80','K81','K82','K83'],
-    'pancreas': ['K85','K86'],
-    'bullous': ['L10','L11','L12','L13','L14'],
-    'atopic': ['L20'],
-    'dermatitis': ['L21','L23','L25','L26','L27','L28','L30'],
-    'urticaria': ['L50'],
-    'urolith': ['N20','N21','N22'],
-    'endomet': ['N80'],
-    'femgen': ['N81','N82','N83','N84','N85','N86','N87','N88','N89','N90'],
-    'hypomen': ['N91'],
-    'menorrh': ['N92'],
-    'dysmen': ['N94']
-}
-# Infectious conditions
-infectious_conditions = {
-    'typhoid': ['A01'],
-    'cholera': ['A00'],
-    'v_age': ['A08'],
-    'b_age': ['A00', 'A02', 'A03', 'A04', 'A05'],
-    'p_age': ['A06', 'A07'],
-    'tb': ['A15', 'A16', 'A17', 'A18', 'A19'],
-    'myco': ['A30', 'A31'],
-    'lepto': ['A27'],
-    'std': ['A51','A52','A53','A54','A55','A56','A57','A58','A59','A63','A64'],
-    'torch': ['B58','B06','B25','B00','A60'],
-    'v_skin': ['B01','B02','B03','B04','B05','B07','B08','B09'],
-    'hepatitis': ['B15','B16','B17','B18','B19'],
-    'hiv': ['B20','B21','B22','B23','B24'],
-    'sepsis': ['A40','A41'],
-    'infla_cns': ['G00','G01','G02','G03','G04','G08','G05','G06','G07','G09'],
-    'urti': ['J00','J01','J02','J03','J04','J05','J06','J09','J10','J11'],
-    'lrti': ['J12','J13','J14','J15','J16','J17','J18','J20','J21','J22'],
-    'uti': ['N30','N34','N39']
-}
-
-# Pregnancy conditions
-pregnancy_conditions = {
-    'abortive': ['O00', 'O01', 'O02', 'O03', 'O04', 'O05', 'O06', 'O07', 'O08'],
-    'preecl': ['O11', 'O14'], 'ecl': ['O15'], 'earlyhemo': ['O20'], 'heg': ['O21'],
-    'venpreg': ['O22'], 'utipreg': ['O23'], 'malpreg': ['O25'], 'multigest': ['O30'],
-    'malpresent': ['O32'], 'disprop': ['O33'], 'abnorpelv': ['O34'], 'fetalprob': ['O35', 'O36'],
-    'polyhydra': ['O40'], 'abnamnio': ['O41'], 'prom': ['O42'], 'placental': ['O43'],
-    'previa': ['O44'], 'abrupt': ['O45'], 'anh': ['O46'], 'prolong': ['O48'],
-    'preterm': ['O60'], 'fail': ['O61'], 'abnforce': ['O62'], 'long': ['O63'],
-    'obspelvic': ['O65', 'O66'], 'malpres': ['O64'], 'iph': ['O67'], 'distress': ['O68'],
-    'umbilical': ['O69'], 'laceration': ['O70'], 'obstrau': ['O71'], 'pph': ['O72'],
-    'retained': ['O73'], 'normal': ['O80'], 'instrum': ['O81'], 'caesar': ['O82'],
-    'assisted': ['O83'], 'multiple': ['O84']
-}
-
-# Regex conditions
-conditions_regex = {
-    'arthropathy': r'M(0[0-9]|1[0-9]|2[0-5])',
-    'sysconn': r'M3[0-6]',
-    'dorsopathy': r'M4[0-9]|M5[0-4]',
-    'muscle_dis': r'M6[0-3]',
-    'synov_dis': r'M6[5-8]',
-    'soft_dis': r'M8[0-9]|M9[0-4]',
-    'renal_dis': r'N0[0-9]|N1[0-6]',
-    'renal_fail': r'N1[7-9]',
-    'breast_dis': r'N6[0-4]',
-    'pid': r'N7[0-7]',
-    'poison': r'T3[6-9]|T4[0-9]|T50',
-    'toxic': r'T5[1-9]|T6[0-5]'
-}
-
-# Combine chronic and infectious conditions
-all_conditions = {}
-all_conditions.update(chronic_conditions)
-all_conditions.update(infectious_conditions)
-
-# --- Pre-compile regex ---
-compiled_patterns = {condition: re.compile(regex) for condition, regex in conditions_regex.items()}
-
-# === DATE CONDITIONS ===
-before_chronic   = (quad['combined_date'] <= quad['ref'])
-before_inf_preg  = (quad['combined_date'] < quad['ref_start'])
-
-after_chronic_inf = (quad['combined_date'] > quad['ref'])
-after_preg        = (quad['combined_date'] - quad['ref']).dt.days > 30
-
-during_inf  = (
-    (quad['combined_date'] >= quad['ref_start']) &
-    (quad['combined_date'] <= quad['ref'])
-)
-during_preg = (
-    (quad['combined_date'] >= quad['ref_start']) &
-    (quad['combined_date'] <= (quad['ref'] + pd.Timedelta(days=30)))
-)
-
-# === LOOPING ===
-
-# Chronic
-for cond, codes in chronic_conditions.items():
-    m = (quad['FKP14A'].isin(codes) |
-         quad['FKL15A'].isin(codes) |
-         quad['FKL17A'].isin(codes) |
-         quad['FKL24A'].isin(codes))
-    quad[f'b_{cond}'] = (m & before_chronic).astype(int)
-    quad[f'a_{cond}'] = (m & after_chronic_inf).astype(int)
-
-# Infectious
-for cond, codes in infectious_conditions.items():
-    m = (quad['FKP14A'].isin(codes) |
-         quad['FKL15A'].isin(codes) |
-         quad['FKL17A'].isin(codes) |
-         quad['FKL24A'].isin(codes))
-    quad[f'b_{cond}'] = (m & before_inf_preg).astype(int)
-    quad[f'c_{cond}'] = (m & during_inf).astype(int)
-    quad[f'a_{cond}'] = (m & after_chronic_inf).astype(int)
-
-# Pregnancy
-for cond, codes in pregnancy_conditions.items():
-    m = (quad['FKP14A'].isin(codes) |
-         quad['FKL15A'].isin(codes) |
-         quad['FKL17A'].isin(codes) |
-         quad['FKL24A'].isin(codes))
-    quad[f'b_{cond}'] = (m & before_inf_preg).astype(int)
-    quad[f'c_{cond}'] = (m & during_preg).astype(int)
-    quad[f'a_{cond}'] = (m & after_preg).astype(int)
-
-# Regex (chronic rules)
-for cond, pat in compiled_patterns.items():
-    m = (quad['FKP14A'].str.contains(pat, na=False) |
-         quad['FKL15A'].str.contains(pat, na=False) |
-         quad['FKL17A'].str.contains(pat, na=False) |
-         quad['FKL24A'].str.contains(pat, na=False))
-    quad[f'b_{cond}'] = (m & before_chronic).astype(int)
-    quad[f'a_{cond}'] = (m & after_chronic_inf).astype(int)
-
-# Extract year from 'ref'
-quad['ref_year'] = quad['ref'].dt.year
-
-# Remove columns that are no longer needed
-columns_to_drop = ['FKP03', 'FKP04', 'FKP13', 'FKP14A', 'FKL03', 'FKL04', 'FKL09', 'FKL11', 'FKL14', 'FKL15A', 'FKL16', 'FKL17A', 'FKL18', 'FKL24A', 'PSTV18', 'fin_g', 'combined_date', 'ref']
-yon = quad.drop(columns=columns_to_drop, errors='ignore')
-
-# Set all values in the 'n_preg' column to 3
-yon['n_preg'] = 4
-
-aggregation_rules = {
-    'subsid': 'max',  
-    'age': 'min',     
-    'dom': 'min',     
-    'age_risk' : 'min',
-    'subsid': 'max', 
-    'n_preg' : 'min',
-    'ref_year' : 'min'
-}
-
-# Add rules for columns starting with 'b_', 'a_' or 'c_' to cap their sum at 1
-for col in yon.columns:
-    if col.startswith('b_') or col.startswith('a_') or col.startswith('c_'):
-        aggregation_rules[col] = lambda x: min(x.sum(), 1)
-
-# Perform the groupby and aggregation
-fin_yon = yon.groupby('PSTV01').agg(aggregation_rules).reset_index()
-
-fin_yon.to_csv("4th.csv",index=False)
-
-#5th Preg
-
-# Load the visit-level data
-quin = pd.read_csv("pregnancy by visit.csv")
-
-# or if you want to continue from the previous dataframe without saving/loading
-# quin = df.copy()
-
-# 1st Pregnancy
-# Cohort filtering: only patients who had n_preg = 5
-valid_pstv01 = quin.loc[quin['n_preg'] == 5, 'PSTV01'].unique()
-quin = quin[quin['PSTV01'].isin(valid_pstv01)].reset_index(drop=True)
-
-# Generate pregnancy termination date 'ref' 
-ref_map = (
-    quin.loc[(quin['n_preg'] == 5) & (quin['fin_g'].notna()), ['PSTV01', 'fin_g']]
-      .sort_values(['PSTV01', 'fin_g'])          # prioritaskan tanggal awal
-      .drop_duplicates('PSTV01', keep='first')   # pastikan 1 nilai per PSTV01
-      .set_index('PSTV01')['fin_g']              # jadi Series siap untuk map()
-)
-quin['ref'] = quin['PSTV01'].map(ref_map)
-
-#Generate pregnancy start date 'ref_start'
-ref_start_map = (
-    quin.loc[(quin['n_preg'] == 5) & (quin['ref_start'].notna()), ['PSTV01', 'ref_start']]
-         .sort_values(['PSTV01', 'ref_start'])
-         .drop_duplicates('PSTV01', keep='first')
-         .set_index('PSTV01')['ref_start']
-)
-quin['ref_start'] = quin['PSTV01'].map(ref_start_map)
-
-
-# Ensure 'combined_date' and 'ref' are datetime
-quin['combined_date'] = pd.to_datetime(quin['combined_date'], errors='coerce')
-quin['ref'] = pd.to_datetime(quin['ref'], errors='coerce')
-quin['ref_start'] = pd.to_datetime(quin['ref_start'], errors='coerce')
-
-# All condition dictionaries
-chronic_conditions = { 
-    'dm': ['E10','E11','E12','E13','E14','O24'],
-    'malnut': ['E40','E41','E42','E43','E44','E45','E46'],
-    'nutri': ['E50','E51','E52','E53','E54','E55','E56','E57','E58','E59','E60','E61','E62','E63','E64'],
-    'obese': ['E66'],
-    'substance': ['F10','F11','F12','F13','F14','F15','F16','F17','F18','F19'],
-    'schizo': ['F20','F21','F22','F23','F24','F25','F28','F29'],
-    'neurot': ['F40','F41','F42','F43','F44','F48','F45'],
-    'neu_deg': ['G10','G11','G12','G20','G21','G22','G23','G24','G25','G26','G30','G31','G32','G35','G36','G37'],
-    'headache': ['G43','G44'],
-    'neuropathy': ['G50','G51','G52','G53','G54','G55','G56','G57','G58','G59','G60','G61','G62','G63','G64'],
-    'rhd': ['I05','I06','I07','I08','I09'],
-    'ht': ['I10','I11','I12','I13','I14','I15','O10','O13','O16'],
-    'isch': ['I20','I21','I22','I23','I24','I25'],
-    'phd': ['I26','I27','I28'],
-    'carditis': ['I30','I32','I33','I38','I39','I40','I41'],
-    'cmp': ['I42','I43'],
-    'arrythmia': ['I44','I45','I47','I48','I49'],
-    'hf': ['I50'],
-    'stroke': ['I60','I61','I62','I63','I64','I69'],
-    'artery': ['I70','I71','I72','I73','I74','I77','I78','I79'],
-    'vein': ['I80','I81','I82','I83','I85','I86','I87','I88','I89'],
-    'chronic_res': ['J35','J37','J40','J41','J42','J43','J44','J45'],
-    'pul_edema': ['J81'],
-    'pleura': ['J90','J91','J92','J93','J94'],
-    'oral': ['K00','K01','K02','K03','K04','K05','K06','K07','K08','K09','K10','K11','K12','K13','K14'],
-    'gastritis': ['K22','K25','K26','K27','K28','K29','K30'],
-    'hernia': ['K40','K41','K42','K43','K44','K45','K46'],
-    'intestinal': ['K50','K51','K52','K56','K58','K59','K60','K61','K62','K63'],
-    'hemorrh': ['K64'],
-    'periton': ['K65'],
-    'liver_fail': ['K72'],
-    'liver': ['K70','K71','K73','K74','K75','K76'],
-    'gallbladder': ['K80','K81','K82','K83'],
-    'pancreas': ['K85','K86'],
-    'bullous': ['L10','L11','L12','L13','L14'],
-    'atopic': ['L20'],
-    'dermatitis': ['L21','L23','L25','L26','L27','L28','L30'],
-    'urticaria': ['L50'],
-    'urolith': ['N20','N21','N22'],
-    'endomet': ['N80'],
-    'femgen': ['N81','N82','N83','N84','N85','N86','N87','N88','N89','N90'],
-    'hypomen': ['N91'],
-    'menorrh': ['N92'],
-    'dysmen': ['N94']
-}
-# Infectious conditions
-infectious_conditions = {
-    'typhoid': ['A01'],
-    'cholera': ['A00'],
-    'v_age': ['A08'],
-    'b_age': ['A00', 'A02', 'A03', 'A04', 'A05'],
-    'p_age': ['A06', 'A07'],
-    'tb': ['A15', 'A16', 'A17', 'A18', 'A19'],
-    'myco': ['A30', 'A31'],
-    'lepto': ['A27'],
-    'std': ['A51','A52','A53','A54','A55','A56','A57','A58','A59','A63','A64'],
-    'torch': ['B58','B06','B25','B00','A60'],
-    'v_skin': ['B01','B02','B03','B04','B05','B07','B08','B09'],
-    'hepatitis': ['B15','B16','B17','B18','B19'],
-    'hiv': ['B20','B21','B22','B23','B24'],
-    'sepsis': ['A40','A41'],
-    'infla_cns': ['G00','G01','G02','G03','G04','G08','G05','G06','G07','G09'],
-    'urti': ['J00','J01','J02','J03','J04','J05','J06','J09','J10','J11'],
-    'lrti': ['J12','J13','J14','J15','J16','J17','J18','J20','J21','J22'],
-    'uti': ['N30','N34','N39']
-}
-
-# Pregnancy conditions
-pregnancy_conditions = {
-    'abortive': ['O00', 'O01', 'O02', 'O03', 'O04', 'O05', 'O06', 'O07', 'O08'],
-    'preecl': ['O11', 'O14'], 'ecl': ['O15'], 'earlyhemo': ['O20'], 'heg': ['O21'],
-    'venpreg': ['O22'], 'utipreg': ['O23'], 'malpreg': ['O25'], 'multigest': ['O30'],
-    'malpresent': ['O32'], 'disprop': ['O33'], 'abnorpelv': ['O34'], 'fetalprob': ['O35', 'O36'],
-    'polyhydra': ['O40'], 'abnamnio': ['O41'], 'prom': ['O42'], 'placental': ['O43'],
-    'previa': ['O44'], 'abrupt': ['O45'], 'anh': ['O46'], 'prolong': ['O48'],
-    'preterm': ['O60'], 'fail': ['O61'], 'abnforce': ['O62'], 'long': ['O63'],
-    'obspelvic': ['O65', 'O66'], 'malpres': ['O64'], 'iph': ['O67'], 'distress': ['O68'],
-    'umbilical': ['O69'], 'laceration': ['O70'], 'obstrau': ['O71'], 'pph': ['O72'],
-    'retained': ['O73'], 'normal': ['O80'], 'instrum': ['O81'], 'caesar': ['O82'],
-    'assisted': ['O83'], 'multiple': ['O84']
-}
-
-# Regex conditions
-conditions_regex = {
-    'arthropathy': r'M(0[0-9]|1[0-9]|2[0-5])',
-    'sysconn': r'M3[0-6]',
-    'dorsopathy': r'M4[0-9]|M5[0-4]',
-    'muscle_dis': r'M6[0-3]',
-    'synov_dis': r'M6[5-8]',
-    'soft_dis': r'M8[0-9]|M9[0-4]',
-    'renal_dis': r'N0[0-9]|N1[0-6]',
-    'renal_fail': r'N1[7-9]',
-    'breast_dis': r'N6[0-4]',
-    'pid': r'N7[0-7]',
-    'poison': r'T3[6-9]|T4[0-9]|T50',
-    'toxic': r'T5[1-9]|T6[0-5]'
-}
-
-# Combine chronic and infectious conditions
-all_conditions = {}
-all_conditions.update(chronic_conditions)
-all_conditions.update(infectious_conditions)
-
-# --- Pre-compile regex ---
-compiled_patterns = {condition: re.compile(regex) for condition, regex in conditions_regex.items()}
-
-# === DATE CONDITIONS ===
-before_chronic   = (quin['combined_date'] <= quin['ref'])
-before_inf_preg  = (quin['combined_date'] < quin['ref_start'])
-
-after_chronic_inf = (quin['combined_date'] > quin['ref'])
-after_preg        = (quin['combined_date'] - quin['ref']).dt.days > 30
-
-during_inf  = (
-    (quin['combined_date'] >= quin['ref_start']) &
-    (quin['combined_date'] <= quin['ref'])
-)
-during_preg = (
-    (quin['combined_date'] >= quin['ref_start']) &
-    (quin['combined_date'] <= (quin['ref'] + pd.Timedelta(days=30)))
-)
-
-# === LOOPING ===
-
-# Chronic
-for cond, codes in chronic_conditions.items():
-    m = (quin['FKP14A'].isin(codes) |
-         quin['FKL15A'].isin(codes) |
-         quin['FKL17A'].isin(codes) |
-         quin['FKL24A'].isin(codes))
-    quin[f'b_{cond}'] = (m & before_chronic).astype(int)
-    quin[f'a_{cond}'] = (m & after_chronic_inf).astype(int)
-
-# Infectious
-for cond, codes in infectious_conditions.items():
-    m = (quin['FKP14A'].isin(codes) |
-         quin['FKL15A'].isin(codes) |
-         quin['FKL17A'].isin(codes) |
-         quin['FKL24A'].isin(codes))
-    quin[f'b_{cond}'] = (m & before_inf_preg).astype(int)
-    quin[f'c_{cond}'] = (m & during_inf).astype(int)
-    quin[f'a_{cond}'] = (m & after_chronic_inf).astype(int)
-
-# Pregnancy
-for cond, codes in pregnancy_conditions.items():
-    m = (quin['FKP14A'].isin(codes) |
-         quin['FKL15A'].isin(codes) |
-         quin['FKL17A'].isin(codes) |
-         quin['FKL24A'].isin(codes))
-    quin[f'b_{cond}'] = (m & before_inf_preg).astype(int)
-    quin[f'c_{cond}'] = (m & during_preg).astype(int)
-    quin[f'a_{cond}'] = (m & after_preg).astype(int)
-
-# Regex (chronic rules)
-for cond, pat in compiled_patterns.items():
-    m = (quin['FKP14A'].str.contains(pat, na=False) |
-         quin['FKL15A'].str.contains(pat, na=False) |
-         quin['FKL17A'].str.contains(pat, na=False) |
-         quin['FKL24A'].str.contains(pat, na=False))
-    quin[f'b_{cond}'] = (m & before_chronic).astype(int)
-    quin[f'a_{cond}'] = (m & after_chronic_inf).astype(int)
-
-# Extract year from 'ref'
-quin['ref_year'] = quin['ref'].dt.year
-
-# Remove columns that are no longer needed
-columns_to_drop = ['FKP03', 'FKP04', 'FKP13', 'FKP14A', 'FKL03', 'FKL04', 'FKL09', 'FKL11', 'FKL14', 'FKL15A', 'FKL16', 'FKL17A', 'FKL18', 'FKL24A', 'PSTV18', 'fin_g', 'combined_date', 'ref']
-gou = quin.drop(columns=columns_to_drop, errors='ignore')
-
-# Set all values in the 'n_preg' column to 5
-gou['n_preg'] = 5
-
-aggregation_rules = {
-    'subsid': 'max',  
-    'age': 'min',     
-    'dom': 'min',     
-    'age_risk' : 'min',
-    'subsid': 'max', 
-    'n_preg' : 'min',
-    'ref_year' : 'min'
-}
-
-# Add rules for columns starting with 'b_', 'a_' or 'c_' to cap their sum at 1
-for col in gou.columns:
-    if col.startswith('b_') or col.startswith('a_') or col.startswith('c_'):
-        aggregation_rules[col] = lambda x: min(x.sum(), 1)
-
-# Perform the groupby and aggregation
-fin_gou = gou.groupby('PSTV01').agg(aggregation_rules).reset_index()
-
-fin_gou.to_csv("5th.csv",index=False)
-
-#6th Pregnancy
-
-# Load the visit-level data
-sext = pd.read_csv("pregnancy by visit.csv")
-
-# or if you want to continue from the previous dataframe without saving/loading
-# sext = df.copy()
-
-# Cohort filtering: only patients who had n_preg = 6
-valid_pstv01 = sext.loc[sext['n_preg'] == 6, 'PSTV01'].unique()
-sext = sext[sext['PSTV01'].isin(valid_pstv01)].reset_index(drop=True)
-
-# Generate pregnancy termination date 'ref' 
-ref_map = (
-    sext.loc[(sext['n_preg'] == 6) & (sext['fin_g'].notna()), ['PSTV01', 'fin_g']]
-      .sort_values(['PSTV01', 'fin_g'])          # prioritaskan tanggal awal
-      .drop_duplicates('PSTV01', keep='first')   # pastikan 1 nilai per PSTV01
-      .set_index('PSTV01')['fin_g']              # jadi Series siap untuk map()
-)
-sext['ref'] = sext['PSTV01'].map(ref_map)
-
-#Generate pregnancy start date 'ref_start'
-ref_start_map = (
-    sext.loc[(sext['n_preg'] == 6) & (sext['ref_start'].notna()), ['PSTV01', 'ref_start']]
-         .sort_values(['PSTV01', 'ref_start'])
-         .drop_duplicates('PSTV01', keep='first')
-         .set_index('PSTV01')['ref_start']
-)
-sext['ref_start'] = sext['PSTV01'].map(ref_start_map)
-
-
-# Ensure 'combined_date' and 'ref' are datetime
-sext['combined_date'] = pd.to_datetime(sext['combined_date'], errors='coerce')
-sext['ref'] = pd.to_datetime(sext['ref'], errors='coerce')
-sext['ref_start'] = pd.to_datetime(sext['ref_start'], errors='coerce')
-
-# All condition dictionaries
-chronic_conditions = { 
-    'dm': ['E10','E11','E12','E13','E14','O24'],
-    'malnut': ['E40','E41','E42','E43','E44','E45','E46'],
-    'nutri': ['E50','E51','E52','E53','E54','E55','E56','E57','E58','E59','E60','E61','E62','E63','E64'],
-    'obese': ['E66'],
-    'substance': ['F10','F11','F12','F13','F14','F15','F16','F17','F18','F19'],
-    'schizo': ['F20','F21','F22','F23','F24','F25','F28','F29'],
-    'neurot': ['F40','F41','F42','F43','F44','F48','F45'],
-    'neu_deg': ['G10','G11','G12','G20','G21','G22','G23','G24','G25','G26','G30','G31','G32','G35','G36','G37'],
-    'headache': ['G43','G44'],
-    'neuropathy': ['G50','G51','G52','G53','G54','G55','G56','G57','G58','G59','G60','G61','G62','G63','G64'],
-    'rhd': ['I05','I06','I07','I08','I09'],
-    'ht': ['I10','I11','I12','I13','I14','I15','O10','O13','O16'],
-    'isch': ['I20','I21','I22','I23','I24','I25'],
-    'phd': ['I26','I27','I28'],
-    'carditis': ['I30','I32','I33','I38','I39','I40','I41'],
-    'cmp': ['I42','I43'],
-    'arrythmia': ['I44','I45','I47','I48','I49'],
-    'hf': ['I50'],
-    'stroke': ['I60','I61','I62','I63','I64','I69'],
-    'artery': ['I70','I71','I72','I73','I74','I77','I78','I79'],
-    'vein': ['I80','I81','I82','I83','I85','I86','I87','I88','I89'],
-    'chronic_res': ['J35','J37','J40','J41','J42','J43','J44','J45'],
-    'pul_edema': ['J81'],
-    'pleura': ['J90','J91','J92','J93','J94'],
-    'oral': ['K00','K01','K02','K03','K04','K05','K06','K07','K08','K09','K10','K11','K12','K13','K14'],
-    'gastritis': ['K22','K25','K26','K27','K28','K29','K30'],
-    'hernia': ['K40','K41','K42','K43','K44','K45','K46'],
-    'intestinal': ['K50','K51','K52','K56','K58','K59','K60','K61','K62','K63'],
-    'hemorrh': ['K64'],
-    'periton': ['K65'],
-    'liver_fail': ['K72'],
-    'liver': ['K70','K71','K73','K74','K75','K76'],
-    'gallbladder': ['K80','K81','K82','K83'],
-    'pancreas': ['K85','K86'],
-    'bullous': ['L10','L11','L12','L13','L14'],
-    'atopic': ['L20'],
-    'dermatitis': ['L21','L23','L25','L26','L27','L28','L30'],
-    'urticaria': ['L50'],
-    'urolith': ['N20','N21','N22'],
-    'endomet': ['N80'],
-    'femgen': ['N81','N82','N83','N84','N85','N86','N87','N88','N89','N90'],
-    'hypomen': ['N91'],
-    'menorrh': ['N92'],
-    'dysmen': ['N94']
-}
-# Infectious conditions
-infectious_conditions = {
-    'typhoid': ['A01'],
-    'cholera': ['A00'],
-    'v_age': ['A08'],
-    'b_age': ['A00', 'A02', 'A03', 'A04', 'A05'],
-    'p_age': ['A06', 'A07'],
-    'tb': ['A15', 'A16', 'A17', 'A18', 'A19'],
-    'myco': ['A30', 'A31'],
-    'lepto': ['A27'],
-    'std': ['A51','A52','A53','A54','A55','A56','A57','A58','A59','A63','A64'],
-    'torch': ['B58','B06','B25','B00','A60'],
-    'v_skin': ['B01','B02','B03','B04','B05','B07','B08','B09'],
-    'hepatitis': ['B15','B16','B17','B18','B19'],
-    'hiv': ['B20','B21','B22','B23','B24'],
-    'sepsis': ['A40','A41'],
-    'infla_cns': ['G00','G01','G02','G03','G04','G08','G05','G06','G07','G09'],
-    'urti': ['J00','J01','J02','J03','J04','J05','J06','J09','J10','J11'],
-    'lrti': ['J12','J13','J14','J15','J16','J17','J18','J20','J21','J22'],
-    'uti': ['N30','N34','N39']
-}
-
-# Pregnancy conditions
-pregnancy_conditions = {
-    'abortive': ['O00', 'O01', 'O02', 'O03', 'O04', 'O05', 'O06', 'O07', 'O08'],
-    'preecl': ['O11', 'O14'], 'ecl': ['O15'], 'earlyhemo': ['O20'], 'heg': ['O21'],
-    'venpreg': ['O22'], 'utipreg': ['O23'], 'malpreg': ['O25'], 'multigest': ['O30'],
-    'malpresent': ['O32'], 'disprop': ['O33'], 'abnorpelv': ['O34'], 'fetalprob': ['O35', 'O36'],
-    'polyhydra': ['O40'], 'abnamnio': ['O41'], 'prom': ['O42'], 'placental': ['O43'],
-    'previa': ['O44'], 'abrupt': ['O45'], 'anh': ['O46'], 'prolong': ['O48'],
-    'preterm': ['O60'], 'fail': ['O61'], 'abnforce': ['O62'], 'long': ['O63'],
-    'obspelvic': ['O65', 'O66'], 'malpres': ['O64'], 'iph': ['O67'], 'distress': ['O68'],
-    'umbilical': ['O69'], 'laceration': ['O70'], 'obstrau': ['O71'], 'pph': ['O72'],
-    'retained': ['O73'], 'normal': ['O80'], 'instrum': ['O81'], 'caesar': ['O82'],
-    'assisted': ['O83'], 'multiple': ['O84']
-}
-
-# Regex conditions
-conditions_regex = {
-    'arthropathy': r'M(0[0-9]|1[0-9]|2[0-5])',
-    'sysconn': r'M3[0-6]',
-    'dorsopathy': r'M4[0-9]|M5[0-4]',
-    'muscle_dis': r'M6[0-3]',
-    'synov_dis': r'M6[5-8]',
-    'soft_dis': r'M8[0-9]|M9[0-4]',
-    'renal_dis': r'N0[0-9]|N1[0-6]',
-    'renal_fail': r'N1[7-9]',
-    'breast_dis': r'N6[0-4]',
-    'pid': r'N7[0-7]',
-    'poison': r'T3[6-9]|T4[0-9]|T50',
-    'toxic': r'T5[1-9]|T6[0-5]'
-}
-
-# Combine chronic and infectious conditions
-all_conditions = {}
-all_conditions.update(chronic_conditions)
-all_conditions.update(infectious_conditions)
-
-# --- Pre-compile regex ---
-compiled_patterns = {condition: re.compile(regex) for condition, regex in conditions_regex.items()}
-
-# === DATE CONDITIONS ===
-before_chronic   = (sext['combined_date'] <= sext['ref'])
-before_inf_preg  = (sext['combined_date'] < sext['ref_start'])
-
-after_chronic_inf = (sext['combined_date'] > sext['ref'])
-after_preg        = (sext['combined_date'] - sext['ref']).dt.days > 30
-
-during_inf  = (
-    (sext['combined_date'] >= sext['ref_start']) &
-    (sext['combined_date'] <= sext['ref'])
-)
-during_preg = (
-    (sext['combined_date'] >= sext['ref_start']) &
-    (sext['combined_date'] <= (sext['ref'] + pd.Timedelta(days=30)))
-)
-
-# === LOOPING ===
-
-# Chronic
-for cond, codes in chronic_conditions.items():
-    m = (sext['FKP14A'].isin(codes) |
-         sext['FKL15A'].isin(codes) |
-         sext['FKL17A'].isin(codes) |
-         sext['FKL24A'].isin(codes))
-    sext[f'b_{cond}'] = (m & before_chronic).astype(int)
-    sext[f'a_{cond}'] = (m & after_chronic_inf).astype(int)
-
-# Infectious
-for cond, codes in infectious_conditions.items():
-    m = (sext['FKP14A'].isin(codes) |
-         sext['FKL15A'].isin(codes) |
-         sext['FKL17A'].isin(codes) |
-         sext['FKL24A'].isin(codes))
-    sext[f'b_{cond}'] = (m & before_inf_preg).astype(int)
-    sext[f'c_{cond}'] = (m & during_inf).astype(int)
-    sext[f'a_{cond}'] = (m & after_chronic_inf).astype(int)
-
-# Pregnancy
-for cond, codes in pregnancy_conditions.items():
-    m = (sext['FKP14A'].isin(codes) |
-         sext['FKL15A'].isin(codes) |
-         sext['FKL17A'].isin(codes) |
-         sext['FKL24A'].isin(codes))
-    sext[f'b_{cond}'] = (m & before_inf_preg).astype(int)
-    sext[f'c_{cond}'] = (m & during_preg).astype(int)
-    sext[f'a_{cond}'] = (m & after_preg).astype(int)
-
-# Regex (chronic rules)
-for cond, pat in compiled_patterns.items():
-    m = (sext['FKP14A'].str.contains(pat, na=False) |
-         sext['FKL15A'].str.contains(pat, na=False) |
-         sext['FKL17A'].str.contains(pat, na=False) |
-         sext['FKL24A'].str.contains(pat, na=False))
-    sext[f'b_{cond}'] = (m & before_chronic).astype(int)
-    sext[f'a_{cond}'] = (m & after_chronic_inf).astype(int)
-
-# Extract year from 'ref'
-sext['ref_year'] = sext['ref'].dt.year
-
-# Remove columns that are no longer needed
-columns_to_drop = ['FKP03', 'FKP04', 'FKP13', 'FKP14A', 'FKL03', 'FKL04', 'FKL09', 'FKL11', 'FKL14', 'FKL15A', 'FKL16', 'FKL17A', 'FKL18', 'FKL24A', 'PSTV18', 'fin_g', 'combined_date', 'ref', 'ref_start']
-rok = sext.drop(columns=columns_to_drop, errors='ignore')
-
-# Set all values in the 'n_preg' column to 5
-rok['n_preg'] = 6
-
-aggregation_rules = {
-    'subsid': 'max',  
-    'age': 'min',     
-    'dom': 'min',     
-    'age_risk' : 'min',
-    'subsid': 'max', 
-    'n_preg' : 'min',
-    'ref_year' : 'min'
-}
-
-# Add rules for columns starting with 'b_', 'a_' or 'c_' to cap their sum at 1
-for col in rok.columns:
-    if col.startswith('b_') or col.startswith('a_') or col.startswith('c_'):
-        aggregation_rules[col] = lambda x: min(x.sum(), 1)
-
-# Perform the groupby and aggregation
-fin_rok = rok.groupby('PSTV01').agg(aggregation_rules).reset_index()
-
-fin_rok.to_csv("6th.csv",index=False)
-
-#7th Pregnancy
-
-# Load the visit-level data
-sept = pd.read_csv("pregnancy by visit.csv")
-
-# or if you want to continue from the previous dataframe without saving/loading
-# sept = df.copy()
-
-# Cohort filtering: only patients who had n_preg = 7
-valid_pstv01 = sept.loc[sept['n_preg'] == 7, 'PSTV01'].unique()
-sept = sept[sept['PSTV01'].isin(valid_pstv01)].reset_index(drop=True)
-
-# Generate pregnancy termination date 'ref' 
-ref_map = (
-    sept.loc[(sept['n_preg'] == 7) & (sept['fin_g'].notna()), ['PSTV01', 'fin_g']]
-      .sort_values(['PSTV01', 'fin_g'])          # prioritaskan tanggal awal
-      .drop_duplicates('PSTV01', keep='first')   # pastikan 1 nilai per PSTV01
-      .set_index('PSTV01')['fin_g']              # jadi Series siap untuk map()
-)
-sept['ref'] = sept['PSTV01'].map(ref_map)
-
-#Generate pregnancy start date 'ref_start'
-ref_start_map = (
-    sept.loc[(sept['n_preg'] == 7) & (sept['ref_start'].notna()), ['PSTV01', 'ref_start']]
-         .sort_values(['PSTV01', 'ref_start'])
-         .drop_duplicates('PSTV01', keep='first')
-         .set_index('PSTV01')['ref_start']
-)
-sept['ref_start'] = sept['PSTV01'].map(ref_start_map)
-
-
-# Ensure 'combined_date' and 'ref' are datetime
-sept['combined_date'] = pd.to_datetime(sept['combined_date'], errors='coerce')
-sept['ref'] = pd.to_datetime(sept['ref'], errors='coerce')
-sept['ref_start'] = pd.to_datetime(sept['ref_start'], errors='coerce')
-
-# All condition dictionaries
-chronic_conditions = { 
-    'dm': ['E10','E11','E12','E13','E14','O24'],
-    'malnut': ['E40','E41','E42','E43','E44','E45','E46'],
-    'nutri': ['E50','E51','E52','E53','E54','E55','E56','E57','E58','E59','E60','E61','E62','E63','E64'],
-    'obese': ['E66'],
-    'substance': ['F10','F11','F12','F13','F14','F15','F16','F17','F18','F19'],
-    'schizo': ['F20','F21','F22','F23','F24','F25','F28','F29'],
-    'neurot': ['F40','F41','F42','F43','F44','F48','F45'],
-    'neu_deg': ['G10','G11','G12','G20','G21','G22','G23','G24','G25','G26','G30','G31','G32','G35','G36','G37'],
-    'headache': ['G43','G44'],
-    'neuropathy': ['G50','G51','G52','G53','G54','G55','G56','G57','G58','G59','G60','G61','G62','G63','G64'],
-    'rhd': ['I05','I06','I07','I08','I09'],
-    'ht': ['I10','I11','I12','I13','I14','I15','O10','O13','O16'],
-    'isch': ['I20','I21','I22','I23','I24','I25'],
-    'phd': ['I26','I27','I28'],
-    'carditis': ['I30','I32','I33','I38','I39','I40','I41'],
-    'cmp': ['I42','I43'],
-    'arrythmia': ['I44','I45','I47','I48','I49'],
-    'hf': ['I50'],
-    'stroke': ['I60','I61','I62','I63','I64','I69'],
-    'artery': ['I70','I71','I72','I73','I74','I77','I78','I79'],
-    'vein': ['I80','I81','I82','I83','I85','I86','I87','I88','I89'],
-    'chronic_res': ['J35','J37','J40','J41','J42','J43','J44','J45'],
-    'pul_edema': ['J81'],
-    'pleura': ['J90','J91','J92','J93','J94'],
-    'oral': ['K00','K01','K02','K03','K04','K05','K06','K07','K08','K09','K10','K11','K12','K13','K14'],
-    'gastritis': ['K22','K25','K26','K27','K28','K29','K30'],
-    'hernia': ['K40','K41','K42','K43','K44','K45','K46'],
-    'intestinal': ['K50','K51','K52','K56','K58','K59','K60','K61','K62','K63'],
-    'hemorrh': ['K64'],
-    'periton': ['K65'],
-    'liver_fail': ['K72'],
-    'liver': ['K70','K71','K73','K74','K75','K76'],
-    'gallbladder': ['K80','K81','K82','K83'],
-    'pancreas': ['K85','K86'],
-    'bullous': ['L10','L11','L12','L13','L14'],
-    'atopic': ['L20'],
-    'dermatitis': ['L21','L23','L25','L26','L27','L28','L30'],
-    'urticaria': ['L50'],
-    'urolith': ['N20','N21','N22'],
-    'endomet': ['N80'],
-    'femgen': ['N81','N82','N83','N84','N85','N86','N87','N88','N89','N90'],
-    'hypomen': ['N91'],
-    'menorrh': ['N92'],
-    'dysmen': ['N94']
-}
-# Infectious conditions
-infectious_conditions = {
-    'typhoid': ['A01'],
-    'cholera': ['A00'],
-    'v_age': ['A08'],
-    'b_age': ['A00', 'A02', 'A03', 'A04', 'A05'],
-    'p_age': ['A06', 'A07'],
-    'tb': ['A15', 'A16', 'A17', 'A18', 'A19'],
-    'myco': ['A30', 'A31'],
-    'lepto': ['A27'],
-    'std': ['A51','A52','A53','A54','A55','A56','A57','A58','A59','A63','A64'],
-    'torch': ['B58','B06','B25','B00','A60'],
-    'v_skin': ['B01','B02','B03','B04','B05','B07','B08','B09'],
-    'hepatitis': ['B15','B16','B17','B18','B19'],
-    'hiv': ['B20','B21','B22','B23','B24'],
-    'sepsis': ['A40','A41'],
-    'infla_cns': ['G00','G01','G02','G03','G04','G08','G05','G06','G07','G09'],
-    'urti': ['J00','J01','J02','J03','J04','J05','J06','J09','J10','J11'],
-    'lrti': ['J12','J13','J14','J15','J16','J17','J18','J20','J21','J22'],
-    'uti': ['N30','N34','N39']
-}
-
-# Pregnancy conditions
-pregnancy_conditions = {
-    'abortive': ['O00', 'O01', 'O02', 'O03', 'O04', 'O05', 'O06', 'O07', 'O08'],
-    'preecl': ['O11', 'O14'], 'ecl': ['O15'], 'earlyhemo': ['O20'], 'heg': ['O21'],
-    'venpreg': ['O22'], 'utipreg': ['O23'], 'malpreg': ['O25'], 'multigest': ['O30'],
-    'malpresent': ['O32'], 'disprop': ['O33'], 'abnorpelv': ['O34'], 'fetalprob': ['O35', 'O36'],
-    'polyhydra': ['O40'], 'abnamnio': ['O41'], 'prom': ['O42'], 'placental': ['O43'],
-    'previa': ['O44'], 'abrupt': ['O45'], 'anh': ['O46'], 'prolong': ['O48'],
-    'preterm': ['O60'], 'fail': ['O61'], 'abnforce': ['O62'], 'long': ['O63'],
-    'obspelvic': ['O65', 'O66'], 'malpres': ['O64'], 'iph': ['O67'], 'distress': ['O68'],
-    'umbilical': ['O69'], 'laceration': ['O70'], 'obstrau': ['O71'], 'pph': ['O72'],
-    'retained': ['O73'], 'normal': ['O80'], 'instrum': ['O81'], 'caesar': ['O82'],
-    'assisted': ['O83'], 'multiple': ['O84']
-}
-
-# Regex conditions
-conditions_regex = {
-    'arthropathy': r'M(0[0-9]|1[0-9]|2[0-5])',
-    'sysconn': r'M3[0-6]',
-    'dorsopathy': r'M4[0-9]|M5[0-4]',
-    'muscle_dis': r'M6[0-3]',
-    'synov_dis': r'M6[5-8]',
-    'soft_dis': r'M8[0-9]|M9[0-4]',
-    'renal_dis': r'N0[0-9]|N1[0-6]',
-    'renal_fail': r'N1[7-9]',
-    'breast_dis': r'N6[0-4]',
-    'pid': r'N7[0-7]',
-    'poison': r'T3[6-9]|T4[0-9]|T50',
-    'toxic': r'T5[1-9]|T6[0-5]'
-}
-
-# Combine chronic and infectious conditions
-all_conditions = {}
-all_conditions.update(chronic_conditions)
-all_conditions.update(infectious_conditions)
-
-# --- Pre-compile regex ---
-compiled_patterns = {condition: re.compile(regex) for condition, regex in conditions_regex.items()}
-
-# === DATE CONDITIONS ===
-before_chronic   = (sept['combined_date'] <= sept['ref'])
-before_inf_preg  = (sept['combined_date'] < sept['ref_start'])
-
-after_chronic_inf = (sept['combined_date'] > sept['ref'])
-after_preg        = (sept['combined_date'] - sept['ref']).dt.days > 30
-
-during_inf  = (
-    (sept['combined_date'] >= sept['ref_start']) &
-    (sept['combined_date'] <= sept['ref'])
-)
-during_preg = (
-    (sept['combined_date'] >= sept['ref_start']) &
-    (sept['combined_date'] <= (sept['ref'] + pd.Timedelta(days=30)))
-)
-
-# === LOOPING ===
-
-# Chronic
-for cond, codes in chronic_conditions.items():
-    m = (sept['FKP14A'].isin(codes) |
-         sept['FKL15A'].isin(codes) |
-         sept['FKL17A'].isin(codes) |
-         sept['FKL24A'].isin(codes))
-    sept[f'b_{cond}'] = (m & before_chronic).astype(int)
-    sept[f'a_{cond}'] = (m & after_chronic_inf).astype(int)
-
-# Infectious
-for cond, codes in infectious_conditions.items():
-    m = (sept['FKP14A'].isin(codes) |
-         sept['FKL15A'].isin(codes) |
-         sept['FKL17A'].isin(codes) |
-         sept['FKL24A'].isin(codes))
-    sept[f'b_{cond}'] = (m & before_inf_preg).astype(int)
-    sept[f'c_{cond}'] = (m & during_inf).astype(int)
-    sept[f'a_{cond}'] = (m & after_chronic_inf).astype(int)
-
-# Pregnancy
-for cond, codes in pregnancy_conditions.items():
-    m = (sept['FKP14A'].isin(codes) |
-         sept['FKL15A'].isin(codes) |
-         sept['FKL17A'].isin(codes) |
-         sept['FKL24A'].isin(codes))
-    sept[f'b_{cond}'] = (m & before_inf_preg).astype(int)
-    sept[f'c_{cond}'] = (m & during_preg).astype(int)
-    sept[f'a_{cond}'] = (m & after_preg).astype(int)
-
-# Regex (chronic rules)
-for cond, pat in compiled_patterns.items():
-    m = (sept['FKP14A'].str.contains(pat, na=False) |
-         sept['FKL15A'].str.contains(pat, na=False) |
-         sept['FKL17A'].str.contains(pat, na=False) |
-         sept['FKL24A'].str.contains(pat, na=False))
-    sept[f'b_{cond}'] = (m & before_chronic).astype(int)
-    sept[f'a_{cond}'] = (m & after_chronic_inf).astype(int)
-
-# Extract year from 'ref'
-sept['ref_year'] = sept['ref'].dt.year
-
-# Remove columns that are no longer needed
-columns_to_drop = ['FKP03', 'FKP04', 'FKP13', 'FKP14A', 'FKL03', 'FKL04', 'FKL09', 'FKL11', 'FKL14', 'FKL15A', 'FKL16', 'FKL17A', 'FKL18', 'FKL24A', 'PSTV18', 'fin_g', 'combined_date', 'ref', 'ref_start']
-nana = sept.drop(columns=columns_to_drop, errors='ignore')
-
-# Set all values in the 'n_preg' column to 5
-nana['n_preg'] = 7
-
-aggregation_rules = {
-    'subsid': 'max',  
-    'age': 'min',     
-    'dom': 'min',     
-    'age_risk' : 'min',
-    'subsid': 'max', 
-    'n_preg' : 'min',
-    'ref_year' : 'min'
-}
-
-# Add rules for columns starting with 'b_', 'a_' or 'c_' to cap their sum at 1
-for col in nana.columns:
-    if col.startswith('b_') or col.startswith('a_') or col.startswith('c_'):
-        aggregation_rules[col] = lambda x: min(x.sum(), 1)
-
-# Perform the groupby and aggregation
-fin_nan = nana.groupby('PSTV01').agg(aggregation_rules).reset_index()
-
-fin_nan.to_csv("7th.csv",index=False)
-
-# Merge all tables 
-one = pd.read_csv("1st_washed.csv")
-two = pd.read_csv("2nd.csv")
-thr = pd.read_csv("3rd.csv")
-fou = pd.read_csv("4th.csv")
-fiv = pd.read_csv("5th.csv")
-six = pd.read_csv("6th.csv")
-sev = pd.read_csv("7th.csv")
-
-# List of tables
-tables = {'one': one, 'two': two, 'thr': thr, 'fou': fou, 'fiv': fiv, 'six': six, 'sev': sev}
-
-# Check the number of columns in each table
-columns_count = {name: df.shape[1] for name, df in tables.items()}
-
-# Display the number of columns in each table
-for name, count in columns_count.items():
-    print(f"Table {name} has {count} columns.")
-
-# Check whether all tables have the same number of columns
-all_same = len(set(columns_count.values())) == 1
-if all_same:
-    print("\nAll tables have the same number of columns.")
-else:
-    print("\nThe tables have a different number of columns.")
-
-all = pd.concat([one, two, thr, fou, fiv, six, sev], axis=0, ignore_index=True)
-
-all
-
-all.to_csv("final_set.csv",index=False)
+import pandas as pd
+import duckdb
+import numpy as np
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from icd_conditions import CONDITION_REGISTRY, condition_map
+from pipeline_io import (VISIT_PATH, EPISODES_PATH, FINAL_SET_PATH, ICD_COLS, ICD3_CODES,
+                         dx_columns, icd3, icd3_sql, sek_dx_columns, read_frame, write_frame, write_table)
+
+# ---------- konfigurasi ----------
+DB_PATH = 'fin_maternal.db'
+
+# Rebuild every stage of fin_maternal.db, ignoring the stage manifest
+REBUILD = False
+
+# Also export the visit table and final set as CSV next to the Parquet files
+EXPORT_CSV = False
+
+# Annual extracts to load; each year is ingested into its own tables (fktp_2023, ...)
+YEARS = [2023]
+
+# Source extracts: unified view -> (.dta file pattern, columns kept)
+DTA_SOURCES = {
+    'fktp1':    ('FKTP_{year}.dta',           ['PSTV01', 'FKP02', 'FKP03', 'FKP04', 'FKP05', 'FKP13', 'FKP14A']),
+    'fkrtl1':   ('FKRTL_{year}.dta',          ['PSTV01', 'FKP02', 'FKL02', 'FKL03', 'FKL04', 'FKL05', 'FKL09', 'FKL11', 'FKL14', 'FKL15A', 'FKL17A']),
+    'sek1':     ('FKRTL_Sekunder_{year}.dta', ['FKL02', 'FKL24A']),
+    'peserta1': ('Kepesertaan_{year}.dta',    ['PSTV01', 'PSTV03', 'PSTV08', 'PSTV18']),
+}
+
+# Threads ingesting the (year, extract) files at the same time
+INGEST_WORKERS = 4
+
+# Join keys, stored as BIGINT from ingest on so the joins compare native integers
+KEY_COLS = ['PSTV01', 'FKP02', 'FKL02']
+
+# Generate Characteristics: (column, SQL expression) over klin + peserta1, in order,
+# so a later definition can use an earlier column (age_risk uses age)
+CHARACTERISTICS = [
+    # Age
+    ('age', """CASE
+        WHEN FKL03 IS NOT NULL THEN EXTRACT(YEAR FROM FKL03) - EXTRACT(YEAR FROM PSTV03)
+        WHEN FKP03 IS NOT NULL THEN EXTRACT(YEAR FROM FKP03) - EXTRACT(YEAR FROM PSTV03)
+      END"""),
+    # Age Group Categorization
+    ('age_risk', """CASE
+        WHEN age IS NULL THEN NULL
+        WHEN age < 20 OR age > 35 THEN 1
+        ELSE 0
+      END"""),
+    # Region of Residence
+    ('dom', """CASE
+        WHEN COALESCE(FKL05, FKP05) IN (31, 32, 33, 34, 35, 36, 51) THEN 0
+        WHEN FKL05 IS NULL AND FKP05 IS NULL THEN NULL
+        ELSE 1
+      END"""),
+    # Subsidy Membership Status
+    ('subsid', """CASE
+        WHEN PSTV08 IN (2, 3) THEN 1
+        WHEN PSTV08 IS NULL THEN NULL
+        ELSE 0
+      END"""),
+]
+
+# klin columns not carried into kia: duplicate keys from the join, merge-only keys and
+# the raw inputs of the characteristics (PSTV03/PSTV08 are never selected from peserta1)
+KIA_DROP_COLS = ['PSTV01_1', 'PSTV01_2', 'FKL02', 'FKP02', 'FKL05', 'FKP05']
+
+# Secondary diagnoses (sek1.FKL24A) per hospital claim row: 1 keeps one row per
+# (claim, secondary diagnosis); >1 folds them into FKL24A, FKL24B, ... so a claim stays
+# one row unless it has more than SEK_DX_WIDTH distinct secondary diagnoses
+SEK_DX_WIDTH = 1
+
+# Diagnoses are normalised to ICD-3 (icd3 ENUM) at ingest; True also keeps the original
+# text as FKP14A_raw, FKL15A_raw, ...
+KEEP_RAW_DX = False
+
+# Rows per chunk when streaming the .dta files
+INGEST_CHUNKSIZE = 500_000
+
+# Pregnancy level dibangun untuk n_preg = 1..MAX_PARITY
+MAX_PARITY = 7
+
+# Worker processes for the pregnancy level (PSTV01 hash partitions); 1 = run in-process
+N_WORKERS = os.cpu_count() or 1
+
+# Out-of-core mode: >1 builds the pregnancy level per hash(PSTV01) bucket, so only one
+# bucket of visits is held in pandas at a time
+N_BUCKETS = 1
+
+# Washout period: kehamilan ke-WASHOUT_PARITY dengan ref_year WASHOUT_YEAR dibuang
+WASHOUT_PARITY = 1
+WASHOUT_YEAR = 2015
+
+# Diagnosis columns
+DX_COLS = ['FKP14A', 'FKL15A', 'FKL17A'] + sek_dx_columns(SEK_DX_WIDTH)
+
+# Pregnancy outcome codes used to anchor the episodes
+ABORT_CODES  = ['O00','O01','O02','O03','O04','O05','O06','O07']
+PARTUS_CODES = ['O80','O81','O82','O83','O84']
+
+# Window code of a visit relative to its episode [ref_start, ref]
+PRE        = 0   # date <  ref_start
+GESTATION  = 1   # ref_start <= date <= ref
+POSTPARTUM = 2   # ref < date <= ref + POSTPARTUM_DAYS
+AFTER      = 3   # date > ref + POSTPARTUM_DAYS
+NO_DATE    = 4   # combined_date missing: never inside a window
+POSTPARTUM_DAYS = 30
+
+# Date condition -> window codes it covers
+WINDOWS = {
+    'before_chronic':    (PRE, GESTATION),
+    'before_inf_preg':   (PRE,),
+    'after_chronic_inf': (POSTPARTUM, AFTER),
+    'after_preg':        (AFTER,),
+    'during_inf':        (GESTATION,),
+    'during_preg':       (GESTATION, POSTPARTUM),
+}
+
+# Flag b_/c_/a_ per kelompok kondisi: (prefix, date condition)
+CONDITION_GROUPS = [
+    ('chronic',    CONDITION_REGISTRY['chronic'],    [('b', 'before_chronic'),  ('a', 'after_chronic_inf')]),
+    ('infectious', CONDITION_REGISTRY['infectious'], [('b', 'before_inf_preg'), ('c', 'during_inf'),  ('a', 'after_chronic_inf')]),
+    ('pregnancy',  CONDITION_REGISTRY['pregnancy'],  [('b', 'before_inf_preg'), ('c', 'during_preg'), ('a', 'after_preg')]),
+    ('regex',      CONDITION_REGISTRY['regex'],      [('b', 'before_chronic'),  ('a', 'after_chronic_inf')]),
+]
+
+# Column order of the condition matrix: [(group, cond), ...]
+CONDITION_INDEX = [(group, cond) for group, conditions, _ in CONDITION_GROUPS for cond in conditions]
+
+# Column order of the b_/c_/a_ flag matrix
+FLAG_COLUMNS = [f'{prefix}_{cond}' for _, conditions, rules in CONDITION_GROUPS
+                for cond in conditions for prefix, _ in rules]
+
+# Aggregation rules for the patient characteristics; b_/c_/a_ flags are capped at 1 (grouped max)
+aggregation_rules = {
+    'subsid': 'max',
+    'age': 'min',
+    'dom': 'min',
+    'age_risk' : 'min',
+    'n_preg' : 'min',
+    'ref_year' : 'min'
+}
+
+
+def ingest_dta(con, table, path, columns, chunksize=INGEST_CHUNKSIZE):
+    # Read the .dta in chunks of `chunksize` rows (convert_categoricals=False to handle duplicate labels)
+    # and append each projected chunk to `table`, so peak memory is bounded by one chunk.
+    with pd.read_stata(path, iterator=True, convert_categoricals=False) as reader:
+        names = {v.upper(): v for v in reader.variable_labels()}
+        missing = [c for c in columns if c.upper() not in names]
+        if missing:
+            raise KeyError(f"Kolom {missing} tidak ditemukan di {path}.")
+        select = []
+        for c in columns:
+            if c in KEY_COLS:
+                select.append(f"CAST({c} AS BIGINT) AS {c}")
+            elif c in ICD_COLS:
+                select.append(f"{icd3_sql(c)} AS {c}")
+                if KEEP_RAW_DX:
+                    select.append(f"{c} AS {c}_raw")
+            else:
+                select.append(c)
+        select = ', '.join(select)
+
+        created = False
+        while True:
+            try:
+                chunk = reader.read(chunksize, columns=[names[c.upper()] for c in columns])
+            except StopIteration:
+                if created:
+                    break
+                # extract tanpa baris: the table is still created, from the empty projected schema
+                chunk = reader.read(0, columns=[names[c.upper()] for c in columns])
+            con.register('chunk_temp', chunk)
+            if created:
+                con.sql(f"INSERT INTO {table} BY NAME SELECT {select} FROM chunk_temp")
+            else:
+                con.sql(f"CREATE TABLE {table} AS SELECT {select} FROM chunk_temp")
+                created = True
+            con.unregister('chunk_temp')
+
+    print(f"{table}: {con.sql(f'SELECT COUNT(*) FROM {table}').fetchone()[0]:,} rows from {path}")
+
+
+def secondary_dx_sql(width=SEK_DX_WIDTH):
+    # Secondary diagnoses per claim: sek1 itself (width 1), or the distinct codes of each claim
+    # spread over `width` columns, starting a new row for every `width` codes
+    if width == 1:
+        return "SELECT * FROM sek1"
+    slots = ',\n        '.join(f"MAX(FKL24A) FILTER (WHERE k % {width} = {i}) AS {col}"
+                              for i, col in enumerate(sek_dx_columns(width)))
+    return f"""
+      SELECT FKL02,
+        {slots}
+      FROM (
+        SELECT FKL02, FKL24A, ROW_NUMBER() OVER (PARTITION BY FKL02 ORDER BY FKL24A) - 1 AS k
+        FROM (SELECT DISTINCT FKL02, FKL24A FROM sek1 WHERE FKL24A IS NOT NULL)
+      )
+      GROUP BY FKL02, k // {width}
+    """
+
+
+def year_table(view, year):
+    # fktp1 -> fktp_2023
+    return f"{view.rstrip('1')}_{year}"
+
+
+def ingest_year(con, view, year, rebuild=False):
+    pattern, columns = DTA_SOURCES[view]
+    table, path = year_table(view, year), pattern.format(year=year)
+    st = os.stat(path)
+    return run_stage(
+        con, table, [table],
+        lambda con: ingest_dta(con, table, path, columns),
+        {'path': os.path.abspath(path), 'size': st.st_size, 'mtime': st.st_mtime_ns,
+         'columns': columns, 'key_cols': KEY_COLS, 'dx': 'icd3', 'keep_raw_dx': KEEP_RAW_DX},
+        rebuild)
+
+
+def ingest_years(con, years, rebuild=False, n_workers=INGEST_WORKERS):
+    # Every (extract, year) file is its own stage, ingested on a thread with its own cursor;
+    # years already in the manifest are skipped, so adding a year only loads that year.
+    jobs = [(view, year) for year in years for view in DTA_SOURCES]
+    with ThreadPoolExecutor(max_workers=n_workers) as pool:
+        fps = list(pool.map(lambda job: ingest_year(con.cursor(), *job, rebuild), jobs))
+    fps = dict(zip(jobs, fps))
+
+    # Unified views over the years under the names the joins use (fktp1, fkrtl1, sek1, peserta1).
+    # Kepesertaan is a yearly snapshot: keep only the rows of the latest year per PSTV01, so an
+    # older year does not duplicate visits. Every row of that year stays (as with a single
+    # extract), e.g. several PSTV08 rows of one patient still give subsid = max.
+    legacy = {r[0] for r in con.execute("SELECT table_name FROM duckdb_tables()").fetchall()}
+    fp = {}
+    for view in DTA_SOURCES:
+        if view in legacy:
+            con.sql(f"DROP TABLE {view}")   # single-year table from an older fin_maternal.db
+        if view == 'peserta1':
+            union = ' UNION ALL BY NAME '.join(
+                f"SELECT *, {year} AS year FROM {year_table(view, year)}" for year in years)
+            con.sql(f"""
+            CREATE OR REPLACE VIEW {view} AS
+            SELECT * EXCLUDE (year)
+            FROM ({union})
+            QUALIFY year = MAX(year) OVER (PARTITION BY PSTV01)
+            """)
+        else:
+            union = ' UNION ALL BY NAME '.join(f"SELECT * FROM {year_table(view, year)}" for year in years)
+            con.sql(f"CREATE OR REPLACE VIEW {view} AS {union}")
+        fp[view] = fingerprint([fps[(view, year)] for year in years])
+    return fp
+
+
+def build_rs(con):
+    #merge all visits
+    # This step merge Hospital visits with secondary diagnosis table
+    con.sql(f"""CREATE TABLE rs AS
+    SELECT p.*, s.* EXCLUDE (FKL02)
+    FROM fkrtl1 AS p
+    LEFT JOIN ({secondary_dx_sql()}) AS s
+    USING (FKL02);
+    """)
+
+
+def build_klin(con):
+    # This step combines the rs table with the fktp1 table (keys are BIGINT on both sides)
+    con.sql("""
+    CREATE TABLE klin AS
+    SELECT
+      COALESCE(f.PSTV01, p.PSTV01) AS PSTV01,
+      COALESCE(f.FKP02,  p.FKP02)  AS FKP02,
+      f.* EXCLUDE (FKP02),
+      p.* EXCLUDE (FKP02)
+    FROM rs AS f
+    FULL OUTER JOIN fktp1 AS p
+    ON f.PSTV01 = p.PSTV01 AND f.FKP02 = p.FKP02;
+    """)
+
+
+def build_kia(con):
+    # This step combines the total visits with the membership table and derives the
+    # characteristics in the same projection, so kia is written once
+    derived = ',\n      '.join(f"CAST({expr} AS INTEGER) AS {name}" for name, expr in CHARACTERISTICS)
+    con.sql(f"""
+    CREATE TABLE kia AS
+    SELECT
+      k.* EXCLUDE ({', '.join(KIA_DROP_COLS)}),
+      m.PSTV18,
+      {derived}
+    FROM klin AS k
+    LEFT JOIN peserta1 AS m
+    USING (PSTV01);
+    """)
+
+    print(con.sql("PRAGMA table_info(kia)").df())
+
+
+def build_visits(con):
+    build_episode_anchors(con)
+    number_episodes(con)
+
+
+def fingerprint(inputs):
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def run_stage(con, stage, tables, build, inputs, rebuild=False):
+    # Rebuild `tables` with build(con) unless the manifest holds the same input fingerprint
+    # for this stage and the tables are still there. Returns the stage fingerprint, which the
+    # downstream stages include in their own inputs.
+    fp = fingerprint(inputs)
+    row = con.execute("SELECT fingerprint FROM stage_manifest WHERE stage = ?", [stage]).fetchone()
+    existing = {r[0] for r in con.execute("SELECT table_name FROM duckdb_tables()").fetchall()}
+    if not rebuild and row is not None and row[0] == fp and set(tables) <= existing:
+        print(f"{stage}: up to date, skipped")
+        return fp
+
+    # Forget the stage before touching its tables: if build() fails halfway, the next run
+    # rebuilds instead of skipping over a partial table
+    con.execute("DELETE FROM stage_manifest WHERE stage = ?", [stage])
+    for table in tables:
+        con.sql(f"DROP TABLE IF EXISTS {table}")
+    build(con)
+    con.execute("INSERT OR REPLACE INTO stage_manifest VALUES (?, ?, now())", [stage, fp])
+    return fp
+
+
+def build_visit_level(con, rebuild=REBUILD):
+    # Every stage is recorded in stage_manifest with a fingerprint of its inputs (source file
+    # size/mtime, parameters, upstream fingerprints); a re-run only rebuilds the stages whose
+    # inputs changed and everything downstream of them.
+    con.sql("""
+    CREATE TABLE IF NOT EXISTS stage_manifest (
+      stage VARCHAR PRIMARY KEY,
+      fingerprint VARCHAR,
+      built_at TIMESTAMP
+    )
+    """)
+
+    # Stream the .dta extracts into fin_maternal.db, keeping only the needed columns
+    # (PSTV01/FKP02/FKL02 are cast to BIGINT and the diagnoses to icd3 once here)
+    codes = ', '.join(f"'{code}'" for code in ICD3_CODES)
+    con.sql(f"CREATE TYPE IF NOT EXISTS icd3 AS ENUM ({codes})")
+    fp = ingest_years(con, YEARS, rebuild)
+
+    fp['rs'] = run_stage(con, 'rs', ['rs'], build_rs,
+                         {'fkrtl1': fp['fkrtl1'], 'sek1': fp['sek1'], 'sek_dx_width': SEK_DX_WIDTH}, rebuild)
+    fp['klin'] = run_stage(con, 'klin', ['klin'], build_klin,
+                           {'rs': fp['rs'], 'fktp1': fp['fktp1']}, rebuild)
+    fp['kia'] = run_stage(con, 'kia', ['kia'], build_kia,
+                          {'klin': fp['klin'], 'peserta1': fp['peserta1'],
+                           'characteristics': CHARACTERISTICS, 'drop': KIA_DROP_COLS}, rebuild)
+    run_stage(con, 'visits', ['visits', 'episodes'], build_visits,
+              {'kia': fp['kia'], 'abort': ABORT_CODES, 'partus': PARTUS_CODES, 'dx': DX_COLS}, rebuild)
+
+    print(con.sql("SELECT * FROM visits LIMIT 20").df())
+    print(con.sql("SELECT n_preg, COUNT(*) AS n FROM visits GROUP BY n_preg ORDER BY n_preg").df())
+    print(con.sql("SELECT column_name FROM (DESCRIBE visits)").df()['column_name'].tolist())
+
+
+def dx_in(codes):
+    # SQL predicate: any of the four diagnosis columns is one of `codes` (NULL -> FALSE)
+    values = ', '.join(f"'{c}'" for c in codes)
+    return 'COALESCE(' + ' OR '.join(f"{c} IN ({values})" for c in DX_COLS) + ', FALSE)'
+
+
+def build_episode_anchors(con):
+    # Episode anchors inside DuckDB, so the visit table never has to be pulled into pandas:
+    #   combined_date = min(FKP03, FKL03); dopt = combined_date of abortus/partus visits
+    #   fin_g = dopt of the first outcome per PSTV01 and of every outcome >= 180 days after the previous one
+    #   ref_start = fin_g - 140 days (abortus) or - 280 days (partus, wins when both)
+    #   n_preg = rank of the fin_g anchor within PSTV01 (1 = earliest pregnancy), on the anchor rows only
+    # Ties on the same dopt put the partus row first, so the anchor choice is deterministic.
+    con.sql(f"""
+    CREATE OR REPLACE TABLE visits AS
+    WITH dated AS (
+      SELECT
+        * REPLACE (TRY_CAST(FKP03 AS TIMESTAMP) AS FKP03, TRY_CAST(FKL03 AS TIMESTAMP) AS FKL03),
+        LEAST(TRY_CAST(FKP03 AS TIMESTAMP), TRY_CAST(FKL03 AS TIMESTAMP)) AS combined_date,
+        {dx_in(ABORT_CODES)} AS is_abortus,
+        {dx_in(PARTUS_CODES)} AS is_partus
+      FROM kia
+    ),
+    outcome AS (
+      SELECT
+        *,
+        CASE WHEN is_abortus OR is_partus THEN combined_date END AS dopt
+      FROM dated
+    ),
+    lagged AS (
+      SELECT
+        *,
+        LAG(dopt) OVER (PARTITION BY PSTV01 ORDER BY dopt ASC NULLS LAST, is_partus DESC) AS prev_dopt
+      FROM outcome
+    ),
+    anchored AS (
+      SELECT
+        *,
+        CASE WHEN dopt IS NOT NULL AND (prev_dopt IS NULL OR date_diff('day', prev_dopt, dopt) >= 180)
+             THEN dopt END AS fin_g
+      FROM lagged
+    )
+    SELECT
+      * EXCLUDE (is_abortus, is_partus, dopt, prev_dopt),
+      CASE
+        WHEN fin_g IS NOT NULL AND is_partus  THEN fin_g - INTERVAL 280 DAY
+        WHEN fin_g IS NOT NULL AND is_abortus THEN fin_g - INTERVAL 140 DAY
+      END AS ref_start,
+      CASE WHEN fin_g IS NOT NULL AND PSTV01 IS NOT NULL
+           THEN CAST(COUNT(fin_g) OVER (PARTITION BY PSTV01 ORDER BY fin_g) AS INTEGER)
+      END AS n_preg
+    FROM anchored
+    ORDER BY PSTV01, dopt NULLS LAST
+    """)
+
+
+def number_episodes(con):
+    # `episodes` holds one row per (PSTV01, n_preg) with its interval [ref_start, ref];
+    # n_preg is numbered the same way as on the anchor rows of `visits` (build_episode_anchors),
+    # so anchors without PSTV01 (n_preg NULL there) are no episode either
+    con.sql(f"""
+    CREATE OR REPLACE TABLE episodes AS
+    SELECT
+      PSTV01,
+      CAST(ROW_NUMBER() OVER (PARTITION BY PSTV01 ORDER BY fin_g) AS INTEGER) AS n_preg,
+      ref_start,
+      fin_g AS ref,
+      CASE WHEN {dx_in(PARTUS_CODES)} THEN 'partus' ELSE 'abortus' END AS outcome
+    FROM visits
+    WHERE fin_g IS NOT NULL AND PSTV01 IS NOT NULL
+    ORDER BY PSTV01, n_preg
+    """)
+
+
+# ---------- pregnancy level ----------
+def build_episodes(visits, max_parity=MAX_PARITY):
+    # Episode table rebuilt from a visit file (legacy input without the episode table).
+    # Satu baris per (PSTV01, n_preg): ref = fin_g terawal, ref_start = ref_start terawal
+    in_scope = visits['n_preg'].isin(range(1, max_parity + 1))
+    episodes = (
+        visits.loc[in_scope, ['PSTV01', 'n_preg', 'fin_g', 'ref_start']]
+              .groupby(['PSTV01', 'n_preg'])
+              .min()
+              .rename(columns={'fin_g': 'ref'})
+              .reset_index()
+    )
+    episodes['n_preg'] = episodes['n_preg'].astype(int)
+    return episodes
+
+
+def window_codes(date, ref, ref_start, postpartum_days=POSTPARTUM_DAYS):
+    # One uint8 window code per visit-episode pair: the boundaries ref_start <= ref <= ref + 30d
+    # are sorted, so the code is the number of boundaries the visit date has passed.
+    date = date.to_numpy(dtype='datetime64[ns]')
+    ref = ref.to_numpy(dtype='datetime64[ns]')
+    ref_start = ref_start.to_numpy(dtype='datetime64[ns]')
+    code = (date >= ref_start).astype(np.uint8)
+    code += date > ref
+    code += date > ref + np.timedelta64(postpartum_days, 'D')
+    code[np.isnat(date)] = NO_DATE
+    return code
+
+
+def window_masks(code, windows=WINDOWS):
+    # Date condition masks looked up from the window code (one table per condition)
+    masks = {}
+    for name, covered in windows.items():
+        table = np.zeros(NO_DATE + 1, dtype=bool)
+        table[list(covered)] = True
+        masks[name] = table[code]
+    return masks
+
+
+def code_condition_table(codes=ICD3_CODES):
+    # Bitmask table: one packed row of condition bits per ICD-3 code (row = code index),
+    # filled from the shared condition map.
+    cmap = condition_map()
+    rows = pd.Index(codes).get_indexer(cmap['icd3'])
+    cols = pd.MultiIndex.from_tuples(CONDITION_INDEX).get_indexer(list(zip(cmap['group_name'], cmap['condition'])))
+    bits = np.zeros((len(codes) + 1, len(CONDITION_INDEX)), dtype=bool)  # last row: missing code
+    bits[rows[rows >= 0], cols[rows >= 0]] = True
+    return np.packbits(bits, axis=1)
+
+
+def condition_matrix(visits):
+    # Boolean matrix (visit x condition) for all conditions: the ICD-3 code index of every
+    # diagnosis column is a row of the bitmask table.
+    dx_cols = dx_columns(visits.columns)
+    ids = np.column_stack([icd3(visits[c]).cat.codes.to_numpy() for c in dx_cols])   # -1 -> last (empty) row
+    table = code_condition_table()
+    packed = np.bitwise_or.reduce(table[ids], axis=1)
+    return np.unpackbits(packed, axis=1, count=len(CONDITION_INDEX)).astype(bool)
+
+
+def flag_pairs(visits, episodes):
+    # Gabungkan setiap kunjungan pasien dengan setiap episode (PSTV01, n_preg) miliknya
+    # (PSTV01 kosong tidak ikut: pandas would match NaN ids with each other, and the
+    # baseline per-pregnancy groupby dropped them anyway)
+    keep = ['PSTV01', 'combined_date', 'subsid', 'age', 'dom', 'age_risk']
+    episodes = episodes[episodes['PSTV01'].notna()]
+    pair_visits = visits[keep].reset_index(names='visit')
+    pair_visits = pair_visits[pair_visits['PSTV01'].notna()]
+    pairs = episodes.merge(pair_visits, on='PSTV01', how='inner')
+    pairs = pairs.sort_values(['n_preg', 'PSTV01', 'visit'], kind='stable').reset_index(drop=True)
+
+    windows = window_masks(window_codes(pairs['combined_date'], pairs['ref'], pairs['ref_start']))
+    hits = condition_matrix(visits)[pairs['visit'].to_numpy()]
+
+    # Compact uint8 flag matrix (pair x FLAG_COLUMNS)
+    flags = np.empty((len(pairs), len(FLAG_COLUMNS)), dtype=np.uint8)
+    k = 0
+    j = 0
+    for group, conditions, rules in CONDITION_GROUPS:
+        for cond in conditions:
+            for prefix, window in rules:
+                np.logical_and(hits[:, j], windows[window], out=flags[:, k], casting='unsafe')
+                k += 1
+            j += 1
+
+    pairs['ref_year'] = pairs['ref'].dt.year
+    return pairs.drop(columns=['visit']), flags
+
+
+def aggregate_pregnancies(pairs, flags):
+    # pairs are sorted by (n_preg, PSTV01), so every pregnancy is one contiguous block of rows
+    rules = {col: rule for col, rule in aggregation_rules.items() if col != 'n_preg'}
+    out = pairs.groupby(['n_preg', 'PSTV01'], sort=False).agg(rules).reset_index()
+
+    # Flags: any() per pregnancy as a grouped max over the uint8 matrix
+    if len(pairs):
+        n_preg = pairs['n_preg'].to_numpy()
+        pstv01 = pairs['PSTV01'].to_numpy()
+        starts = np.flatnonzero(np.r_[True, (n_preg[1:] != n_preg[:-1]) | (pstv01[1:] != pstv01[:-1])])
+        flag_max = np.maximum.reduceat(flags, starts, axis=0)
+    else:
+        flag_max = flags
+    out = pd.concat([out, pd.DataFrame(flag_max, columns=FLAG_COLUMNS, index=out.index)], axis=1)
+    return out[['PSTV01'] + list(aggregation_rules) + FLAG_COLUMNS]
+
+
+def build_partition(visits, episodes):
+    # Pregnancy level for one set of patients (all their visits and episodes)
+    pairs, flags = flag_pairs(visits.reset_index(drop=True), episodes)
+
+    # Washout period: remove ref_year = 2015 for the first pregnancy
+    keep = ~((pairs['n_preg'] == WASHOUT_PARITY) & (pairs['ref_year'] == WASHOUT_YEAR)).to_numpy()
+    pairs = pairs[keep].reset_index(drop=True)
+    flags = flags[keep]
+
+    return aggregate_pregnancies(pairs, flags)
+
+
+def partition_ids(keys, n_parts):
+    # Hash the ids as int64: a NULL anywhere in visits makes PSTV01 float64 there, and
+    # hash(5.0) != hash(5) would send a patient's visits and episodes to different workers
+    return pd.util.hash_pandas_object(keys.astype('int64'), index=False).to_numpy() % n_parts
+
+
+def build_pregnancy_level(visits, episodes=None, max_parity=MAX_PARITY, n_workers=N_WORKERS):
+    visits = visits.reset_index(drop=True)
+    # Dates are already typed in the Parquet store; only legacy CSV input needs parsing
+    for c in ['combined_date', 'fin_g', 'ref_start']:
+        if visits[c].dtype.kind != 'M':
+            visits[c] = pd.to_datetime(visits[c], errors='coerce')
+
+    if episodes is None:
+        episodes = build_episodes(visits, max_parity)
+    else:
+        episodes = episodes.loc[episodes['n_preg'].between(1, max_parity), ['PSTV01', 'n_preg', 'ref_start', 'ref']]
+
+    if n_workers <= 1:
+        return build_partition(visits, episodes)
+
+    # Patients are independent: hash-partition PSTV01 over the worker processes and merge back
+    # in (n_preg, PSTV01) order, the same order the single-process run produces.
+    # PSTV01 kosong pairs with nothing (flag_pairs), so those rows are left out before hashing.
+    visits = visits[visits['PSTV01'].notna()]
+    episodes = episodes[episodes['PSTV01'].notna()]
+    v_part = partition_ids(visits['PSTV01'], n_workers)
+    e_part = partition_ids(episodes['PSTV01'], n_workers)
+    owner = pd.Series(e_part, index=episodes['PSTV01'].astype('int64').to_numpy())
+    v_owner = owner[~owner.index.duplicated()].reindex(visits['PSTV01'].astype('int64').to_numpy()).to_numpy()
+    if ((v_owner == v_owner) & (v_owner != v_part)).any():
+        raise RuntimeError("Partisi PSTV01 tidak sama antara visits dan episodes.")
+    with ProcessPoolExecutor(max_workers=n_workers) as pool:
+        parts = list(pool.map(build_partition,
+                              (visits[v_part == i] for i in range(n_workers)),
+                              (episodes[e_part == i] for i in range(n_workers))))
+
+    parts = [part for part in parts if len(part)] or parts[:1]
+    return (pd.concat(parts, ignore_index=True)
+              .sort_values(['n_preg', 'PSTV01'], kind='stable')
+              .reset_index(drop=True))
+
+
+def build_pregnancy_level_bucketed(con, path, n_buckets=N_BUCKETS, max_parity=MAX_PARITY,
+                                   n_workers=N_WORKERS, export_csv=False):
+    # Reads the `visits`/`episodes` tables one PSTV01 bucket at a time, writes each bucket's
+    # pregnancies to a part file and lets DuckDB merge the parts in (n_preg, PSTV01) order.
+    parts = []
+    for b in range(n_buckets):
+        where = f"hash(PSTV01) % {n_buckets} = {b}"
+        visits = con.sql(f"SELECT * FROM visits WHERE {where}").df()
+        episodes = con.sql(f"SELECT * FROM episodes WHERE {where}").df()
+        final = build_pregnancy_level(visits, episodes, max_parity, n_workers)
+        print(f"bucket {b + 1}/{n_buckets}: {len(visits):,} visits -> {len(final):,} pregnancies")
+
+        part = f"{os.path.splitext(path)[0]}.part{b}.parquet"
+        write_frame(final, part)
+        parts.append(part)
+
+    con.sql(f"CREATE OR REPLACE TEMP TABLE final_set AS SELECT * FROM read_parquet({parts}) ORDER BY n_preg, PSTV01")
+    write_table(con, 'final_set', path, export_csv=export_csv)
+    print(con.sql("SELECT n_preg, COUNT(*) AS n FROM final_set GROUP BY n_preg ORDER BY n_preg").df())
+    con.sql("DROP TABLE final_set")
+    for part in parts:
+        os.remove(part)
+
+
+# ---------- main ----------
+if __name__ == "__main__":
+    #generate duckdb connection
+    con = duckdb.connect(DB_PATH)
+
+    build_visit_level(con)
+    write_table(con, 'visits', VISIT_PATH, export_csv=EXPORT_CSV)
+    write_table(con, 'episodes', EPISODES_PATH, export_csv=EXPORT_CSV)
+
+    if N_BUCKETS > 1:
+        build_pregnancy_level_bucketed(con, FINAL_SET_PATH, export_csv=EXPORT_CSV)
+    else:
+        # Pregnancy level: the typed visit table is flagged for all parities in one pass,
+        # joined against the episode intervals
+        final = build_pregnancy_level(read_frame(VISIT_PATH), read_frame(EPISODES_PATH))
+        print(final['n_preg'].value_counts().sort_index())
+
+        write_frame(final, FINAL_SET_PATH, export_csv=EXPORT_CSV)
@@ -0,0 +1,210 @@
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+import scipy.sparse as sp
+
+from or_stats import OR_Z, normal_sf, odds_ratios
+from pipeline_io import FREE_CONFLICTS_PATH, iter_frames
+
+# Adjusted OR: c_abortive vs setiap kolom b_/c_/a_ final_set_free_conflicts.parquet,
+# masing-masing disesuaikan dengan age, dom, subsid, n_preg dan ref_year.
+# Satu model logistik per exposure: logit P(outcome) = intercept + covariates + beta * exposure.
+# Flag 0/1 disimpan sebagai scipy sparse matrix; model di-fit bersamaan per batch exposure
+# (IRLS/Newton dengan blok kovariat bersama, warm start dari model kovariat + log OR kasar).
+# Hasil akhir ditulis ke or_adjusted_preg.csv
+
+OUTCOME = 'c_abortive'
+COVARIATES = ['age', 'dom', 'subsid', 'n_preg']
+CATEGORICAL_COVARIATES = ['ref_year']   # dummy per level, level pertama sebagai referensi
+
+EXPOSURE_BATCH = 16      # models fitted together per Newton step (memory ~ rows x batch)
+MAX_ITER = 25
+TOL = 1e-8
+CHUNKSIZE = 250_000
+
+
+def load_design(path, outcome=OUTCOME, covariates=COVARIATES, categorical=CATEGORICAL_COVARIATES,
+                chunksize=CHUNKSIZE):
+    # Outcome vector, dense covariate block (intercept first) and the 0/1 flags as a CSR matrix.
+    # Complete cases on outcome/covariates; a missing flag counts as not exposed.
+    columns = pq.read_schema(path).names if path.lower().endswith('.parquet') \
+        else pd.read_csv(path, nrows=0).columns.tolist()
+    needed = [outcome] + covariates + categorical
+    missing = [col for col in needed if col not in columns]
+    if missing:
+        raise RuntimeError(f"Kolom {missing} tidak ditemukan di {path}.")
+    exposures = [col for col in columns if col.startswith(('b_', 'c_', 'a_')) and col != outcome]
+    if not exposures:
+        raise RuntimeError("Tidak ada kolom exposure b_/c_/a_ di file.")
+
+    ys, covs, blocks = [], [], []
+    for df in iter_frames(path, chunksize, needed + exposures):
+        keep = df[needed].notna().all(axis=1) & df[outcome].isin([0, 1])
+        df = df[keep]
+        ys.append(df[outcome].to_numpy(dtype=float))
+        covs.append(df[covariates + categorical])
+        blocks.append(sp.csr_matrix(df[exposures].to_numpy(dtype=np.float32, na_value=0) == 1, dtype=np.float64))
+
+    y = np.concatenate(ys)
+    cov = pd.concat(covs, ignore_index=True)
+    dummies = pd.get_dummies(cov[categorical].astype(str), drop_first=True, dtype=float)
+    numeric = cov[covariates].astype(float)
+    # Centre the numeric covariates: same exposure ORs, better-conditioned Newton steps
+    numeric = numeric - numeric.mean()
+    Z = np.column_stack([np.ones(len(y)), numeric.to_numpy(), dummies.to_numpy()])
+    names = ['intercept'] + covariates + dummies.columns.tolist()
+    Z, names = independent_columns(Z, names)
+    return y, Z, names, sp.vstack(blocks, format='csr'), exposures
+
+
+def independent_columns(Z, names, tol=1e-10):
+    # Drop constant and collinear covariate columns (e.g. dom constant in a regional extract):
+    # a column is kept when its residual on the kept columns (from the Gram matrix) is not ~0
+    gram = Z.T @ Z
+    keep = [0]
+    for j in range(1, Z.shape[1]):
+        g = gram[np.ix_(keep, keep)]
+        resid = gram[j, j] - gram[j, keep] @ np.linalg.lstsq(g, gram[keep, j], rcond=None)[0]
+        if resid > tol * max(gram[j, j], 1.0):
+            keep.append(j)
+    dropped = [name for j, name in enumerate(names) if j not in keep]
+    if dropped:
+        print(f"Kovariat dibuang (konstan/kolinear): {', '.join(dropped)}")
+    return Z[:, keep], [names[j] for j in keep]
+
+
+def fit_covariates(y, Z, max_iter=MAX_ITER, tol=TOL):
+    # Covariate-only logistic model: the shared warm start of every exposure model
+    gamma = np.zeros(Z.shape[1])
+    gamma[0] = np.log(y.mean() / (1 - y.mean()))
+    for _ in range(max_iter):
+        p = 1 / (1 + np.exp(-(Z @ gamma)))
+        w = p * (1 - p)
+        step = np.linalg.lstsq(Z.T @ (Z * w[:, None]), Z.T @ (y - p), rcond=None)[0]
+        gamma += step
+        if np.max(np.abs(step)) < tol:
+            break
+    return gamma
+
+
+def zz_products(Z):
+    # Row-wise products z_i z_j (upper triangle) so Z'WZ of every model is one matrix product
+    iu = np.triu_indices(Z.shape[1])
+    return Z[:, iu[0]] * Z[:, iu[1]], iu
+
+
+def solve_batch(H, g):
+    # Newton steps and inverse Hessians of a batch; pseudo-inverse for singular models
+    # (e.g. an exposure collinear with a covariate dummy)
+    try:
+        return np.linalg.solve(H, g[:, :, None])[:, :, 0], np.linalg.inv(H)
+    except np.linalg.LinAlgError:
+        inv = np.linalg.pinv(H)
+        return (inv @ g[:, :, None])[:, :, 0], inv
+
+
+def fit_exposure_batch(y, Z, zz, iu, X, gamma0, beta0, max_iter=MAX_ITER, tol=TOL):
+    # Newton/IRLS for B models at once: logit p_b = Z gamma_b + beta_b x_b, with x_b a sparse column.
+    # The Hessian of model b is [[Z'W_bZ, Z'W_b x_b], [x_b'W_bZ, x_b'W_b x_b]], built for all b
+    # from dense (n x B) weights: Z'W_bZ via the zz products, the x_b terms from the sparse flags.
+    n, k = Z.shape
+    B = X.shape[1]
+    gamma = np.tile(gamma0[:, None], (1, B))       # k x B
+    beta = beta0.copy()
+    active = np.ones(B, dtype=bool)
+    iterations = np.zeros(B, dtype=int)
+    cov = np.full((B, k + 1, k + 1), np.nan)
+    Xc = X.tocsc()
+
+    for it in range(1, max_iter + 1):
+        eta = Z @ gamma + (Xc.multiply(beta[None, :])).toarray()
+        p = 1 / (1 + np.exp(-eta))
+        w = p * (1 - p)
+        r = y[:, None] - p
+
+        H = np.empty((B, k + 1, k + 1))
+        zwz = (zz.T @ w).T                            # B x k(k+1)/2
+        H[:, iu[0], iu[1]] = zwz
+        H[:, iu[1], iu[0]] = zwz
+        xw = Xc.multiply(w).tocsc()                   # x_b * w_b, still sparse
+        zwx = (xw.T @ Z)                              # B x k
+        H[:, :k, k] = zwx
+        H[:, k, :k] = zwx
+        H[:, k, k] = np.asarray(xw.sum(axis=0)).ravel()
+        g = np.empty((B, k + 1))
+        g[:, :k] = (Z.T @ r).T
+        g[:, k] = np.asarray(Xc.multiply(r).sum(axis=0)).ravel()
+
+        idx = np.flatnonzero(active)
+        step, cov[idx] = solve_batch(H[idx], g[idx])
+        gamma[:, idx] += step[:, :k].T
+        beta[idx] += step[:, k]
+        iterations[idx] = it
+        done = np.max(np.abs(step), axis=1) < tol
+        active[idx[done]] = False
+        if not active.any():
+            break
+
+    se = np.sqrt(cov[:, k, k])
+    return beta, se, iterations, ~active
+
+
+def adjusted_odds_ratios(path, outcome=OUTCOME, batch=EXPOSURE_BATCH, z=OR_Z):
+    y, Z, names, X, exposures = load_design(path, outcome)
+    print(f"{len(y):,} baris, {len(exposures)} exposure, kovariat: {', '.join(names[1:])}")
+    gamma0 = fit_covariates(y, Z)
+    zz, iu = zz_products(Z)
+
+    # Crude 2x2 cells: reported, and the log OR (Haldane) is the warm start of beta
+    n_exposed = np.asarray(X.sum(axis=0)).ravel()
+    a = np.asarray(X.T @ y).ravel()
+    b = y.sum() - a
+    c = n_exposed - a
+    d = (len(y) - y.sum()) - c
+    crude = odds_ratios(a, b, c, d, z=z)
+
+    results = []
+    for start in range(0, len(exposures), batch):
+        cols = np.arange(start, min(start + batch, len(exposures)))
+        # exposures without both levels have no estimable OR
+        fit = cols[(n_exposed[cols] > 0) & (n_exposed[cols] < len(y))]
+        beta = np.full(len(cols), np.nan)
+        se = np.full(len(cols), np.nan)
+        iterations = np.zeros(len(cols), dtype=int)
+        converged = np.zeros(len(cols), dtype=bool)
+        if len(fit):
+            beta0 = np.clip(np.log(crude['odds_ratio'].to_numpy()[fit]), -10, 10)
+            pos = np.searchsorted(cols, fit)
+            beta[pos], se[pos], iterations[pos], converged[pos] = fit_exposure_batch(
+                y, Z, zz, iu, X[:, fit], gamma0, beta0)
+        results.append(pd.DataFrame({'exposure': [exposures[i] for i in cols], 'beta': beta, 'se': se,
+                                     'iterations': iterations, 'converged': converged}))
+        print(f"  exposure {cols[-1] + 1}/{len(exposures)}")
+
+    out = pd.concat(results, ignore_index=True)
+    out['outcome'] = outcome
+    # separated exposures (not converged) can have huge SEs: their CI bounds overflow to 0/inf
+    with np.errstate(over='ignore'):
+        out['odds_ratio'] = np.exp(out['beta'])
+        out['ci_lower'] = np.exp(out['beta'] - z * out['se'])
+        out['ci_upper'] = np.exp(out['beta'] + z * out['se'])
+    out['p_value'] = 2 * normal_sf(np.abs(out['beta']) / out['se'])
+    out['significance'] = np.where((out['ci_lower'] > 1) | (out['ci_upper'] < 1), 'Significant', 'Not Significant')
+    out['crude_odds_ratio'] = crude['odds_ratio'].to_numpy()
+    out['cell_a'], out['cell_b'], out['cell_c'], out['cell_d'] = a.astype(int), b.astype(int), c.astype(int), d.astype(int)
+    out = out.sort_values('beta', key=np.abs, ascending=False, na_position='last', kind='stable')
+    out['rank'] = np.arange(1, len(out) + 1)
+    out[['odds_ratio', 'ci_lower', 'ci_upper', 'crude_odds_ratio']] = \
+        out[['odds_ratio', 'ci_lower', 'ci_upper', 'crude_odds_ratio']].round(3)
+    return out[['outcome', 'exposure', 'rank', 'odds_ratio', 'ci_lower', 'ci_upper', 'p_value', 'significance',
+                'crude_odds_ratio', 'cell_a', 'cell_b', 'cell_c', 'cell_d', 'iterations', 'converged']]
+
+
+def main():
+    out = adjusted_odds_ratios(FREE_CONFLICTS_PATH)
+    out.to_csv('or_adjusted_preg.csv', index=False)
+    print("Hasil disimpan ke or_adjusted_preg.csv")
+
+
+if __name__ == '__main__':
+    main()
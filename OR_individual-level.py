@@ -1,50 +1,47 @@
 import duckdb
 
+from icd_conditions import register_condition_map
+from or_stats import register_or_macros
+from pipeline_io import VISIT_PATH, dx_columns, scan_sql
+
 # OR Abortus (O00-O08) vs pregnancy condition groups + key demographics
-# Input:  pregnancy by visit.csv (per-visit rows)
+# Input:  pregnancy by visit.parquet (per-visit rows)
 # Patient key: PSTV01
-# Diagnose cols: FKP14A, FKL15A, FKL17A, FKL24A (first 3 chars)
+# Diagnose cols: FKP14A, FKL15A, FKL17A, FKL24A (ICD-3 codes)
 # Output:
 #   - OR_abortus_combined.csv -> pregnancy group + demographic rows and n_preg pair comparisons
 
 db = duckdb.connect(database=':memory:')
+register_condition_map(db)
+register_or_macros(db)
 
-# Cache visits so the CSV is read once
+# Cache visits so the visit table is read once
 db.execute(
-    """
+    f"""
     CREATE OR REPLACE TEMP TABLE visits AS
     SELECT *
-    FROM read_csv_auto('pregnancy by visit.csv', HEADER=TRUE)
+    FROM {scan_sql(VISIT_PATH)}
     WHERE age BETWEEN 12 AND 55
     """
 )
 
-# Normalize ICD codes per patient
-db.execute(
-    """
-    CREATE OR REPLACE TEMP TABLE diagnoses AS
-    SELECT CAST(PSTV01 AS VARCHAR) AS PSTV01,
-           LEFT(UPPER(TRIM(FKP14A)), 3) AS icd_code
-    FROM visits
-    WHERE FKP14A IS NOT NULL AND LEFT(UPPER(TRIM(FKP14A)), 3) ~ '^[A-Z][0-9]{2}$'
-
-    UNION ALL
-    SELECT CAST(PSTV01 AS VARCHAR) AS PSTV01,
-           LEFT(UPPER(TRIM(FKL15A)), 3) AS icd_code
-    FROM visits
-    WHERE FKL15A IS NOT NULL AND LEFT(UPPER(TRIM(FKL15A)), 3) ~ '^[A-Z][0-9]{2}$'
-
-    UNION ALL
-    SELECT CAST(PSTV01 AS VARCHAR) AS PSTV01,
-           LEFT(UPPER(TRIM(FKL17A)), 3) AS icd_code
-    FROM visits
-    WHERE FKL17A IS NOT NULL AND LEFT(UPPER(TRIM(FKL17A)), 3) ~ '^[A-Z][0-9]{2}$'
-
-    UNION ALL
+# ICD codes per patient (every diagnosis column of the visit table, including extra
+# FKL24B.. secondary-diagnosis slots); the store already holds them as ICD-3 codes
+# (NULL when not a valid code), so no per-row normalisation is needed
+visit_cols = [row[0] for row in db.execute("DESCRIBE visits").fetchall()]
+diagnosis_selects = "\n    UNION ALL\n".join(
+    f"""
     SELECT CAST(PSTV01 AS VARCHAR) AS PSTV01,
-           LEFT(UPPER(TRIM(FKL24A)), 3) AS icd_code
+           {col} AS icd_code
     FROM visits
-    WHERE FKL24A IS NOT NULL AND LEFT(UPPER(TRIM(FKL24A)), 3) ~ '^[A-Z][0-9]{2}$'
+    WHERE {col} IS NOT NULL
+    """
+    for col in dx_columns(visit_cols)
+)
+db.execute(
+    f"""
+    CREATE OR REPLACE TEMP TABLE diagnoses AS
+    {diagnosis_selects}
     """
 )
 
@@ -53,7 +50,8 @@ db.execute(
     """
     CREATE OR REPLACE TEMP TABLE patient_abortus_status AS
     SELECT PSTV01,
-           CASE WHEN COUNT(CASE WHEN icd_code ~ '^O0[0-8]$' THEN 1 END) > 0 THEN 1 ELSE 0 END AS has_abortus
+           CASE WHEN COUNT(CASE WHEN icd_code IN (SELECT icd3 FROM condition_map WHERE condition = 'abortive') THEN 1 END) > 0
+                THEN 1 ELSE 0 END AS has_abortus
     FROM diagnoses
     GROUP BY PSTV01
     """
@@ -76,50 +74,10 @@ db.execute(
 
 combined_or_sql = """
 WITH preg_map AS (
-    SELECT * FROM (
-        VALUES
-        ('preecl','O11'), ('preecl','O14'),
-        ('ecl','O15'),
-        ('earlyhemo','O20'),
-        ('heg','O21'),
-        ('venpreg','O22'),
-        ('utipreg','O23'),
-        ('malpreg','O25'),
-        ('multigest','O30'),
-        ('malpresent','O32'),
-        ('disprop','O33'),
-        ('abnorpelv','O34'),
-        ('fetalprob','O35'), ('fetalprob','O36'),
-        ('polyhydra','O40'),
-        ('abnamnio','O41'),
-        ('prom','O42'),
-        ('placental','O43'),
-        ('previa','O44'),
-        ('abrupt','O45'),
-        ('anh','O46'),
-        ('prolong','O48'),
-        ('preterm','O60'),
-        ('fail','O61'),
-        ('abnforce','O62'),
-        ('long','O63'),
-        ('malpres','O64'),
-        ('obspelvic','O65'), ('obspelvic','O66'),
-        ('iph','O67'),
-        ('distress','O68'),
-        ('umbilical','O69'),
-        ('laceration','O70'),
-        ('obstrau','O71'),
-        ('pph','O72'),
-        ('retained','O73'),
-        ('normal','O80'),
-        ('instrum','O81'),
-        ('caesar','O82'),
-        ('assisted','O83'),
-        ('multiple','O84'),
-        ('abortive','O00'), ('abortive','O01'), ('abortive','O02'), ('abortive','O03'),
-        ('abortive','O04'), ('abortive','O05'), ('abortive','O06'), ('abortive','O07'),
-        ('abortive','O08')
-    ) AS t(group_name, icd3)
+    -- Pregnancy condition groups (incl. abortive) from the shared condition registry
+    SELECT condition AS group_name, icd3
+    FROM condition_map
+    WHERE group_name = 'pregnancy'
 ),
 icd_groups AS (
     SELECT DISTINCT d.PSTV01, pm.group_name
@@ -173,10 +131,6 @@ or_calc AS (
         (total_non_abortus - c) AS d,
         total_abortus,
         total_non_abortus,
-        CASE WHEN a > 0 AND (total_abortus - a) > 0 AND c > 0 AND (total_non_abortus - c) > 0
-             THEN (a * (total_non_abortus - c)) / ((total_abortus - a) * c)
-             ELSE NULL END AS or_naive,
-        ((a+0.5) * (total_non_abortus - c + 0.5)) / ((total_abortus - a + 0.5) * (c + 0.5)) AS or_corr,
         CASE WHEN total_abortus > 0 THEN CAST(a AS DOUBLE) / total_abortus ELSE 0 END AS prevalence_abortus,
         CASE WHEN total_non_abortus > 0 THEN CAST(c AS DOUBLE) / total_non_abortus ELSE 0 END AS prevalence_non_abortus
     FROM contingency
@@ -185,17 +139,12 @@ or_ci AS (
     SELECT
         group_name,
         a, b, c, d,
-        COALESCE(or_naive, or_corr) AS odds_ratio,
+        odds_ratio(a, b, c, d) AS odds_ratio,
         prevalence_abortus,
         prevalence_non_abortus,
-        CASE WHEN or_naive IS NOT NULL AND a > 0 AND b > 0 AND c > 0 AND d > 0
-             THEN EXP(LN(or_naive) - 1.96 * SQRT(1.0/a + 1.0/b + 1.0/c + 1.0/d))
-             ELSE EXP(LN(or_corr) - 1.96 * SQRT(1.0/(a+0.5) + 1.0/(b+0.5) + 1.0/(c+0.5) + 1.0/(d+0.5)))
-        END AS ci_lower,
-        CASE WHEN or_naive IS NOT NULL AND a > 0 AND b > 0 AND c > 0 AND d > 0
-             THEN EXP(LN(or_naive) + 1.96 * SQRT(1.0/a + 1.0/b + 1.0/c + 1.0/d))
-             ELSE EXP(LN(or_corr) + 1.96 * SQRT(1.0/(a+0.5) + 1.0/(b+0.5) + 1.0/(c+0.5) + 1.0/(d+0.5)))
-        END AS ci_upper
+        or_ci_lower(a, b, c, d) AS ci_lower,
+        or_ci_upper(a, b, c, d) AS ci_upper,
+        or_p_value(a, b, c, d) AS p_value
     FROM or_calc
 ),
 ranked AS (
@@ -205,6 +154,7 @@ ranked AS (
         odds_ratio,
         ci_lower,
         ci_upper,
+        p_value,
         prevalence_abortus,
         prevalence_non_abortus,
         a, b, c, d
@@ -233,7 +183,7 @@ pairs AS (
       ON npc_ref.n_preg = 1
      AND npc_cmp.n_preg BETWEEN 2 AND 9
 ),
-n_preg_or_calc AS (
+n_preg_or_ci AS (
     SELECT
         ref_n_preg,
         cmp_n_preg,
@@ -241,28 +191,12 @@ n_preg_or_calc AS (
         b_ref AS b,
         a_cmp AS c,
         b_cmp AS d,
-        CASE WHEN a_ref > 0 AND b_ref > 0 AND a_cmp > 0 AND b_cmp > 0
-             THEN (a_ref * b_cmp)::DOUBLE / (b_ref * a_cmp)
-             ELSE NULL END AS or_naive,
-        ((a_ref + 0.5) * (b_cmp + 0.5))::DOUBLE / ((b_ref + 0.5) * (a_cmp + 0.5)) AS or_corr
+        odds_ratio(a_ref, b_ref, a_cmp, b_cmp) AS odds_ratio,
+        or_ci_lower(a_ref, b_ref, a_cmp, b_cmp) AS ci_lower,
+        or_ci_upper(a_ref, b_ref, a_cmp, b_cmp) AS ci_upper,
+        or_p_value(a_ref, b_ref, a_cmp, b_cmp) AS p_value
     FROM pairs
 ),
-n_preg_or_ci AS (
-    SELECT
-        ref_n_preg,
-        cmp_n_preg,
-        a, b, c, d,
-        COALESCE(or_naive, or_corr) AS odds_ratio,
-        CASE WHEN or_naive IS NOT NULL AND a > 0 AND b > 0 AND c > 0 AND d > 0
-             THEN EXP(LN(or_naive) - 1.96 * SQRT(1.0/a + 1.0/b + 1.0/c + 1.0/d))
-             ELSE EXP(LN(or_corr) - 1.96 * SQRT(1.0/(a+0.5) + 1.0/(b+0.5) + 1.0/(c+0.5) + 1.0/(d+0.5)))
-        END AS ci_lower,
-        CASE WHEN or_naive IS NOT NULL AND a > 0 AND b > 0 AND c > 0 AND d > 0
-             THEN EXP(LN(or_naive) + 1.96 * SQRT(1.0/a + 1.0/b + 1.0/c + 1.0/d))
-             ELSE EXP(LN(or_corr) + 1.96 * SQRT(1.0/(a+0.5) + 1.0/(b+0.5) + 1.0/(c+0.5) + 1.0/(d+0.5)))
-        END AS ci_upper
-    FROM n_preg_or_calc
-),
 preg_output AS (
     SELECT
         'preg_group' AS analysis_type,
@@ -271,7 +205,8 @@ preg_output AS (
         ROUND(odds_ratio, 3) AS odds_ratio,
         ROUND(ci_lower, 3) AS ci_lower,
         ROUND(ci_upper, 3) AS ci_upper,
-        CASE WHEN ci_lower IS NOT NULL AND ci_upper IS NOT NULL AND (ci_lower > 1 OR ci_upper < 1) THEN 'Significant' ELSE 'Not Significant' END AS significance,
+        p_value,
+        or_significance(ci_lower, ci_upper) AS significance,
         ROUND(prevalence_abortus * 100, 1) AS prevalence_abortus_pct,
         ROUND(prevalence_non_abortus * 100, 1) AS prevalence_non_abortus_pct,
         a AS cell_a,
@@ -290,7 +225,8 @@ n_preg_output AS (
         ROUND(odds_ratio, 3) AS odds_ratio,
         ROUND(ci_lower, 3) AS ci_lower,
         ROUND(ci_upper, 3) AS ci_upper,
-        CASE WHEN ci_lower IS NOT NULL AND ci_upper IS NOT NULL AND (ci_lower > 1 OR ci_upper < 1) THEN 'Significant' ELSE 'Not Significant' END AS significance,
+        p_value,
+        or_significance(ci_lower, ci_upper) AS significance,
         NULL::DOUBLE AS prevalence_abortus_pct,
         NULL::DOUBLE AS prevalence_non_abortus_pct,
         a AS cell_a,
@@ -313,6 +249,7 @@ SELECT
     odds_ratio,
     ci_lower,
     ci_upper,
+    p_value,
     significance,
     prevalence_abortus_pct,
     prevalence_non_abortus_pct,
@@ -1,52 +1,124 @@
 import duckdb
+import numpy as np
+import pandas as pd
 
-# OR Abortus (c_abortive) vs pregnancy-related columns + demographics from final_set.csv
+from icd_conditions import CONDITION_REGISTRY
+from or_stats import contingency_tensor, mantel_haenszel, odds_ratios, register_or_macros
+from pipeline_io import FREE_CONFLICTS_PATH, iter_frames, scan_sql
+
+# OR Abortus (c_abortive) vs pregnancy-related columns + demographics from final_set_free_conflicts.parquet
 # Dataset sudah dibersihkan sehingga tidak perlu lagi drop mask conflict ataupun filter age.
 # Output CSV menggabungkan:
 #   - OR untuk setiap kolom b_/c_/a_ kondisi kehamilan + age_risk/dom/subsid
 #   - OR untuk n_preg==1 dibanding n_preg==2..9
 # Hasil akhir ditulis ke or_preg_abort_combined.csv
+# Mode batch (BATCH_OUTCOMES): OR setiap outcome x exposure dalam satu scan -> or_preg_batch.csv (long format)
+# Mode strata (STRATA): OR per strata + Mantel-Haenszel pooled OR -> or_preg_stratified.csv
 
-PREGNANCY_GROUPS = [
-    'preecl', 'ecl', 'earlyhemo', 'heg', 'venpreg', 'utipreg', 'malpreg', 'multigest',
-    'malpresent', 'disprop', 'abnorpelv', 'fetalprob', 'polyhydra', 'abnamnio', 'prom',
-    'placental', 'previa', 'abrupt', 'anh', 'prolong', 'preterm', 'fail', 'abnforce', 'long',
-    'obspelvic', 'malpres', 'iph', 'distress', 'umbilical', 'laceration', 'obstrau',
-    'pph', 'retained', 'normal', 'instrum', 'caesar', 'assisted', 'multiple'
-]
+# Pregnancy condition groups from the shared condition registry (abortive is the outcome)
+PREGNANCY_GROUPS = [cond for cond in CONDITION_REGISTRY['pregnancy'] if cond != 'abortive']
 
 DEMO_COLS = ['age_risk', 'dom', 'subsid']
 ABORTIVE_COMPARISONS = ['b_abortive', 'a_abortive']
 
+# Outcome columns for the batch run, e.g. ['c_abortive', 'c_preecl', 'c_pph'] (empty: batch run off).
+# Each outcome is tested against the exposures above plus c_abortive, except itself.
+BATCH_OUTCOMES = []
+BATCH_CHUNKSIZE = 250_000
+
+# Stratification columns, e.g. ['dom', 'subsid'] or ['ref_year'] (empty: stratified run off).
+# Outcomes are BATCH_OUTCOMES (default c_abortive); the strata columns are not used as exposures.
+STRATA = []
+
 
-def build_union_blocks(columns):
-    blocks = []
-    for col in columns:
-        qcol = f'"{col}"'
-        blocks.append(
-            f"""
+def build_contingency(columns, outcome='c_abortive'):
+    # a/b/c/d cells of every exposure from one scan: UNPIVOT the 0/1 columns and GROUP BY exposure.
+    # Exposures with no non-null value still get a row (NULL cells), as in the per-column SUM blocks.
+    unpivot_cols = ", ".join(f'"{col}"' for col in columns)
+    casts = ", ".join(f'CAST("{col}" AS DOUBLE) AS "{col}"' for col in columns)
+    var_list = ", ".join(f"({i}, '{col}')" for i, col in enumerate(columns))
+    return f"""
             SELECT
-              '{col}' AS var,
-              SUM(CASE WHEN "c_abortive"=1 AND {qcol}=1 THEN 1 ELSE 0 END) AS a,
-              SUM(CASE WHEN "c_abortive"=1 AND {qcol}=0 THEN 1 ELSE 0 END) AS b,
-              SUM(CASE WHEN "c_abortive"=0 AND {qcol}=1 THEN 1 ELSE 0 END) AS c,
-              SUM(CASE WHEN "c_abortive"=0 AND {qcol}=0 THEN 1 ELSE 0 END) AS d
-            FROM final
-            WHERE "c_abortive" IS NOT NULL
-              AND {qcol} IS NOT NULL
+              v.var,
+              cells.a, cells.b, cells.c, cells.d
+            FROM (VALUES {var_list}) AS v(pos, var)
+            LEFT JOIN (
+              SELECT
+                var,
+                SUM(CASE WHEN y=1 AND x=1 THEN 1 ELSE 0 END) AS a,
+                SUM(CASE WHEN y=1 AND x=0 THEN 1 ELSE 0 END) AS b,
+                SUM(CASE WHEN y=0 AND x=1 THEN 1 ELSE 0 END) AS c,
+                SUM(CASE WHEN y=0 AND x=0 THEN 1 ELSE 0 END) AS d
+              FROM (
+                UNPIVOT (
+                  SELECT "{outcome}" AS y, {casts}
+                  FROM final
+                  WHERE "{outcome}" IS NOT NULL
+                )
+                ON {unpivot_cols}
+                INTO NAME var VALUE x
+              )
+              GROUP BY var
+            ) AS cells USING (var)
+            ORDER BY v.pos
             """
-        )
-    return " UNION ALL ".join(blocks)
+
+
+def batch_odds_ratios(path, outcomes, exposures, chunksize=BATCH_CHUNKSIZE):
+    # Long-format OR table (outcome, exposure, ...) for every pair from one pass over the file
+    columns = list(dict.fromkeys(outcomes + exposures))
+    cells = contingency_tensor(iter_frames(path, chunksize, columns), outcomes, exposures)
+    cells = cells[cells['outcome'] != cells['exposure']].reset_index(drop=True)
+    stats = odds_ratios(cells['a'], cells['b'], cells['c'], cells['d'])
+
+    out = pd.concat([cells, stats], axis=1)
+    out['abs_log_or'] = np.abs(np.log(out['odds_ratio']))
+    out['outcome'] = pd.Categorical(out['outcome'], categories=outcomes)
+    out = out.sort_values(['outcome', 'abs_log_or'], ascending=[True, False], kind='stable')
+    out['rank'] = out.groupby('outcome', observed=True).cumcount() + 1
+    out['significance'] = np.where(out['significant'], 'Significant', 'Not Significant')
+    out[['odds_ratio', 'ci_lower', 'ci_upper']] = out[['odds_ratio', 'ci_lower', 'ci_upper']].round(3)
+    out = out.rename(columns={'a': 'cell_a', 'b': 'cell_b', 'c': 'cell_c', 'd': 'cell_d'})
+    return out[['outcome', 'exposure', 'rank', 'odds_ratio', 'ci_lower', 'ci_upper', 'p_value',
+                'significance', 'cell_a', 'cell_b', 'cell_c', 'cell_d']]
+
+
+def stratified_odds_ratios(path, outcomes, exposures, strata, chunksize=BATCH_CHUNKSIZE):
+    # Per-stratum ORs and the Mantel-Haenszel pooled OR of every outcome x exposure, from one pass
+    columns = list(dict.fromkeys(outcomes + exposures + strata))
+    cells = contingency_tensor(iter_frames(path, chunksize, columns), outcomes, exposures, strata)
+    cells = cells[cells['outcome'] != cells['exposure']].reset_index(drop=True)
+
+    per_stratum = pd.concat([cells, odds_ratios(cells['a'], cells['b'], cells['c'], cells['d'])], axis=1)
+    per_stratum['analysis'] = 'stratum'
+    per_stratum['stratum'] = per_stratum[strata].astype(str).apply(
+        lambda row: ','.join(f"{col}={val}" for col, val in row.items()), axis=1)
+    per_stratum['n_strata'] = 1
+
+    pooled = mantel_haenszel(cells)
+    pooled['analysis'] = 'mantel_haenszel'
+    pooled['stratum'] = ' x '.join(strata)
+
+    out = pd.concat([pooled, per_stratum], ignore_index=True)
+    out['outcome'] = pd.Categorical(out['outcome'], categories=outcomes)
+    out['analysis'] = pd.Categorical(out['analysis'], categories=['mantel_haenszel', 'stratum'])
+    out = out.sort_values(['outcome', 'exposure', 'analysis'], kind='stable')
+    out['significance'] = np.where(out['significant'], 'Significant', 'Not Significant')
+    out[['odds_ratio', 'ci_lower', 'ci_upper']] = out[['odds_ratio', 'ci_lower', 'ci_upper']].round(3)
+    out = out.rename(columns={'a': 'cell_a', 'b': 'cell_b', 'c': 'cell_c', 'd': 'cell_d'})
+    return out[['outcome', 'exposure', 'analysis', 'stratum', 'n_strata', 'odds_ratio', 'ci_lower',
+                'ci_upper', 'p_value', 'significance', 'cell_a', 'cell_b', 'cell_c', 'cell_d']]
 
 
 def main():
     db = duckdb.connect()
+    register_or_macros(db)
 
     db.execute(
-        """
+        f"""
         CREATE OR REPLACE TABLE final AS
         SELECT *
-        FROM read_csv_auto('final_set_free_conflicts.csv')
+        FROM {scan_sql(FREE_CONFLICTS_PATH)}
         """
     )
 
@@ -56,9 +128,9 @@ def main():
     present_cols = set(lower_to_name.keys())
 
     if 'c_abortive' not in present_cols:
-        raise RuntimeError("Kolom 'c_abortive' tidak ditemukan di final_set.csv.")
+        raise RuntimeError(f"Kolom 'c_abortive' tidak ditemukan di {FREE_CONFLICTS_PATH}.")
     if 'n_preg' not in present_cols:
-        raise RuntimeError("Kolom 'n_preg' tidak ditemukan di final_set.csv.")
+        raise RuntimeError(f"Kolom 'n_preg' tidak ditemukan di {FREE_CONFLICTS_PATH}.")
 
     preg_set = set(PREGNANCY_GROUPS)
     exposure_cols = []
@@ -82,11 +154,11 @@ def main():
     if not exposure_cols:
         raise RuntimeError("Tidak ada kolom exposure yang cocok (b_/c_/a_ + demo).")
 
-    union_sql = build_union_blocks(exposure_cols)
+    base_sql = build_contingency(exposure_cols)
 
     combined_sql = f"""
     WITH base AS (
-      {union_sql}
+      {base_sql}
     ),
     stats AS (
       SELECT
@@ -99,8 +171,6 @@ def main():
           ELSE 'other'
         END AS group_prefix,
         a, b, c, d,
-        CASE WHEN a>0 AND b>0 AND c>0 AND d>0 THEN (a*d)/(b*c)::DOUBLE END AS or_naive,
-        ((a+0.5)*(d+0.5))/((b+0.5)*(c+0.5))::DOUBLE AS or_corr,
         (a + b) AS total_abortus,
         (c + d) AS total_non_abortus
       FROM base
@@ -112,15 +182,10 @@ def main():
         a, b, c, d,
         total_abortus,
         total_non_abortus,
-        COALESCE(or_naive, or_corr) AS odds_ratio,
-        CASE WHEN or_naive IS NOT NULL AND a>0 AND b>0 AND c>0 AND d>0
-             THEN EXP(LN(or_naive) - 1.96 * SQRT(1.0/a + 1.0/b + 1.0/c + 1.0/d))
-             ELSE EXP(LN(or_corr) - 1.96 * SQRT(1.0/(a+0.5) + 1.0/(b+0.5) + 1.0/(c+0.5) + 1.0/(d+0.5)))
-        END AS ci_lower,
-        CASE WHEN or_naive IS NOT NULL AND a>0 AND b>0 AND c>0 AND d>0
-             THEN EXP(LN(or_naive) + 1.96 * SQRT(1.0/a + 1.0/b + 1.0/c + 1.0/d))
-             ELSE EXP(LN(or_corr) + 1.96 * SQRT(1.0/(a+0.5) + 1.0/(b+0.5) + 1.0/(c+0.5) + 1.0/(d+0.5)))
-        END AS ci_upper,
+        odds_ratio(a, b, c, d) AS odds_ratio,
+        or_ci_lower(a, b, c, d) AS ci_lower,
+        or_ci_upper(a, b, c, d) AS ci_upper,
+        or_p_value(a, b, c, d) AS p_value,
         CASE WHEN total_abortus > 0 THEN CAST(a AS DOUBLE)/total_abortus ELSE NULL END AS prevalence_abortus,
         CASE WHEN total_non_abortus > 0 THEN CAST(c AS DOUBLE)/total_non_abortus ELSE NULL END AS prevalence_non_abortus
       FROM stats
@@ -133,7 +198,8 @@ def main():
         ROUND(odds_ratio, 3) AS odds_ratio,
         ROUND(ci_lower, 3) AS ci_lower,
         ROUND(ci_upper, 3) AS ci_upper,
-        CASE WHEN ci_lower IS NOT NULL AND ci_upper IS NOT NULL AND (ci_lower > 1 OR ci_upper < 1) THEN 'Significant' ELSE 'Not Significant' END AS significance,
+        p_value,
+        or_significance(ci_lower, ci_upper) AS significance,
         ROUND(prevalence_abortus * 100, 1) AS prevalence_abortus_pct,
         ROUND(prevalence_non_abortus * 100, 1) AS prevalence_non_abortus_pct,
         a AS cell_a,
@@ -168,7 +234,7 @@ def main():
         ON ref.n_preg = 1
        AND cmp.n_preg BETWEEN 2 AND 7
     ),
-    n_preg_or_calc AS (
+    n_preg_or_ci AS (
       SELECT
         ref_n_preg,
         cmp_n_preg,
@@ -176,28 +242,12 @@ def main():
         b_ref AS b,
         a_cmp AS c,
         b_cmp AS d,
-        CASE WHEN a_ref > 0 AND b_ref > 0 AND a_cmp > 0 AND b_cmp > 0
-             THEN (a_ref * b_cmp)::DOUBLE / (b_ref * a_cmp)
-             ELSE NULL END AS or_naive,
-        ((a_ref + 0.5) * (b_cmp + 0.5))::DOUBLE / ((b_ref + 0.5) * (a_cmp + 0.5)) AS or_corr
+        odds_ratio(a_ref, b_ref, a_cmp, b_cmp) AS odds_ratio,
+        or_ci_lower(a_ref, b_ref, a_cmp, b_cmp) AS ci_lower,
+        or_ci_upper(a_ref, b_ref, a_cmp, b_cmp) AS ci_upper,
+        or_p_value(a_ref, b_ref, a_cmp, b_cmp) AS p_value
       FROM pairs
     ),
-    n_preg_or_ci AS (
-      SELECT
-        ref_n_preg,
-        cmp_n_preg,
-        a, b, c, d,
-        COALESCE(or_naive, or_corr) AS odds_ratio,
-        CASE WHEN or_naive IS NOT NULL AND a>0 AND b>0 AND c>0 AND d>0
-             THEN EXP(LN(or_naive) - 1.96 * SQRT(1.0/a + 1.0/b + 1.0/c + 1.0/d))
-             ELSE EXP(LN(or_corr) - 1.96 * SQRT(1.0/(a+0.5) + 1.0/(b+0.5) + 1.0/(c+0.5) + 1.0/(d+0.5)))
-        END AS ci_lower,
-        CASE WHEN or_naive IS NOT NULL AND a>0 AND b>0 AND c>0 AND d>0
-             THEN EXP(LN(or_naive) + 1.96 * SQRT(1.0/a + 1.0/b + 1.0/c + 1.0/d))
-             ELSE EXP(LN(or_corr) + 1.96 * SQRT(1.0/(a+0.5) + 1.0/(b+0.5) + 1.0/(c+0.5) + 1.0/(d+0.5)))
-        END AS ci_upper
-      FROM n_preg_or_calc
-    ),
     n_preg_output AS (
       SELECT
         'n_preg_pair' AS analysis_type,
@@ -206,7 +256,8 @@ def main():
         ROUND(odds_ratio, 3) AS odds_ratio,
         ROUND(ci_lower, 3) AS ci_lower,
         ROUND(ci_upper, 3) AS ci_upper,
-        CASE WHEN ci_lower IS NOT NULL AND ci_upper IS NOT NULL AND (ci_lower > 1 OR ci_upper < 1) THEN 'Significant' ELSE 'Not Significant' END AS significance,
+        p_value,
+        or_significance(ci_lower, ci_upper) AS significance,
         NULL::DOUBLE AS prevalence_abortus_pct,
         NULL::DOUBLE AS prevalence_non_abortus_pct,
         a AS cell_a,
@@ -229,6 +280,7 @@ def main():
       odds_ratio,
       ci_lower,
       ci_upper,
+      p_value,
       significance,
       prevalence_abortus_pct,
       prevalence_non_abortus_pct,
@@ -247,6 +299,27 @@ def main():
     )
     print("Hasil disimpan ke or_preglvl_abort.csv")
 
+    if BATCH_OUTCOMES:
+        missing = [o for o in BATCH_OUTCOMES if o.lower() not in present_cols]
+        if missing:
+            raise RuntimeError(f"Kolom outcome {missing} tidak ditemukan di {FREE_CONFLICTS_PATH}.")
+        outcomes = [lower_to_name[o.lower()] for o in BATCH_OUTCOMES]
+        batch_exposures = exposure_cols + [lower_to_name['c_abortive']]
+        batch = batch_odds_ratios(FREE_CONFLICTS_PATH, outcomes, batch_exposures)
+        batch.to_csv('or_preg_batch.csv', index=False)
+        print(f"Batch OR {len(outcomes)} outcome x {len(batch_exposures)} exposure disimpan ke or_preg_batch.csv")
+
+    if STRATA:
+        missing = [col for col in STRATA + BATCH_OUTCOMES if col.lower() not in present_cols]
+        if missing:
+            raise RuntimeError(f"Kolom {missing} tidak ditemukan di {FREE_CONFLICTS_PATH}.")
+        strata = [lower_to_name[col.lower()] for col in STRATA]
+        outcomes = [lower_to_name[o.lower()] for o in BATCH_OUTCOMES] or [lower_to_name['c_abortive']]
+        strata_exposures = [col for col in exposure_cols + [lower_to_name['c_abortive']] if col not in strata]
+        stratified = stratified_odds_ratios(FREE_CONFLICTS_PATH, outcomes, strata_exposures, strata)
+        stratified.to_csv('or_preg_stratified.csv', index=False)
+        print(f"OR per strata ({' x '.join(strata)}) + Mantel-Haenszel disimpan ke or_preg_stratified.csv")
+
 
 if __name__ == '__main__':
     main()
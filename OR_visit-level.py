@@ -1,52 +1,57 @@
 import duckdb
 
+from icd_conditions import register_condition_map
+from or_stats import register_or_macros
+from pipeline_io import dx_columns
+
 # OR Abortus (O00–O08) vs selected pregnancy condition groups only
 # Visit-level computation (no patient aggregation)
 # Input:  `pregnancy by visit.csv`
-# Diagnose cols: FKP14A, FKL15A, FKL17A, FKL24A (first 3 chars)
+# Diagnose cols: FKP14A, FKL15A, FKL17A, FKL24A + extra FKL24B.. slots (ICD-3 codes)
 # Output: `OR_abortus_preg_visitlvl.csv`
 
 db = duckdb.connect(database=':memory:')
+register_condition_map(db)
+register_or_macros(db)
+
+VISIT_CSV = 'pregnancy by visit - validation 300.csv'
+
+# Every diagnosis column of the visit file, including extra FKL24B.. secondary-diagnosis slots
+visit_cols = [row[0] for row in db.execute(f"DESCRIBE SELECT * FROM read_csv_auto('{VISIT_CSV}', HEADER=TRUE)").fetchall()]
+dx_cols = dx_columns(visit_cols)
+codes = ", ".join(dx_cols)
+any_code = " OR ".join(f"{c} IS NOT NULL" for c in dx_cols)
 
-sql = """
+sql = f"""
 COPY (
 WITH base AS (
     SELECT 
         CAST(PSTV01 AS VARCHAR) AS PSTV01,
-        LEFT(UPPER(TRIM(FKP14A)), 3) AS code1,
-        LEFT(UPPER(TRIM(FKL15A)), 3) AS code2,
-        LEFT(UPPER(TRIM(FKL17A)), 3) AS code3,
-        LEFT(UPPER(TRIM(FKL24A)), 3) AS code4,
+        {codes},
         TRY_CAST(NULLIF(TRIM(CAST(age_risk AS VARCHAR)), '') AS INTEGER) AS age_risk,
         TRY_CAST(NULLIF(TRIM(CAST(dom AS VARCHAR)), '') AS INTEGER) AS dom,
         TRY_CAST(NULLIF(TRIM(CAST(subsid AS VARCHAR)), '') AS INTEGER) AS subsid,
         TRY_CAST(NULLIF(TRIM(CAST(n_preg AS VARCHAR)), '') AS INTEGER) AS n_preg
-    FROM read_csv_auto('pregnancy by visit - validation 300.csv', HEADER=TRUE)
+    FROM read_csv_auto('{VISIT_CSV}', HEADER=TRUE)
     WHERE age BETWEEN 12 AND 55
 ),
 
 visits_norm AS (
-    -- Keep only visits with at least one valid ICD-10 3-char code
+    -- Keep only visits with at least one ICD-3 code (invalid codes are already NULL in the store)
     SELECT 
         ROW_NUMBER() OVER () AS visit_id,
         PSTV01,
-        code1, code2, code3, code4,
+        {codes},
         age_risk,
         dom,
         subsid,
         n_preg,
-        CASE WHEN 
-            (code1 IS NOT NULL AND code1 ~ '^O0[0-8]$') OR
-            (code2 IS NOT NULL AND code2 ~ '^O0[0-8]$') OR
-            (code3 IS NOT NULL AND code3 ~ '^O0[0-8]$') OR
-            (code4 IS NOT NULL AND code4 ~ '^O0[0-8]$')
-        THEN 1 ELSE 0 END AS has_abortus
+        CASE WHEN EXISTS (
+            SELECT 1 FROM condition_map cm
+            WHERE cm.condition = 'abortive' AND cm.icd3 IN ({codes})
+        ) THEN 1 ELSE 0 END AS has_abortus
     FROM base
-    WHERE 
-        (code1 IS NOT NULL AND code1 ~ '^[A-Z][0-9]{2}$') OR
-        (code2 IS NOT NULL AND code2 ~ '^[A-Z][0-9]{2}$') OR
-        (code3 IS NOT NULL AND code3 ~ '^[A-Z][0-9]{2}$') OR
-        (code4 IS NOT NULL AND code4 ~ '^[A-Z][0-9]{2}$')
+    WHERE {any_code}
 ),
 
 overall_totals AS (
@@ -56,61 +61,21 @@ overall_totals AS (
     FROM visits_norm
 ),
 
--- Mapping of pregnancy groups to their ICD 3-char prefixes
+-- Pregnancy groups (incl. abortive) and their ICD 3-char codes from the shared condition registry
 preg_map AS (
-    SELECT * FROM (
-        VALUES
-        ('preecl','O11'), ('preecl','O14'),
-        ('ecl','O15'),
-        ('earlyhemo','O20'),
-        ('heg','O21'),
-        ('venpreg','O22'),
-        ('utipreg','O23'),
-        ('malpreg','O25'),
-        ('multigest','O30'),
-        ('malpresent','O32'),
-        ('disprop','O33'),
-        ('abnorpelv','O34'),
-        ('fetalprob','O35'), ('fetalprob','O36'),
-        ('polyhydra','O40'),
-        ('abnamnio','O41'),
-        ('prom','O42'),
-        ('placental','O43'),
-        ('previa','O44'),
-        ('abrupt','O45'),
-        ('anh','O46'),
-        ('prolong','O48'),
-        ('preterm','O60'),
-        ('fail','O61'),
-        ('abnforce','O62'),
-        ('long','O63'),
-        ('malpres','O64'),
-        ('obspelvic','O65'), ('obspelvic','O66'),
-        ('iph','O67'),
-        ('distress','O68'),
-        ('umbilical','O69'),
-        ('laceration','O70'),
-        ('obstrau','O71'),
-        ('pph','O72'),
-        ('retained','O73'),
-        ('normal','O80'),
-        ('instrum','O81'),
-        ('caesar','O82'),
-        ('assisted','O83'),
-        ('multiple','O84'),
-        -- include abortive codes as in original mapping
-        ('abortive','O00'), ('abortive','O01'), ('abortive','O02'), ('abortive','O03'),
-        ('abortive','O04'), ('abortive','O05'), ('abortive','O06'), ('abortive','O07'),
-        ('abortive','O08')
-    ) AS t(group_name, icd3)
+    SELECT condition AS group_name, icd3
+    FROM condition_map
+    WHERE group_name = 'pregnancy'
 ),
 
 -- Presence of each selected pregnancy group per visit (row)
 visit_groups AS (
-    SELECT DISTINCT v.visit_id, pm.group_name
-    FROM visits_norm v
-    JOIN preg_map pm
-      ON v.code1 = pm.icd3 OR v.code2 = pm.icd3 OR v.code3 = pm.icd3 OR v.code4 = pm.icd3
+    SELECT DISTINCT vc.visit_id, pm.group_name
+    FROM (
+        SELECT visit_id, UNNEST([{codes}]) AS icd3
+        FROM visits_norm
+    ) vc
+    JOIN preg_map pm USING (icd3)
 ),
 
 demographic_groups AS (
@@ -205,40 +170,17 @@ contingency AS (
     SELECT * FROM npreg_contingency
 ),
 
-or_calc AS (
-    SELECT
-        group_name,
-        a,
-        b,
-        c,
-        d,
-        total_abortus,
-        total_non_abortus,
-        CASE WHEN a > 0 AND b > 0 AND c > 0 AND d > 0
-             THEN (a * d) / (b * c)
-             ELSE NULL END AS or_naive,
-        ((a+0.5) * (d+0.5)) / ((b+0.5) * (c+0.5)) AS or_corr,
-        CASE WHEN total_abortus > 0 THEN CAST(a AS DOUBLE) / total_abortus ELSE 0 END AS prevalence_abortus,
-        CASE WHEN total_non_abortus > 0 THEN CAST(c AS DOUBLE) / total_non_abortus ELSE 0 END AS prevalence_non_abortus
-    FROM contingency
-),
-
 or_ci AS (
     SELECT
         group_name,
         a, b, c, d,
-        COALESCE(or_naive, or_corr) AS odds_ratio,
-        prevalence_abortus,
-        prevalence_non_abortus,
-        CASE WHEN or_naive IS NOT NULL AND a > 0 AND b > 0 AND c > 0 AND d > 0
-             THEN EXP(LN(or_naive) - 1.96 * SQRT(1.0/a + 1.0/b + 1.0/c + 1.0/d))
-             ELSE EXP(LN(or_corr) - 1.96 * SQRT(1.0/(a+0.5) + 1.0/(b+0.5) + 1.0/(c+0.5) + 1.0/(d+0.5)))
-        END AS ci_lower,
-        CASE WHEN or_naive IS NOT NULL AND a > 0 AND b > 0 AND c > 0 AND d > 0
-             THEN EXP(LN(or_naive) + 1.96 * SQRT(1.0/a + 1.0/b + 1.0/c + 1.0/d))
-             ELSE EXP(LN(or_corr) + 1.96 * SQRT(1.0/(a+0.5) + 1.0/(b+0.5) + 1.0/(c+0.5) + 1.0/(d+0.5)))
-        END AS ci_upper
-    FROM or_calc
+        odds_ratio(a, b, c, d) AS odds_ratio,
+        CASE WHEN total_abortus > 0 THEN CAST(a AS DOUBLE) / total_abortus ELSE 0 END AS prevalence_abortus,
+        CASE WHEN total_non_abortus > 0 THEN CAST(c AS DOUBLE) / total_non_abortus ELSE 0 END AS prevalence_non_abortus,
+        or_ci_lower(a, b, c, d) AS ci_lower,
+        or_ci_upper(a, b, c, d) AS ci_upper,
+        or_p_value(a, b, c, d) AS p_value
+    FROM contingency
 ),
 
 ranked AS (
@@ -248,6 +190,7 @@ ranked AS (
         odds_ratio,
         ci_lower,
         ci_upper,
+        p_value,
         prevalence_abortus,
         prevalence_non_abortus,
         a, b, c, d
@@ -260,9 +203,10 @@ SELECT
     ROUND(odds_ratio, 3) AS odds_ratio,
     ROUND(ci_lower, 3) AS ci_lower,
     ROUND(ci_upper, 3) AS ci_upper,
+    p_value,
     ROUND(prevalence_abortus * 100, 1) AS prevalence_abortus_pct,
     ROUND(prevalence_non_abortus * 100, 1) AS prevalence_non_abortus_pct,
-    CASE WHEN ci_lower IS NOT NULL AND ci_upper IS NOT NULL AND (ci_lower > 1 OR ci_upper < 1) THEN 'Significant' ELSE 'Not Significant' END AS significance,
+    or_significance(ci_lower, ci_upper) AS significance,
     a AS abortus_with_group,
     b AS abortus_without_group,
     c AS non_abortus_with_group,
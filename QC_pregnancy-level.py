@@ -1,89 +1,137 @@
+import duckdb
 import pandas as pd
-import numpy as np
 
-# ---------- QC pregnancy-level ----------
-def run_qc_pregnancy(csv_path,
-                     out_prefix="qc_preg",
-                     export=True):
-    # 1) load
-    df = pd.read_csv(csv_path)
-    print(f"Loaded {len(df):,} rows from {csv_path}")
+from pipeline_io import FINAL_SET_PATH, scan_sql
 
-    # 2) completeness
-    required_cols = ["PSTV01", "age", "age_risk", "dom", "subsid"]
-    missing_req = df[df[required_cols].isnull().any(axis=1)]
+# Bit per QC check in qc_flags; every check is evaluated in the same scan of the final set
+QC_FLAGS = {
+    "missing_required":    1,    # PSTV01/age/age_risk/dom/subsid kosong
+    "missing_abc":         2,    # semua kolom a_/b_/c_ kosong
+    "age_out_of_range":    4,    # age < 12 atau > 55
+    "age_oob_patient":     8,    # pasien punya minimal satu baris age_out_of_range
+    "duplicate_key":      16,    # (PSTV01, n_preg) muncul lebih dari sekali
+    "validation_conflict": 32,   # c_abortive = 1 bersama variabel persalinan
+}
 
-    # cari kolom prefix a_, b_, c_ yang ada di file
-    a_cols = [c for c in df.columns if c.startswith("a_")]
-    b_cols = [c for c in df.columns if c.startswith("b_")]
-    c_cols = [c for c in df.columns if c.startswith("c_")]
-    abc_cols = a_cols + b_cols + c_cols
+# c_abortive co-occurrence with delivery/labor vars
+CONFLICT_COLS = [
+    "c_preecl", "c_ecl", "c_anh", "c_prev", "c_previa", "c_abrupt",
+    "c_polyhydra", "c_abnamnio", "c_prom", "c_prolong", "c_preterm",
+    "c_fail", "c_abnforce", "c_long", "c_malpres", "c_obspelvic", "c_iph",
+    "c_distress", "c_umbilical", "c_laceration", "c_obstrau", "c_pph",
+    "c_retained", "c_normal", "c_instrum", "c_caesar", "c_assisted",
+    "c_multiple", "c_disprop", "c_malpresent", "c_abnorpelv", "c_placental"
+]
 
-    if len(abc_cols) == 0:
-        # kalau memang tidak ada kolom a_/b_/c_ di file, seluruh baris dianggap gagal kriteria "minimal satu a_/b_/c_"
-        missing_abc = df.copy()
-    else:
-        missing_abc = df[df[abc_cols].isnull().all(axis=1)]
 
-    completeness_fail = pd.concat([missing_req, missing_abc]).drop_duplicates()
+def q(col):
+    return f'"{col}"'
 
-    # 3) accuracy (umur)
-    age_oob = df[(df["age"] < 12) | (df["age"] > 55)]
-    oob_patients = df[df["PSTV01"].isin(age_oob["PSTV01"])]
 
-    # 4) consistency (duplikasi PSTV01 + n_preg)
-    if "n_preg" not in df.columns:
-        raise KeyError("Kolom 'n_preg' tidak ditemukan di file. Pastikan 'final set.csv' punya kolom n_preg.")
+def has_flag(name):
+    return f"(qc_flags & {QC_FLAGS[name]}) <> 0"
 
-    dup_mask = df.duplicated(subset=["PSTV01", "n_preg"], keep=False)
-    dup_pairs = df[dup_mask].sort_values(["PSTV01", "n_preg"])
 
-    # opsional: rekap jumlah dupe per key
-    dup_summary = (dup_pairs
-                   .groupby(["PSTV01", "n_preg"])
-                   .size()
-                   .reset_index(name="dup_count")
-                   .sort_values("dup_count", ascending=False))
+# ---------- QC pregnancy-level ----------
+def run_qc_pregnancy(path,
+                     out_prefix="qc_preg",
+                     export=True):
+    con = duckdb.connect()
 
-    # 5) validation: c_abortive co-occurrence with delivery/labor vars
-    requested_conflict_cols = [
-        "c_preecl", "c_ecl", "c_anh", "c_prev", "c_previa", "c_abrupt",
-        "c_polyhydra", "c_abnamnio", "c_prom", "c_prolong", "c_preterm",
-        "c_fail", "c_abnforce", "c_long", "c_malpres", "c_obspelvic", "c_iph",
-        "c_distress", "c_umbilical", "c_laceration", "c_obstrau", "c_pph",
-        "c_retained", "c_normal", "c_instrum", "c_caesar", "c_assisted",
-        "c_multiple", "c_disprop", "c_malpresent", "c_abnorpelv", "c_placental"
-    ]
-    present_conflict_cols = [c for c in requested_conflict_cols if c in df.columns]
-
-    if "c_abortive" not in df.columns:
+    # 1) load (lazily: the file is only scanned by the tagging query)
+    con.execute(f"CREATE TEMP VIEW final AS SELECT * FROM {scan_sql(path)}")
+    columns = [row[0] for row in con.execute("DESCRIBE final").fetchall()]
+
+    if "n_preg" not in columns:
+        raise KeyError("Kolom 'n_preg' tidak ditemukan di file. Pastikan final set punya kolom n_preg.")
+    if "c_abortive" not in columns:
         raise KeyError("Kolom 'c_abortive' tidak ditemukan untuk validasi.")
 
+    # 2) completeness
+    required_cols = ["PSTV01", "age", "age_risk", "dom", "subsid"]
+    missing_req = " OR ".join(f"{q(c)} IS NULL" for c in required_cols)
+
+    # cari kolom prefix a_, b_, c_ yang ada di file; kalau tidak ada, seluruh baris dianggap gagal
+    abc_cols = [c for c in columns if c.startswith(("a_", "b_", "c_"))]
+    missing_abc = " AND ".join(f"{q(c)} IS NULL" for c in abc_cols) or "TRUE"
+
+    # 3) accuracy (umur)
+    age_oob = '"age" < 12 OR "age" > 55'
+
+    # 5) validation: c_abortive co-occurrence with delivery/labor vars
+    present_conflict_cols = [c for c in CONFLICT_COLS if c in columns]
     if present_conflict_cols:
-        conflict_sum = df[present_conflict_cols].fillna(0).sum(axis=1)
-        validation_mask = (df["c_abortive"] == 1) & (conflict_sum > 0)
-        validation_conflicts = df[validation_mask]
+        conflict_sum = " + ".join(f"COALESCE({q(c)}, 0)" for c in present_conflict_cols)
+        conflict = f'"c_abortive" = 1 AND ({conflict_sum}) > 0'
     else:
-        validation_conflicts = df.iloc[0:0].copy()
+        conflict = "FALSE"
+
+    # Tag every row with the bitmask of failed checks in one scan
+    # (4: consistency = duplicate (PSTV01, n_preg) keys, via a window count)
+    con.execute(f"""
+    CREATE TEMP TABLE qc AS
+    WITH numbered AS (
+      SELECT *, ROW_NUMBER() OVER () AS qc_row,
+             COALESCE({age_oob}, FALSE) AS qc_age_oob
+      FROM final
+    )
+    SELECT
+      * EXCLUDE (qc_age_oob),
+        (CASE WHEN {missing_req} THEN {QC_FLAGS['missing_required']} ELSE 0 END)
+      + (CASE WHEN {missing_abc} THEN {QC_FLAGS['missing_abc']} ELSE 0 END)
+      + (CASE WHEN qc_age_oob THEN {QC_FLAGS['age_out_of_range']} ELSE 0 END)
+      + (CASE WHEN BOOL_OR(qc_age_oob) OVER (PARTITION BY "PSTV01") THEN {QC_FLAGS['age_oob_patient']} ELSE 0 END)
+      + (CASE WHEN COUNT(*) OVER (PARTITION BY "PSTV01", "n_preg") > 1 THEN {QC_FLAGS['duplicate_key']} ELSE 0 END)
+      + (CASE WHEN COALESCE({conflict}, FALSE) THEN {QC_FLAGS['validation_conflict']} ELSE 0 END)
+      AS qc_flags
+    FROM numbered
+    """)
+
+    # Per-check relations, all derived from the tagged table (rows in file order)
+    all_cols = ", ".join(q(c) for c in columns)
+    rows = "* EXCLUDE (qc_row, qc_flags)"
+    relations = {
+        # missing_required rows first, then missing_abc; identical rows kept once (drop_duplicates)
+        "completeness_fail": f"""
+            SELECT {rows} FROM qc
+            WHERE {has_flag('missing_required')} OR {has_flag('missing_abc')}
+            QUALIFY ROW_NUMBER() OVER (PARTITION BY {all_cols}
+                                       ORDER BY {has_flag('missing_required')} DESC, qc_row) = 1
+            ORDER BY {has_flag('missing_required')} DESC, qc_row""",
+        "age_oob_rows": f"SELECT {rows} FROM qc WHERE {has_flag('age_out_of_range')} ORDER BY qc_row",
+        "age_oob_patients_all_rows": f"SELECT {rows} FROM qc WHERE {has_flag('age_oob_patient')} ORDER BY qc_row",
+        "duplicates_rows": f"""
+            SELECT {rows} FROM qc WHERE {has_flag('duplicate_key')}
+            ORDER BY "PSTV01", "n_preg", qc_row""",
+        # opsional: rekap jumlah dupe per key
+        "duplicates_summary": f"""
+            SELECT "PSTV01", "n_preg", COUNT(*) AS dup_count FROM qc WHERE {has_flag('duplicate_key')}
+            GROUP BY ALL
+            ORDER BY dup_count DESC, "PSTV01", "n_preg"
+        """,
+        "validation_conflicts": f"SELECT {rows} FROM qc WHERE {has_flag('validation_conflict')} ORDER BY qc_row",
+    }
+
+    counts = {name: con.execute(f"SELECT COUNT(*) FROM ({sql})").fetchone()[0]
+              for name, sql in relations.items()}
+    rows_total = con.execute("SELECT COUNT(*) FROM qc").fetchone()[0]
+    print(f"Loaded {rows_total:,} rows from {path}")
 
     # 6) ringkasan
     summary = {
-        "rows_total": len(df),
-        "completeness_fail": len(completeness_fail),
-        "age_out_of_range": len(age_oob),
-        "duplicate_pstv01_npreg_keys": dup_summary.shape[0],
-        "validation_conflicts": len(validation_conflicts),
+        "rows_total": rows_total,
+        "completeness_fail": counts["completeness_fail"],
+        "age_out_of_range": counts["age_oob_rows"],
+        "duplicate_pstv01_npreg_keys": counts["duplicates_summary"],
+        "validation_conflicts": counts["validation_conflicts"],
     }
 
     # 7) export
     if export:
-        completeness_fail.to_csv(f"{out_prefix}_completeness_fail.csv", index=False)
-        age_oob.to_csv(f"{out_prefix}_age_oob_rows.csv", index=False)
-        oob_patients.to_csv(f"{out_prefix}_age_oob_patients_all_rows.csv", index=False)
-        dup_pairs.to_csv(f"{out_prefix}_duplicates_rows.csv", index=False)
-        dup_summary.to_csv(f"{out_prefix}_duplicates_summary.csv", index=False)
-        # explicit file name as requested
-        validation_conflicts.to_csv("qc_final_validation.csv", index=False)
+        for name, sql in relations.items():
+            # explicit file name as requested for the validation conflicts
+            out = "qc_final_validation.csv" if name == "validation_conflicts" else f"{out_prefix}_{name}.csv"
+            con.execute(f"COPY ({sql}) TO '{out}' (HEADER, DELIMITER ',')")
         pd.DataFrame([summary]).to_markdown(f"{out_prefix}_summary.md", index=False)
 
     return summary
@@ -92,7 +140,7 @@ def run_qc_pregnancy(csv_path,
 # ---------- main ----------
 if __name__ == "__main__":
     summary = run_qc_pregnancy(
-        csv_path="final_set.csv",
+        path=FINAL_SET_PATH,
         out_prefix="qc_pregnancy",
         export=True
     )
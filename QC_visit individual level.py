@@ -1,51 +1,120 @@
+import os
+
 import duckdb
 import pandas as pd
 import numpy as np
 
+from pipeline_io import VISIT_PATH, dx_columns, iter_frames
+
+# Rows per chunk: the visit table is checked chunk by chunk, so memory does not grow with the
+# file (None reads the whole file at once)
+QC_CHUNKSIZE = 1_000_000
+
+
+class CsvAppender:
+    # Writes each output file with a header on the first chunk and appends after that
+    def __init__(self):
+        self.started = set()
+
+    def write(self, df, path):
+        df.to_csv(path, mode="a" if path in self.started else "w",
+                  header=path not in self.started, index=False)
+        self.started.add(path)
+
+
+def drop_duplicate_rows(src, dst=None):
+    # drop_duplicates out of core: DuckDB keeps the first occurrence of every row and spills to
+    # disk instead of holding the rows in memory; returns the deduplicated count. Rows come out
+    # missing_required first, then missing_dx, each in file order (qc_row = global row number),
+    # as the pregnancy QC does. Values are read back as text, so the rows are written out
+    # exactly as pandas wrote them.
+    con = duckdb.connect()
+    con.execute(f"""CREATE TEMP VIEW part AS
+        SELECT * REPLACE (CAST(qc_row AS BIGINT) AS qc_row, CAST(qc_missing_required AS INTEGER) AS qc_missing_required)
+        FROM read_csv('{src}', header = true, all_varchar = true)""")
+    columns = [row[0] for row in con.execute("DESCRIBE part").fetchall()
+               if row[0] not in ("qc_row", "qc_missing_required")]
+    all_cols = ", ".join(f'"{c}"' for c in columns)
+    sql = f"""SELECT * EXCLUDE (qc_row, qc_missing_required) FROM part
+        QUALIFY ROW_NUMBER() OVER (PARTITION BY {all_cols} ORDER BY qc_missing_required DESC, qc_row) = 1
+        ORDER BY qc_missing_required DESC, qc_row"""
+    if dst is not None:
+        con.execute(f"COPY ({sql}) TO '{dst}' (HEADER, DELIMITER ',')")
+    count = con.execute(f"SELECT COUNT(*) FROM ({sql})").fetchone()[0]
+    con.close()
+    return count
+
+
 # ---------- fungsi utama QC ----------
-def run_qc_visit(csv_path, out_prefix="qc_pregvisit",
+def run_qc_visit(path, out_prefix="qc_pregvisit",
                  date_min="2015-01-01", date_max="2023-12-31",
-                 export=True):
+                 export=True, chunksize=QC_CHUNKSIZE):
 
-    # --- 1. baca data ---
-    df = pd.read_csv(csv_path)
-    print(f"Loaded {len(df):,} rows from {csv_path}")
-
-    # --- 2. completeness ---
     required_cols = ["PSTV01", "combined_date", "age", "age_risk", "dom", "subsid"]
-    dx_cols = ["FKP14A", "FKL15A", "FKL17A", "FKL24A"]
-
-    missing_req = df[df[required_cols].isnull().any(axis=1)]
-    missing_dx = df[df[dx_cols].isnull().all(axis=1)]
-    completeness_fail = pd.concat([missing_req, missing_dx]).drop_duplicates()
-
-    # --- 3. accuracy ---
-    age_oob = df[(df["age"] < 12) | (df["age"] > 55)]
-    oob_patients = df[df["PSTV01"].isin(age_oob["PSTV01"])]
-
-    # --- 4. consistency ---
-    date_cols = [c for c in ["combined_date", "ref_start", "fin_g"] if c in df.columns]
-    for c in date_cols:
-        df[c] = pd.to_datetime(df[c], errors="coerce")
-    out_of_range = df[
-        ((df[date_cols] < date_min).any(axis=1)) |
-        ((df[date_cols] > date_max).any(axis=1))
-    ]
-
-    # --- ringkasan sederhana ---
     summary = {
-        "rows_total": len(df),
-        "completeness_fail": len(completeness_fail),
-        "age_out_of_range": len(age_oob),
-        "temporal_out_of_range": len(out_of_range)
+        "rows_total": 0,
+        "completeness_fail": 0,
+        "age_out_of_range": 0,
+        "temporal_out_of_range": 0
     }
+    out = CsvAppender()
+    fail_path = f"{out_prefix}_completeness_fail.csv"
+    fail_part = f"{out_prefix}_completeness_fail.part.csv"   # per-chunk failures, deduplicated at the end
+    oob_ids = set()          # PSTV01 with at least one visit outside the age range
+    header = None           # empty frame with the visit columns, for header-only outputs
+
+    # --- 1. baca data (per chunk) ---
+    for df in iter_frames(path, chunksize):
+        header = df.iloc[:0]
+        offset = summary["rows_total"]
+        summary["rows_total"] += len(df)
+
+        # --- 2. completeness ---
+        dx_cols = dx_columns(df.columns)
+        missing_req = df[required_cols].isnull().any(axis=1).to_numpy()
+        missing_dx = df[dx_cols].isnull().all(axis=1).to_numpy()
+
+        # duplicates within and across chunks are dropped after the loop (drop_duplicate_rows),
+        # ordered on the missing_required flag and the global row number written here
+        fail = missing_req | missing_dx
+        completeness_fail = df[fail].assign(qc_missing_required=missing_req[fail].astype(int),
+                                            qc_row=offset + np.flatnonzero(fail))
+        out.write(completeness_fail, fail_part)
+
+        # --- 3. accuracy ---
+        age_oob = df[(df["age"] < 12) | (df["age"] > 55)]
+        oob_ids.update(age_oob["PSTV01"])
+        summary["age_out_of_range"] += len(age_oob)
+
+        # --- 4. consistency ---
+        date_cols = [c for c in ["combined_date", "ref_start", "fin_g"] if c in df.columns]
+        for c in date_cols:
+            df[c] = pd.to_datetime(df[c], errors="coerce")
+        out_of_range = df[
+            ((df[date_cols] < date_min).any(axis=1)) |
+            ((df[date_cols] > date_max).any(axis=1))
+        ]
+        summary["temporal_out_of_range"] += len(out_of_range)
+
+        # --- 5. simpan bila perlu (append per chunk) ---
+        if export:
+            out.write(age_oob, f"{out_prefix}_age_oob_rows.csv")
+            out.write(out_of_range, f"{out_prefix}_date_window_violations.csv")
+
+    if fail_part in out.started:
+        summary["completeness_fail"] = drop_duplicate_rows(fail_part, fail_path if export else None)
+        os.remove(fail_part)
+
+    print(f"Loaded {summary['rows_total']:,} rows from {path}")
 
-    # --- 5. simpan bila perlu ---
     if export:
-        completeness_fail.to_csv(f"{out_prefix}_completeness_fail.csv", index=False)
-        age_oob.to_csv(f"{out_prefix}_age_oob_rows.csv", index=False)
-        oob_patients.to_csv(f"{out_prefix}_age_oob_patients_all_rows.csv", index=False)
-        out_of_range.to_csv(f"{out_prefix}_date_window_violations.csv", index=False)
+        # All visits of the out-of-range patients need the full patient set: second pass
+        oob_path = f"{out_prefix}_age_oob_patients_all_rows.csv"
+        if oob_ids:
+            for df in iter_frames(path, chunksize):
+                out.write(df[df["PSTV01"].isin(oob_ids)], oob_path)
+        elif header is not None:
+            out.write(header, oob_path)
         pd.DataFrame([summary]).to_markdown(f"{out_prefix}_summary.md", index=False)
 
     return summary
@@ -54,7 +123,7 @@ def run_qc_visit(csv_path, out_prefix="qc_pregvisit",
 # ---------- main ----------
 if __name__ == "__main__":
     summary = run_qc_visit(
-        csv_path="pregnancy by visit.csv",
+        path=VISIT_PATH,
         out_prefix="qc_pregvisit",
         export=True
     )
@@ -1,13 +1,15 @@
 import duckdb
 
+from pipeline_io import FINAL_SET_PATH, FREE_CONFLICTS_PATH, csv_path, scan_sql
+
 """
-Filter final_set.csv with two-step dropping and report counts per step:
+Filter final_set.parquet with two-step dropping and report counts per step:
 1) Age filter: keep age between 12 and 55
 2) Validation conflicts (as defined in or_free_conflicts.py):
    - A row is conflicted if c_abortive = 1 AND any present conflict column > 0
    - Drop only the conflicted rows (row-level), not all rows for the PSTV01
 
-Output: final_set_free_conflicts.csv
+Output: final_set_free_conflicts.parquet (+ final_set_free_conflicts.csv if EXPORT_CSV)
 Printed counts:
 - Original rows
 - Dropped by age
@@ -26,15 +28,18 @@ CONFLICT_COLS = [
     'c_multiple', 'c_disprop', 'c_malpresent', 'c_abnorpelv', 'c_placental'
 ]
 
+# Also export the filtered set as CSV next to the Parquet file
+EXPORT_CSV = False
+
 
 def main():
     db = duckdb.connect()
 
-    # Load CSV
+    # Load final set
     db.execute(
-        """
+        f"""
         CREATE OR REPLACE TABLE raw_final AS
-        SELECT * FROM read_csv_auto('final_set.csv')
+        SELECT * FROM {scan_sql(FINAL_SET_PATH)}
         """
     )
 
@@ -43,11 +48,11 @@ def main():
     present_cols = set(cols)
 
     if 'pstv01' not in present_cols:
-        raise RuntimeError("Kolom 'PSTV01' tidak ditemukan di final_set.csv.")
+        raise RuntimeError(f"Kolom 'PSTV01' tidak ditemukan di {FINAL_SET_PATH}.")
     if 'c_abortive' not in present_cols:
-        raise RuntimeError("Kolom 'c_abortive' tidak ditemukan di final_set.csv.")
+        raise RuntimeError(f"Kolom 'c_abortive' tidak ditemukan di {FINAL_SET_PATH}.")
     if 'age' not in present_cols:
-        raise RuntimeError("Kolom 'age' tidak ditemukan di final_set.csv.")
+        raise RuntimeError(f"Kolom 'age' tidak ditemukan di {FINAL_SET_PATH}.")
 
     present_conflicts = [c for c in CONFLICT_COLS if c.lower() in present_cols]
 
@@ -92,14 +97,16 @@ def main():
     n_final = db.execute("SELECT COUNT(*) FROM final_filtered").fetchone()[0]
 
     # Write output
-    db.execute("COPY final_filtered TO 'final_set_free_conflicts.csv' (HEADER, DELIMITER ',')")
+    db.execute(f"COPY final_filtered TO '{FREE_CONFLICTS_PATH}' (FORMAT PARQUET)")
+    if EXPORT_CSV:
+        db.execute(f"COPY final_filtered TO '{csv_path(FREE_CONFLICTS_PATH)}' (HEADER, DELIMITER ',')")
 
     print(f"Original rows:                 {n_original}")
     print(f"Dropped by age (12-55):        {n_dropped_age}")
     print(f"Rows after age filter:         {n_after_age}")
     print(f"Dropped by validation conflicts:{n_dropped}")
     print(f"Final rows:                    {n_final}")
-    print("Output saved to final_set_free_conflicts.csv")
+    print(f"Output saved to {FREE_CONFLICTS_PATH}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,155 @@
+"""
+Condition registry shared by the generation and OR scripts.
+
+Every condition is defined once here, per group: a list of ICD-3 codes or, for the
+`regex` group, a pattern matched against every ICD-3 code (REGEX_MATCH sets
+whether it must match the whole code). `condition_map()` expands the registry over the
+ICD-3 code table into one (group_name, condition, icd3) row per match, and
+`register_condition_map()` loads that table into DuckDB so the scripts join against
+it instead of carrying their own code lists.
+"""
+
+import re
+
+import pandas as pd
+
+from pipeline_io import ICD3_CODES
+
+# Chronic conditions
+chronic_conditions = {
+    'dm': ['E10','E11','E12','E13','E14','O24'],
+    'malnut': ['E40','E41','E42','E43','E44','E45','E46'],
+    'nutri': ['E50','E51','E52','E53','E54','E55','E56','E57','E58','E59','E60','E61','E62','E63','E64'],
+    'obese': ['E66'],
+    'substance': ['F10','F11','F12','F13','F14','F15','F16','F17','F18','F19'],
+    'schizo': ['F20','F21','F22','F23','F24','F25','F28','F29'],
+    'neurot': ['F40','F41','F42','F43','F44','F48','F45'],
+    'neu_deg': ['G10','G11','G12','G20','G21','G22','G23','G24','G25','G26','G30','G31','G32','G35','G36','G37'],
+    'headache': ['G43','G44'],
+    'neuropathy': ['G50','G51','G52','G53','G54','G55','G56','G57','G58','G59','G60','G61','G62','G63','G64'],
+    'rhd': ['I05','I06','I07','I08','I09'],
+    'ht': ['I10','I11','I12','I13','I14','I15','O10','O13','O16'],
+    'isch': ['I20','I21','I22','I23','I24','I25'],
+    'phd': ['I26','I27','I28'],
+    'carditis': ['I30','I32','I33','I38','I39','I40','I41'],
+    'cmp': ['I42','I43'],
+    'arrythmia': ['I44','I45','I47','I48','I49'],
+    'hf': ['I50'],
+    'stroke': ['I60','I61','I62','I63','I64','I69'],
+    'artery': ['I70','I71','I72','I73','I74','I77','I78','I79'],
+    'vein': ['I80','I81','I82','I83','I85','I86','I87','I88','I89'],
+    'chronic_res': ['J35','J37','J40','J41','J42','J43','J44','J45'],
+    'pul_edema': ['J81'],
+    'pleura': ['J90','J91','J92','J93','J94'],
+    'oral': ['K00','K01','K02','K03','K04','K05','K06','K07','K08','K09','K10','K11','K12','K13','K14'],
+    'gastritis': ['K22','K25','K26','K27','K28','K29','K30'],
+    'hernia': ['K40','K41','K42','K43','K44','K45','K46'],
+    'intestinal': ['K50','K51','K52','K56','K58','K59','K60','K61','K62','K63'],
+    'hemorrh': ['K64'],
+    'periton': ['K65'],
+    'liver_fail': ['K72'],
+    'liver': ['K70','K71','K73','K74','K75','K76'],
+    'gallbladder': ['K80','K81','K82','K83'],
+    'pancreas': ['K85','K86'],
+    'bullous': ['L10','L11','L12','L13','L14'],
+    'atopic': ['L20'],
+    'dermatitis': ['L21','L23','L25','L26','L27','L28','L30'],
+    'urticaria': ['L50'],
+    'urolith': ['N20','N21','N22'],
+    'endomet': ['N80'],
+    'femgen': ['N81','N82','N83','N84','N85','N86','N87','N88','N89','N90'],
+    'hypomen': ['N91'],
+    'menorrh': ['N92'],
+    'dysmen': ['N94']
+}
+# Infectious conditions
+infectious_conditions = {
+    'typhoid': ['A01'],
+    'cholera': ['A00'],
+    'v_age': ['A08'],
+    'b_age': ['A00', 'A02', 'A03', 'A04', 'A05'],
+    'p_age': ['A06', 'A07'],
+    'tb': ['A15', 'A16', 'A17', 'A18', 'A19'],
+    'myco': ['A30', 'A31'],
+    'lepto': ['A27'],
+    'std': ['A51','A52','A53','A54','A55','A56','A57','A58','A59','A63','A64'],
+    'torch': ['B58','B06','B25','B00','A60'],
+    'v_skin': ['B01','B02','B03','B04','B05','B07','B08','B09'],
+    'hepatitis': ['B15','B16','B17','B18','B19'],
+    'hiv': ['B20','B21','B22','B23','B24'],
+    'sepsis': ['A40','A41'],
+    'infla_cns': ['G00','G01','G02','G03','G04','G08','G05','G06','G07','G09'],
+    'urti': ['J00','J01','J02','J03','J04','J05','J06','J09','J10','J11'],
+    'lrti': ['J12','J13','J14','J15','J16','J17','J18','J20','J21','J22'],
+    'uti': ['N30','N34','N39']
+}
+
+# Pregnancy conditions
+pregnancy_conditions = {
+    'abortive': ['O00', 'O01', 'O02', 'O03', 'O04', 'O05', 'O06', 'O07', 'O08'],
+    'preecl': ['O11', 'O14'], 'ecl': ['O15'], 'earlyhemo': ['O20'], 'heg': ['O21'],
+    'venpreg': ['O22'], 'utipreg': ['O23'], 'malpreg': ['O25'], 'multigest': ['O30'],
+    'malpresent': ['O32'], 'disprop': ['O33'], 'abnorpelv': ['O34'], 'fetalprob': ['O35', 'O36'],
+    'polyhydra': ['O40'], 'abnamnio': ['O41'], 'prom': ['O42'], 'placental': ['O43'],
+    'previa': ['O44'], 'abrupt': ['O45'], 'anh': ['O46'], 'prolong': ['O48'],
+    'preterm': ['O60'], 'fail': ['O61'], 'abnforce': ['O62'], 'long': ['O63'],
+    'obspelvic': ['O65', 'O66'], 'malpres': ['O64'], 'iph': ['O67'], 'distress': ['O68'],
+    'umbilical': ['O69'], 'laceration': ['O70'], 'obstrau': ['O71'], 'pph': ['O72'],
+    'retained': ['O73'], 'normal': ['O80'], 'instrum': ['O81'], 'caesar': ['O82'],
+    'assisted': ['O83'], 'multiple': ['O84']
+}
+
+# Regex conditions
+conditions_regex = {
+    'arthropathy': r'M(0[0-9]|1[0-9]|2[0-5])',
+    'sysconn': r'M3[0-6]',
+    'dorsopathy': r'M4[0-9]|M5[0-4]',
+    'muscle_dis': r'M6[0-3]',
+    'synov_dis': r'M6[5-8]',
+    'soft_dis': r'M8[0-9]|M9[0-4]',
+    'renal_dis': r'N0[0-9]|N1[0-6]',
+    'renal_fail': r'N1[7-9]',
+    'breast_dis': r'N6[0-4]',
+    'pid': r'N7[0-7]',
+    'poison': r'T3[6-9]|T4[0-9]|T50',
+    'toxic': r'T5[1-9]|T6[0-5]'
+}
+
+# group -> {condition: rule}
+CONDITION_REGISTRY = {
+    'chronic':    chronic_conditions,
+    'infectious': infectious_conditions,
+    'pregnancy':  pregnancy_conditions,
+    'regex':      conditions_regex,
+}
+
+
+# How a regex condition matches an ICD-3 code: 'anchored' = the whole code (re.fullmatch),
+# 'contains' = anywhere in the code (re.search, the str.contains behaviour of the old blocks)
+REGEX_MATCH = 'anchored'
+
+
+def rule_codes(rule, match=REGEX_MATCH):
+    # ICD-3 codes matched by a rule: the code list itself, or every code the pattern matches
+    if isinstance(rule, str):
+        if match not in ('anchored', 'contains'):
+            raise ValueError(f"REGEX_MATCH harus 'anchored' atau 'contains', bukan {match!r}.")
+        pat = re.compile(rule)
+        test = pat.fullmatch if match == 'anchored' else pat.search
+        return [code for code in ICD3_CODES if test(code) is not None]
+    return list(rule)
+
+
+def condition_map(match=REGEX_MATCH):
+    rows = [(group, cond, code)
+            for group, conditions in CONDITION_REGISTRY.items()
+            for cond, rule in conditions.items()
+            for code in rule_codes(rule, match)]
+    return pd.DataFrame(rows, columns=['group_name', 'condition', 'icd3'])
+
+
+def register_condition_map(con, name='condition_map'):
+    # Lookup table in DuckDB: one row per (group_name, condition, icd3)
+    con.register('condition_map_df', condition_map())
+    con.execute(f"CREATE OR REPLACE TEMP TABLE {name} AS SELECT * FROM condition_map_df ORDER BY icd3")
+    con.unregister('condition_map_df')
@@ -0,0 +1,156 @@
+"""
+Odds-ratio statistics shared by the OR scripts.
+
+Every OR in this repo is a 2x2 table (a, b, c, d): a/b = outcome with/without the
+exposure, c/d = no outcome with/without it. The OR is a*d / (b*c) when every cell is
+positive, otherwise the Haldane-corrected OR (0.5 added to each cell), with a Woolf
+(log-OR) confidence interval and Wald p-value taken from the same cells.
+
+`odds_ratios()` computes these for whole arrays of cells in one NumPy call;
+`register_or_macros()` defines the same formulas as DuckDB macros so SQL pipelines
+can select `odds_ratio(a, b, c, d)`, `or_ci_lower(a, b, c, d)`, ... directly.
+`contingency_tensor()` counts the cells of many outcomes x exposures (optionally per
+stratum) in one pass, and `mantel_haenszel()` pools stratified cells into MH ORs.
+"""
+
+import math
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+
+# z of the Wald/Woolf interval (1.96: two-sided 95%); see z_value() for other levels
+OR_Z = 1.96
+
+
+def z_value(confidence):
+    # Two-sided critical value, e.g. 0.95 -> 1.95996..., 0.99 -> 2.5758...
+    if not 0 < confidence < 1:
+        raise ValueError(f"confidence harus di antara 0 dan 1, bukan {confidence!r}.")
+    return NormalDist().inv_cdf(0.5 + confidence / 2)
+
+
+def normal_sf(x):
+    # Upper tail of the standard normal, vectorised over arrays
+    x = np.asarray(x, dtype=float)
+    return 0.5 * np.vectorize(math.erfc, otypes=[float])(x / math.sqrt(2)) if x.size else x
+
+
+def odds_ratios(a, b, c, d, z=OR_Z):
+    # OR, Woolf CI, p-value and significance for arrays of 2x2 cells (NaN cells -> NaN results)
+    a, b, c, d = (np.asarray(x, dtype=float) for x in (a, b, c, d))
+    corrected = ~((a > 0) & (b > 0) & (c > 0) & (d > 0))
+    shift = np.where(corrected, 0.5, 0.0)
+    a_, b_, c_, d_ = a + shift, b + shift, c + shift, d + shift
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_or = np.log(a_ * d_ / (b_ * c_))
+        se = np.sqrt(1.0 / a_ + 1.0 / b_ + 1.0 / c_ + 1.0 / d_)
+        p_value = 2 * normal_sf(np.abs(log_or) / se)
+    ci_lower = np.exp(log_or - z * se)
+    ci_upper = np.exp(log_or + z * se)
+    return pd.DataFrame({
+        'odds_ratio': np.exp(log_or),
+        'ci_lower': ci_lower,
+        'ci_upper': ci_upper,
+        'p_value': p_value,
+        'significant': (ci_lower > 1) | (ci_upper < 1),
+        'corrected': corrected & ~np.isnan(a + b + c + d),
+    })
+
+
+def register_or_macros(con, z=OR_Z):
+    # Same formulas as DuckDB macros (z defaults to `z`; pass it explicitly for another level)
+    con.create_function('normal_sf', lambda x: 0.5 * math.erfc(x / math.sqrt(2)),
+                        ['DOUBLE'], 'DOUBLE', side_effects=False)
+    con.execute(f"""
+    CREATE OR REPLACE TEMP MACRO or_positive(a, b, c, d) AS a > 0 AND b > 0 AND c > 0 AND d > 0;
+    CREATE OR REPLACE TEMP MACRO odds_ratio(a, b, c, d) AS
+      CASE WHEN or_positive(a, b, c, d)
+           THEN (a * d) / (b * c)::DOUBLE
+           ELSE ((a + 0.5) * (d + 0.5)) / ((b + 0.5) * (c + 0.5))::DOUBLE END;
+    CREATE OR REPLACE TEMP MACRO or_se(a, b, c, d) AS
+      CASE WHEN or_positive(a, b, c, d)
+           THEN SQRT(1.0/a + 1.0/b + 1.0/c + 1.0/d)
+           ELSE SQRT(1.0/(a+0.5) + 1.0/(b+0.5) + 1.0/(c+0.5) + 1.0/(d+0.5)) END;
+    CREATE OR REPLACE TEMP MACRO or_ci_lower(a, b, c, d, z := {z!r}) AS
+      EXP(LN(odds_ratio(a, b, c, d)) - z * or_se(a, b, c, d));
+    CREATE OR REPLACE TEMP MACRO or_ci_upper(a, b, c, d, z := {z!r}) AS
+      EXP(LN(odds_ratio(a, b, c, d)) + z * or_se(a, b, c, d));
+    CREATE OR REPLACE TEMP MACRO or_p_value(a, b, c, d) AS
+      2 * normal_sf(ABS(LN(odds_ratio(a, b, c, d))) / or_se(a, b, c, d));
+    CREATE OR REPLACE TEMP MACRO or_significance(ci_lower, ci_upper) AS
+      CASE WHEN ci_lower IS NOT NULL AND ci_upper IS NOT NULL AND (ci_lower > 1 OR ci_upper < 1)
+           THEN 'Significant' ELSE 'Not Significant' END;
+    """)
+
+
+def _cells(y, x):
+    # (4, n_outcomes, n_exposures) cells of one block of rows, as indicator matrix products:
+    # a = (y==1)' (x==1), b = (y==1)' (x==0), c = (y==0)' (x==1), d = (y==0)' (x==0).
+    # float64 products are exact integer counts up to 2**53 rows
+    y1, y0 = (y == 1).astype(np.float64), (y == 0).astype(np.float64)
+    x1, x0 = (x == 1).astype(np.float64), (x == 0).astype(np.float64)
+    return np.stack([np.rint(yk.T @ xk).astype(np.int64)
+                     for yk, xk in [(y1, x1), (y1, x0), (y0, x1), (y0, x0)]])
+
+
+def contingency_tensor(frames, outcomes, exposures, strata=None):
+    # 2x2 cells of every (stratum, outcome, exposure) in one pass over the frames, in long format.
+    # Missing or non-0/1 values count in no cell, as the SQL SUM(CASE ...) cells; rows with a
+    # missing stratum value are left out of the stratified table.
+    strata = list(strata or [])
+    blocks = {}
+    for df in frames:
+        if strata:
+            df = df[df[strata].notna().all(axis=1)]
+        y = df[outcomes].to_numpy(dtype=np.float64, na_value=np.nan)
+        x = df[exposures].to_numpy(dtype=np.float64, na_value=np.nan)
+        groups = df.groupby(strata, sort=False).indices.items() if strata else [((), slice(None))]
+        for key, rows in groups:
+            key = key if isinstance(key, tuple) else (key,)
+            cells = _cells(y[rows], x[rows])
+            blocks[key] = blocks[key] + cells if key in blocks else cells
+
+    out = []
+    index = pd.MultiIndex.from_product([outcomes, exposures], names=['outcome', 'exposure'])
+    for key in sorted(blocks) if blocks else [()]:
+        cells = blocks.get(key, np.zeros((4, len(outcomes), len(exposures)), dtype=np.int64))
+        block = pd.DataFrame({'a': cells[0].ravel(), 'b': cells[1].ravel(),
+                              'c': cells[2].ravel(), 'd': cells[3].ravel()}, index=index).reset_index()
+        out.append(block.assign(**dict(zip(strata, key)))[strata + list(block.columns)])
+    return pd.concat(out, ignore_index=True)
+
+
+def mantel_haenszel(cells, by=('outcome', 'exposure'), z=OR_Z):
+    # Mantel-Haenszel OR pooled over the strata rows of `cells` (one row per stratum and `by` key),
+    # with the Robins-Breslow-Greenland variance of log(OR_MH); empty strata are skipped and the
+    # OR is NaN when the pooled numerator or denominator is 0 (no Haldane correction across strata)
+    a, b, c, d = (cells[k].to_numpy(dtype=float) for k in 'abcd')
+    n = a + b + c + d
+    with np.errstate(divide='ignore', invalid='ignore'):
+        r, s = a * d / n, b * c / n
+        p, q = (a + d) / n, (b + c) / n
+        terms = pd.DataFrame({'r': r, 's': s, 'pr': p * r, 'ps_qr': p * s + q * r, 'qs': q * s,
+                              'a': a, 'b': b, 'c': c, 'd': d, 'n_strata': 1.0})
+    keys = [cells[k].to_numpy() for k in by]
+    terms = terms[n > 0].groupby([k[n > 0] for k in keys], sort=False).sum()
+    terms.index.names = list(by)
+
+    r, s = terms['r'].to_numpy(), terms['s'].to_numpy()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_or = np.log(r / s)
+        se = np.sqrt(terms['pr'] / (2 * r ** 2) + terms['ps_qr'] / (2 * r * s) + terms['qs'] / (2 * s ** 2)).to_numpy()
+        log_or[~np.isfinite(log_or)] = np.nan
+        p_value = 2 * normal_sf(np.abs(log_or) / se)
+    ci_lower = np.exp(log_or - z * se)
+    ci_upper = np.exp(log_or + z * se)
+    return pd.DataFrame({
+        'odds_ratio': np.exp(log_or),
+        'ci_lower': ci_lower,
+        'ci_upper': ci_upper,
+        'p_value': p_value,
+        'significant': (ci_lower > 1) | (ci_upper < 1),
+        'n_strata': terms['n_strata'].astype(int).to_numpy(),
+        'a': terms['a'].astype(np.int64).to_numpy(), 'b': terms['b'].astype(np.int64).to_numpy(),
+        'c': terms['c'].astype(np.int64).to_numpy(), 'd': terms['d'].astype(np.int64).to_numpy(),
+    }, index=terms.index).reset_index()
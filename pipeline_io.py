@@ -0,0 +1,119 @@
+"""
+Intermediate store shared by the generation, QC, filtering and OR scripts.
+
+Every stage reads and writes Parquet: ICD columns are dictionary-encoded and
+dates keep their real types, so no stage has to re-infer types or re-parse
+dates. CSV is only written as an opt-in export next to the Parquet file.
+"""
+
+import os
+import re
+import string
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+VISIT_PATH = "pregnancy by visit.parquet"
+EPISODES_PATH = "pregnancy episodes.parquet"
+FINAL_SET_PATH = "final_set.parquet"
+FREE_CONFLICTS_PATH = "final_set_free_conflicts.parquet"
+
+ICD_COLS = ['FKP14A', 'FKL15A', 'FKL17A', 'FKL24A']
+
+# Canonical ICD-3 code table (A00..Z99): diagnoses are stored as an index into this list,
+# as the DuckDB ENUM `icd3` and as a pandas categorical with these categories (int16 codes)
+ICD3_CODES = [f"{letter}{n:02d}" for letter in string.ascii_uppercase for n in range(100)]
+ICD3 = pd.CategoricalDtype(ICD3_CODES)
+
+
+def icd3_sql(col):
+    # DuckDB expression: free-text diagnosis -> icd3 ENUM (first 3 chars, upper case; NULL if not A00..Z99)
+    code = f"LEFT(UPPER(TRIM({col})), 3)"
+    return f"CAST(CASE WHEN regexp_full_match({code}, '[A-Z][0-9]{{2}}') THEN {code} END AS icd3)"
+
+
+def icd3(values):
+    # pandas counterpart of icd3_sql, normalising each distinct value once
+    if isinstance(values.dtype, pd.CategoricalDtype) and values.dtype == ICD3:
+        return values
+    ids, uniques = pd.factorize(np.asarray(values, dtype=object))
+    norm = pd.Index(uniques, dtype=object).astype(str).str.strip().str.upper().str[:3]
+    lut = np.append(pd.Index(ICD3_CODES).get_indexer(norm), -1)   # ids == -1 (missing) -> -1
+    return pd.Series(pd.Categorical.from_codes(lut[ids].astype(np.int16), dtype=ICD3),
+                     index=values.index, name=values.name)
+
+
+def sek_dx_columns(width):
+    # Secondary-diagnosis slots of a visit table: FKL24A, FKL24B, ... (at most 26)
+    return [f"FKL24{chr(ord('A') + i)}" for i in range(width)]
+
+
+def dx_columns(columns):
+    # Diagnosis columns present in a table: ICD_COLS plus any extra FKL24B.. slots
+    return [c for c in columns if c in ICD_COLS or re.fullmatch(r"FKL24[B-Z]", c)]
+
+
+def csv_path(path):
+    return os.path.splitext(path)[0] + ".csv"
+
+
+def scan_sql(path):
+    # DuckDB table expression for a stage file; CSV is still accepted for legacy inputs
+    if path.lower().endswith(".csv"):
+        return f"read_csv_auto('{path}', HEADER=TRUE)"
+    return f"read_parquet('{path}')"
+
+
+def with_icd3(df):
+    # Diagnosis columns as ICD-3 categoricals
+    for c in dx_columns(df.columns):
+        df[c] = icd3(df[c])
+    return df
+
+
+def read_frame(path, columns=None):
+    if path.lower().endswith(".csv"):
+        return with_icd3(pd.read_csv(path, usecols=columns))
+    return with_icd3(pd.read_parquet(path, columns=columns))
+
+
+def iter_frames(path, chunksize=None, columns=None):
+    # A stage file as frames of at most `chunksize` rows (None: the whole file as one frame)
+    if chunksize is None:
+        yield read_frame(path, columns)
+    elif path.lower().endswith(".csv"):
+        for chunk in pd.read_csv(path, usecols=columns, chunksize=chunksize):
+            yield with_icd3(chunk)
+    else:
+        pf = pq.ParquetFile(path)
+        # Integer columns with nulls anywhere in the file are float in every chunk, as in read_frame
+        meta = pf.metadata
+        nullable = set()
+        for i in range(meta.num_row_groups):
+            for j in range(meta.num_columns):
+                col = meta.row_group(i).column(j)
+                if col.statistics is None or col.statistics.null_count > 0:
+                    nullable.add(col.path_in_schema)
+        for batch in pf.iter_batches(batch_size=chunksize, columns=columns):
+            df = batch.to_pandas()
+            for c in df.columns:
+                if c in nullable and df[c].dtype.kind in "iu":
+                    df[c] = df[c].astype("float64")
+            yield with_icd3(df)
+
+
+def write_frame(df, path, export_csv=False):
+    # ICD code columns as ICD-3 categoricals -> dictionary-encoded Parquet columns
+    icd = {c: icd3(df[c]) for c in dx_columns(df.columns)}
+    out = df.assign(**icd) if icd else df
+    out.to_parquet(path, index=False)
+    if export_csv:
+        out.to_csv(csv_path(path), index=False)
+
+
+def write_table(con, table, path, export_csv=False):
+    # Write a DuckDB table straight to the store, without a pandas round trip
+    con.sql(f"COPY {table} TO '{path}' (FORMAT PARQUET)")
+    if export_csv:
+        con.sql(f"COPY {table} TO '{csv_path(path)}' (HEADER, DELIMITER ',')")